@@ -0,0 +1,87 @@
+"""AIService 配置快照基准测试
+
+对比旧的"每次调用都查询3次配置并新建OpenAI客户端"与新的快照缓存路径的单次开销。
+
+运行: python benchmarks/bench_ai_config.py [--iterations 2000]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('TIME_SYNC_INTERVAL', '0')
+
+import openai
+from flask import Flask
+from src.models.user import db
+from src.models.diary import Config
+from src.services.ai_service import AIService
+
+
+def create_app():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tempfile.mktemp(suffix='.db')}"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        for key, value in [
+            ('ai_api_url', 'https://api.openai.com/v1'),
+            ('ai_api_key', 'sk-bench'),
+            ('ai_model', 'gpt-3.5-turbo'),
+            ('ai_prompt_template', '请分析这个用户的日记内容'),
+            ('ai_summary_prompt', '请生成每日总结'),
+        ]:
+            db.session.add(Config(key=key, value=value))
+        db.session.commit()
+    return app
+
+
+def legacy_load_config():
+    """旧实现：每次调用查询配置并创建新的客户端"""
+    api_url = Config.query.filter_by(key='ai_api_url').first()
+    api_key = Config.query.filter_by(key='ai_api_key').first()
+    model = Config.query.filter_by(key='ai_model').first()
+    Config.query.filter_by(key='ai_prompt_template').first()
+    return openai.OpenAI(api_key=api_key.value, base_url=api_url.value), model.value
+
+
+def timeit(func, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args()
+
+    app = create_app()
+    service = AIService()
+    with app.app_context():
+        legacy = timeit(legacy_load_config, args.iterations)
+
+        def cached():
+            service._load_config()
+            service.get_config_value('ai_prompt_template')
+
+        service._load_config()
+        snapshot = timeit(cached, args.iterations)
+
+        def invalidated():
+            service.invalidate_config()
+            service._load_config()
+
+        reload_cost = timeit(invalidated, args.iterations)
+
+    print(f"旧路径（查询+新建客户端）: {legacy * 1e6:10.1f} us/次")
+    print(f"配置失效后重新加载:        {reload_cost * 1e6:10.1f} us/次")
+    print(f"快照命中:                  {snapshot * 1e6:10.1f} us/次")
+    print(f"每次调用节省:              {(legacy - snapshot) * 1e6:10.1f} us ({legacy / snapshot:.0f}x)")
+
+
+if __name__ == '__main__':
+    main()
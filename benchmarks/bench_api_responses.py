@@ -0,0 +1,116 @@
+"""接口响应序列化与压缩基准测试
+
+写入带长篇中文 AI 分析的日记条目、每日总结、用户记忆和 MCP 执行日志，请求时间线、总结、记忆、日志接口，
+对每个接口的返回数据比较：Flask 默认 jsonify（标准库、中文转义为 \\uXXXX）、FastJSONProvider 回退到标准库、
+FastJSONProvider 使用 orjson 三种方式的响应字节数和序列化耗时，以及 gzip / brotli 压缩后的字节数和压缩耗时。
+
+运行: python benchmarks/bench_api_responses.py [--entries 2000 --repeat 50]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+from datetime import datetime, date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('TIME_SYNC_INTERVAL', '0')
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+from src.models.user import db
+from src.models.diary import Auth, DiaryEntry, DailySummary
+from src.models.mcp import UserMemory, MCPExecutionLog
+from src.models.engine import sqlite_engine_options, register_sqlite_pragmas
+from src.routes.diary import diary_bp
+from src.routes.mcp import mcp_bp
+from src.services import json_provider
+from src.services.json_provider import FastJSONProvider
+from src.services.response_compression import ResponseCompressor
+
+ENDPOINTS = [
+    ('时间线 50 条', '/api/diary/entries?view=history&per_page=50'),
+    ('每日总结 30 条', '/api/diary/summaries?per_page=30'),
+    ('用户记忆 100 条', '/api/mcp/memories?per_page=100'),
+    ('执行日志 50 条', '/api/mcp/logs?per_page=50'),
+]
+PHRASES = ['今天早上', '和朋友一起', '去了公园', '天气很好', '心情有些低落', '工作压力很大', '读完了一本书',
+           '晚饭吃了火锅', '跑步五公里', '记录下来', '感觉很充实', '有点疲惫', '学到了新东西', '想起了以前的事',
+           '计划明天早起', '照片里的猫咪', '咖啡很好喝', '认真反思', '情绪逐渐平稳', '值得继续坚持']
+
+
+def text(rng, length):
+    return '，'.join(rng.choice(PHRASES) for _ in range(length)) + '。'
+
+
+def create_app(rng, entries):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tempfile.mktemp(suffix='.db')}"
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = sqlite_engine_options()
+    app.config['SECRET_KEY'] = 'bench'
+    db.init_app(app)
+    register_sqlite_pragmas(app)
+    app.register_blueprint(diary_bp, url_prefix='/api/diary')
+    app.register_blueprint(mcp_bp, url_prefix='/api/mcp')
+    start = datetime(2026, 1, 1, 8)
+    with app.app_context():
+        db.create_all()
+        db.session.add(Auth(password_hash='x'))
+        db.session.commit()
+        db.session.execute(DiaryEntry.__table__.insert(), [
+            {'timestamp': start + timedelta(hours=i), 'text_content': text(rng, 8), 'ai_analysis': text(rng, 60),
+             'is_daily_summary': False, 'analysis_status': 'done'} for i in range(entries)])
+        db.session.execute(DailySummary.__table__.insert(), [
+            {'date': date(2026, 1, 1) + timedelta(days=i), 'summary_content': text(rng, 150), 'entry_count': 10}
+            for i in range(entries // 20)])
+        db.session.execute(UserMemory.__table__.insert(), [
+            {'user_id': 1, 'memory_type': 'preference', 'key': f'偏好{i}', 'value': text(rng, 6),
+             'confidence': 0.9, 'tags': ['生活', '习惯']} for i in range(entries // 4)])
+        db.session.execute(MCPExecutionLog.__table__.insert(), [
+            {'server_name': 'memory', 'tool_name': 'query_user_profile', 'user_id': 1,
+             'input_data': {'query': text(rng, 3)}, 'output_data': {'memories': [text(rng, 6) for _ in range(5)]},
+             'execution_time': 0.01, 'status': 'success', 'created_at': start} for _ in range(entries // 4)])
+        db.session.commit()
+    return app
+
+
+def timed(func, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return result, (time.perf_counter() - started) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--entries', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    app = create_app(random.Random(11), args.entries)
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['authenticated'] = True
+        session['user_id'] = 1
+
+    has_orjson = json_provider._HAS_ORJSON
+    providers = [('jsonify 默认', DefaultJSONProvider(app), False), ('标准库 UTF-8', FastJSONProvider(app), False),
+                 ('orjson', FastJSONProvider(app), has_orjson)]
+    compressor = ResponseCompressor()
+    for label, url in ENDPOINTS:
+        payload = client.get(url).get_json()
+        print(f"\n{label}  {url}")
+        body = None
+        with app.app_context():
+            for name, provider, use_orjson in providers:
+                json_provider._HAS_ORJSON = use_orjson
+                response, elapsed = timed(lambda: provider.response(payload), args.repeat)
+                body = response.get_data()
+                print(f"  {name:<14}{len(body) / 1024:>9.1f}KB {elapsed:>8.2f}ms")
+        for encoding in ('gzip', 'br'):
+            compressed, elapsed = timed(lambda: compressor._encode(body, encoding), args.repeat)
+            print(f"  + {encoding:<12}{len(compressed) / 1024:>9.1f}KB {elapsed:>8.2f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""每日汇总提示词规模基准测试
+
+用本地桩函数代替模型调用（返回截断后的摘要），为一天写入不同数量的日记条目（每条约 100 字文字、400 字分析），
+比较一次性把全部条目放进提示词（full）与滚动摘要（incremental）两种方式：零点生成汇总时的提示词 token 数和调用次数、
+白天每次合并摘要的提示词 token 数，以及全天累计的提示词 token 数。token 数按 estimate_tokens 估算。
+
+运行: python benchmarks/bench_daily_digest.py [--entries 10,40,100 --max-prompt-tokens 6000]
+"""
+import os
+import sys
+import random
+import argparse
+import tempfile
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('TIME_SYNC_INTERVAL', '0')
+from flask import Flask
+from src.models.user import db
+from src.models.diary import DiaryEntry, ANALYSIS_DONE
+from src.services.ai_service import ai_service, estimate_tokens
+from src.services.daily_digest import DailyDigestService
+
+PHRASES = ['今天早上', '和朋友一起', '去了公园', '天气很好', '心情有些低落', '工作压力很大', '读完了一本书',
+           '晚饭吃了火锅', '跑步五公里', '感觉很充实', '有点疲惫', '学到了新东西', '想起了以前的事', '计划明天早起']
+
+
+class FakeModel:
+    """记录每次调用的提示词 token 数，摘要请求返回不超过 max_chars 字的文本"""
+
+    def __init__(self, max_chars):
+        self.max_chars = max_chars
+        self.calls = []
+
+    def __call__(self, messages, max_tokens, temperature, on_token=None):
+        self.calls.append(sum(estimate_tokens(message['content']) for message in messages))
+        content = messages[-1]['content']
+        if content.startswith('已有摘要'):
+            return content[-self.max_chars:]
+        return '今日总结'
+
+
+def text(rng, length):
+    return '，'.join(rng.choice(PHRASES) for _ in range(length)) + '。'
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--entries', default='10,40,100')
+    parser.add_argument('--max-prompt-tokens', type=int, default=6000)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tempfile.mktemp(suffix='.db')}"
+    db.init_app(app)
+    rng = random.Random(3)
+    ai_service._load_config = lambda: None
+    ai_service.client = object()
+
+    print(f"{'条目数':>6}{'full 零点提示词':>16}{'增量 零点提示词':>16}{'零点调用':>10}{'单次合并最大':>14}{'增量全天累计':>14}")
+    with app.app_context():
+        db.create_all()
+        for offset, count in enumerate(int(size) for size in args.entries.split(',')):
+            day = date(2026, 1, 1) + timedelta(days=offset)
+            service = DailyDigestService()
+            service.max_prompt_tokens = args.max_prompt_tokens
+            model = FakeModel(service.max_chars)
+            ai_service._call_ai_api = model
+
+            entries = []
+            for i in range(count):
+                entry = DiaryEntry(text_content=text(rng, 20), ai_analysis=text(rng, 70), analysis_status=ANALYSIS_DONE,
+                                   timestamp=datetime.combine(day, datetime.min.time()) + timedelta(minutes=10 * i))
+                db.session.add(entry)
+                db.session.commit()
+                entries.append(entry)
+                service.on_entry_analyzed(entry)
+            folds = list(model.calls)
+
+            model.calls.clear()
+            ai_service.generate_daily_summary(entries)
+            full = model.calls[0]
+
+            model.calls.clear()
+            service.summarize(day, entries)
+            midnight = model.calls
+            print(f"{count:>6}{full:>16}{sum(midnight):>16}{len(midnight):>10}{max(folds):>14}"
+                  f"{sum(folds) + sum(midnight):>14}")
+
+
+if __name__ == '__main__':
+    main()
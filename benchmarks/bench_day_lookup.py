@@ -0,0 +1,96 @@
+"""按日期查询日记条目的基准测试
+
+对比 func.date(timestamp) == 日期（无法使用索引，全表扫描）与 DiaryEntry.on_date
+范围条件（走 (is_daily_summary, timestamp) 索引）在不同数据量下的耗时。
+
+运行: python benchmarks/bench_day_lookup.py [--sizes 10000,100000,1000000]
+"""
+import os
+import sys
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+from datetime import datetime, date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('TIME_SYNC_INTERVAL', '0')
+
+from flask import Flask
+from src.models.user import db
+from src.models.diary import DiaryEntry
+
+ENTRIES_PER_DAY = 20
+
+
+def populate(path, size):
+    """以每天约20条的密度写入 size 条记录，返回最后一天的日期"""
+    conn = sqlite3.connect(path)
+    start = datetime(2000, 1, 1)
+    rows = []
+    for i in range(size):
+        ts = start + timedelta(minutes=i * (24 * 60 // ENTRIES_PER_DAY) + random.randint(0, 30))
+        rows.append((ts.strftime('%Y-%m-%d %H:%M:%S.%f'), f'日记内容 {i}', f'分析 {i}', 0, 'done'))
+    conn.executemany(
+        'INSERT INTO diary_entries (timestamp, text_content, ai_analysis, is_daily_summary, analysis_status) '
+        'VALUES (?, ?, ?, ?, ?)', rows
+    )
+    conn.commit()
+    conn.execute('ANALYZE')
+    conn.close()
+    return (start + timedelta(days=size // ENTRIES_PER_DAY - 1)).date()
+
+
+def measure(query_factory, repeat):
+    best = float('inf')
+    result = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = len(query_factory().all())
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='10000,100000,1000000')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'行数':>10} {'func.date (ms)':>16} {'范围+索引 (ms)':>16} {'命中行数':>8}")
+    for size in [int(x) for x in args.sizes.split(',')]:
+        path = tempfile.mktemp(suffix='.db')
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+        db.init_app(app)
+        with app.app_context():
+            db.create_all()
+            last_day = populate(path, size)
+            target = last_day - timedelta(days=(size // ENTRIES_PER_DAY) // 2)
+
+            legacy, legacy_rows = measure(lambda: DiaryEntry.query.filter(
+                db.func.date(DiaryEntry.timestamp) == target,
+                DiaryEntry.is_daily_summary != True
+            ), args.repeat)
+            ranged, ranged_rows = measure(lambda: DiaryEntry.query.filter(
+                DiaryEntry.on_date(target),
+                DiaryEntry.is_daily_summary == False
+            ), args.repeat)
+            assert legacy_rows == ranged_rows
+
+            if size == int(args.sizes.split(',')[-1]):
+                plan = db.session.execute(db.text(
+                    'EXPLAIN QUERY PLAN SELECT id FROM diary_entries '
+                    'WHERE is_daily_summary = 0 AND timestamp >= :s AND timestamp < :e'
+                ), {'s': str(datetime.combine(target, datetime.min.time())),
+                    'e': str(datetime.combine(target + timedelta(days=1), datetime.min.time()))}).fetchall()
+            db.session.remove()
+        os.remove(path)
+        print(f"{size:>10} {legacy * 1000:>16.2f} {ranged * 1000:>16.2f} {ranged_rows:>8}")
+
+    print("查询计划:", "; ".join(row[-1] for row in plan))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""分析前上下文收集的并发调度基准测试
+
+启动若干个 benchmarks/fake_mcp_server.py（get_context 工具带延迟），对比逐个串行调用
+与 MCPClientManager.gather_context 并发调用的耗时，并演示有服务器超时时只返回已完成的结果。
+
+运行: python benchmarks/bench_mcp_fanout.py [--servers 5 --delay 0.3]
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.mcp.client import MCPClientManager
+
+FAKE_SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fake_mcp_server.py')
+DIARY = '今天早起去公园跑步，中午和同事吃了火锅。'
+
+
+async def main(args):
+    manager = MCPClientManager()
+    manager.health_interval = 0
+    manager.server_timeout = args.server_timeout
+    manager.context_deadline = args.deadline
+    for i in range(args.servers):
+        await manager.start_server({'name': f'fake-{i}', 'command': sys.executable,
+                                    'args': [FAKE_SERVER, '--context-delay', str(args.delay)]})
+
+    started = time.perf_counter()
+    for name in manager.pools:
+        await manager.call_tool(name, 'get_context', {'text': DIARY})
+    serial = time.perf_counter() - started
+    print(f"{args.servers} 个服务器串行调用: {serial:.2f}s")
+
+    started = time.perf_counter()
+    context = await manager.gather_context(1, DIARY)
+    fanout = time.perf_counter() - started
+    print(f"{args.servers} 个服务器并发调用: {fanout:.2f}s，返回 {len(context['external'])} 条上下文")
+
+    await manager.start_server({'name': 'slow', 'command': sys.executable,
+                                'args': [FAKE_SERVER, '--context-delay', '30']})
+    started = time.perf_counter()
+    context = await manager.gather_context(1, DIARY)
+    partial = time.perf_counter() - started
+    statuses = {call['server']: call['status'] for call in context['calls']}
+    print(f"加入一个慢服务器后: {partial:.2f}s（单服务器超时 {args.server_timeout}s），"
+          f"返回 {len(context['external'])} 条上下文，slow 状态: {statuses['slow']}")
+    await manager.stop_all()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--servers', type=int, default=5)
+    parser.add_argument('--delay', type=float, default=0.3)
+    parser.add_argument('--server-timeout', type=float, default=1.0)
+    parser.add_argument('--deadline', type=float, default=2.0)
+    asyncio.run(main(parser.parse_args()))
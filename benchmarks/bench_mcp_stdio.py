@@ -0,0 +1,65 @@
+"""MCP stdio 客户端基准测试
+
+使用 benchmarks/fake_mcp_server.py 作为服务器，对比：
+- 每次调用都启动新进程并握手
+- 常驻进程顺序调用
+- 常驻进程上并发调用（请求 ID 复用同一管道）
+
+运行: python benchmarks/bench_mcp_stdio.py [--calls 50]
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.mcp.stdio_client import StdioMCPClient, MCPServerPool
+
+FAKE_SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fake_mcp_server.py')
+
+
+async def spawn_per_call(calls):
+    for i in range(calls):
+        client = StdioMCPClient('fake', sys.executable, [FAKE_SERVER])
+        await client.start()
+        await client.call_tool('echo', {'text': str(i)})
+        await client.close()
+
+
+async def persistent_sequential(pool, calls):
+    for i in range(calls):
+        await pool.call_tool('echo', {'text': str(i)})
+
+
+async def persistent_concurrent(pool, calls, seconds):
+    await asyncio.gather(*(pool.call_tool('sleep', {'seconds': seconds}) for _ in range(calls)))
+
+
+async def main(args):
+    started = time.perf_counter()
+    await spawn_per_call(args.calls)
+    spawn = time.perf_counter() - started
+    print(f"每次启动进程:   {args.calls} 次 echo 共 {spawn:6.2f}s，平均 {spawn / args.calls * 1000:7.2f}ms")
+
+    pool = MCPServerPool('fake', sys.executable, [FAKE_SERVER])
+    await pool.start()
+    started = time.perf_counter()
+    await persistent_sequential(pool, args.calls)
+    sequential = time.perf_counter() - started
+    print(f"常驻进程顺序:   {args.calls} 次 echo 共 {sequential:6.2f}s，平均 {sequential / args.calls * 1000:7.2f}ms")
+
+    started = time.perf_counter()
+    await persistent_concurrent(pool, args.calls, args.sleep)
+    concurrent = time.perf_counter() - started
+    print(f"常驻进程并发:   {args.calls} 次 {args.sleep}s 的 sleep 共 {concurrent:6.2f}s"
+          f"（串行需 {args.calls * args.sleep:.1f}s）")
+    await pool.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--calls', type=int, default=50)
+    parser.add_argument('--sleep', type=float, default=0.2)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,111 @@
+"""记忆合并基准测试
+
+为一个用户生成若干主题的记忆，每个主题附带 0~3 条近似重复（换一种说法的关键词、
+正则兜底生成的模板记忆），统计合并耗时、合并前后的记忆条数、检索延迟，
+以及 top-5 上下文中不同主题的数量。
+
+运行: python benchmarks/bench_memory_consolidation.py [--topics 3000 --queries 300]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('TIME_SYNC_INTERVAL', '0')
+from flask import Flask
+from src.models.user import db
+from src.models.diary import Auth
+from src.models.mcp import UserMemory
+from src.models.engine import sqlite_engine_options, register_sqlite_pragmas
+from src.mcp.memory_search import memory_search
+from src.mcp.memory_consolidation import memory_consolidator
+
+CHARS = '山水花鸟鱼虫茶酒书画琴棋诗歌舞剑猫狗马牛羊鸡鸭鹅米面饭菜汤糖盐油咖啡奶果桃梨橙瓜豆'
+PREFIXES = ('喝', '吃', '玩', '看', '听')
+TYPES = ('preference', 'habit', 'fact')
+
+
+def create_app():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tempfile.mktemp(suffix='.db')}"
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = sqlite_engine_options()
+    db.init_app(app)
+    register_sqlite_pragmas(app)
+    with app.app_context():
+        db.create_all()
+        db.session.add(Auth(password_hash='x'))
+        db.session.commit()
+        memory_search.ensure_index(db.engine)
+    return app
+
+
+def generate(topics, seed=11):
+    rng = random.Random(seed)
+    names = set()
+    while len(names) < topics:
+        names.add(''.join(rng.sample(CHARS, 3)))
+    rows = {}
+    for topic in sorted(names):
+        memory_type = rng.choice(TYPES)
+        rows[topic] = {'key': topic, 'value': f'喜欢{topic}，经常提到{topic}', 'type': memory_type,
+                       'confidence': 0.6, 'topic': topic}
+        for _ in range(rng.randint(0, 3)):
+            variant = rng.random()
+            if variant < 0.4:
+                row = {'key': rng.choice(PREFIXES) + topic, 'value': f'喜欢{topic}', 'confidence': 0.5}
+            elif variant < 0.7:
+                row = {'key': f'{topic} ', 'value': f'经常提到{topic}', 'confidence': 0.4, 'tags': ['重复']}
+            else:
+                row = {'key': topic + rng.choice(PREFIXES), 'value': f'用户提到了关于 {topic} 的偏好',
+                       'confidence': 0.5}
+            rows.setdefault(row['key'], dict(row, type=memory_type, topic=topic))
+    return sorted(names), list(rows.values())
+
+
+def measure(names, topics, queries, rng):
+    started = time.perf_counter()
+    distinct = 0
+    for _ in range(queries):
+        topic = rng.choice(names)
+        results = memory_search.search_keywords(1, [topic[:2], topic[1:]], limit=5)
+        distinct += len({topics[memory.key] for memory, _ in results})
+    elapsed = time.perf_counter() - started
+    return elapsed / queries * 1000, distinct / queries
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--topics', type=int, default=3000)
+    parser.add_argument('--queries', type=int, default=300)
+    args = parser.parse_args()
+
+    names, rows = generate(args.topics)
+    topics = {row['key']: row['topic'] for row in rows}
+    app = create_app()
+    with app.app_context():
+        # 直接写入，模拟多次分析累积的重复记忆（键值带空格的记录绕过唯一约束）
+        db.session.add_all([UserMemory(user_id=1, key=row['key'], value=row['value'], memory_type=row['type'],
+                                       confidence=row['confidence'], tags=row.get('tags', []))
+                            for row in rows])
+        db.session.commit()
+
+        before = UserMemory.query.count()
+        latency, distinct = measure(names, topics, args.queries, random.Random(3))
+        print(f"合并前: {before} 条记忆，检索 {latency:6.2f}ms/次，top-5 平均 {distinct:.2f} 个不同主题")
+
+        result = memory_consolidator.consolidate_user(1)
+        after = UserMemory.query.count()
+        # 每个主题至少保留一条，否则说明把不同主题误合并了
+        kept = len({topics[memory.key] for memory in UserMemory.query.all()})
+        print(f"合并: {result['clusters']} 个重复簇，删除 {result['removed']} 条，耗时 {result['duration_ms']:.0f}ms，"
+              f"保留主题 {kept}/{len(names)}")
+
+        latency, distinct = measure(names, topics, args.queries, random.Random(3))
+        print(f"合并后: {after} 条记忆，检索 {latency:6.2f}ms/次，top-5 平均 {distinct:.2f} 个不同主题")
+
+
+if __name__ == '__main__':
+    main()
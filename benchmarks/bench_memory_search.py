@@ -0,0 +1,118 @@
+"""用户记忆检索基准测试
+
+在 10 万条记忆上对比原有的 LIKE '%...%' 子串匹配与 FTS5 全文检索：
+短关键词搜索（记忆管理页的 search 参数）、整篇日记召回以及先提取关键词再批量召回（query_user_profile），
+召回场景额外统计前 5 条中与日记主题相关的比例。
+
+运行: python benchmarks/bench_memory_search.py [--memories 100000]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('TIME_SYNC_INTERVAL', '0')
+
+from flask import Flask
+from src.models.user import db
+from src.models.diary import Auth
+from src.models.mcp import UserMemory
+from src.mcp.memory_search import memory_search
+from src.mcp.keywords import extract_keywords
+
+WORDS = ('咖啡 跑步 早起 加班 猫 电影 旅行 读书 健身 游泳 火锅 地铁 项目 会议 周末 编程 音乐 吉他 '
+         '爬山 摄影 奶茶 面包 妈妈 朋友 同事 老板 考试 论文 失眠 感冒 医院 超市 公园 雨天 晴天').split()
+TYPES = ('preference', 'habit', 'fact', 'emotion')
+DIARY_TOPICS = ('早起', '公园', '跑步', '同事', '火锅', '项目', '电影', '咖啡')
+DIARY = '今天早起去公园跑步，中午和同事吃了火锅，下午开会讨论项目进度，晚上在家看电影喝了一杯咖啡，感觉有点累。'
+
+
+def vocabulary(rng, size=3000):
+    """常用主题词加上随机生成的二字词，使每个词只出现在少量记忆中"""
+    common = [chr(c) for c in range(0x4e00, 0x4e00 + 2500)]
+    return list(WORDS) + [rng.choice(common) + rng.choice(common) for _ in range(size)]
+
+
+FILLERS = ('今天', '感觉', '有点', '晚上', '下午', '中午', '然后', '觉得')
+
+
+def sentence(rng, vocab, n):
+    # 记忆文本中常带有时间、语气等高频词，整篇日记召回时会被这些词干扰
+    return '，'.join(rng.choice(FILLERS) + rng.choice(vocab) + rng.choice(('很好', '一般', '不错', '讨厌', '喜欢'))
+                    for _ in range(n))
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples), result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--memories', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tempfile.mktemp(suffix='.db')}"
+    db.init_app(app)
+    rng = random.Random(42)
+    vocab = vocabulary(rng)
+
+    with app.app_context():
+        db.create_all()
+        db.session.add(Auth(password_hash='x'))
+        db.session.commit()
+        db.session.execute(UserMemory.__table__.insert(), [{
+            'user_id': 1, 'memory_type': rng.choice(TYPES), 'key': rng.choice(vocab) + str(i),
+            'value': sentence(rng, vocab, rng.randint(2, 6)), 'confidence': round(rng.uniform(0.3, 1.0), 2),
+            'source': 'benchmark', 'tags': []
+        } for i in range(args.memories)])
+        db.session.commit()
+
+        started = time.perf_counter()
+        memory_search.ensure_index(db.engine)
+        print(f"记忆数: {args.memories}，建立全文索引耗时 {time.perf_counter() - started:.2f}s")
+
+        def like(query):
+            return UserMemory.query.filter(
+                UserMemory.user_id == 1,
+                db.or_(UserMemory.key.contains(query), UserMemory.value.contains(query))
+            ).order_by(UserMemory.confidence.desc()).limit(10).all()
+
+        cases = (
+            ('关键词 "咖啡"', '咖啡', True),
+            ('短语 "火锅很好"', '火锅很好', True),
+            ('整篇日记召回', DIARY, False),
+        )
+        for label, query, match_all in cases:
+            like_ms, like_hits = timed(lambda: like(query), args.repeat)
+            fts_ms, fts_hits = timed(lambda: memory_search.search(1, query, limit=10, match_all=match_all),
+                                     args.repeat)
+            print(f"{label:<16} LIKE: {like_ms:8.2f}ms 命中 {len(like_hits):2d}   "
+                  f"FTS5: {fts_ms:8.2f}ms 命中 {len(fts_hits):2d}")
+
+        def precision(hits):
+            top = hits[:5]
+            relevant = sum(1 for memory, _ in top if any(t in memory.key or t in memory.value for t in DIARY_TOPICS))
+            return relevant / len(top) if top else 0.0
+
+        _, text_hits = timed(lambda: memory_search.search(1, DIARY, limit=10), 1)
+        keyword_ms, keyword_hits = timed(
+            lambda: memory_search.search_keywords(1, extract_keywords(DIARY), limit=10), args.repeat
+        )
+        print(f"关键词提取: {extract_keywords(DIARY)}")
+        print(f"召回前5相关比例  整篇日记: {precision(text_hits):.0%}   "
+              f"关键词批量: {precision(keyword_hits):.0%}（含提取共 {keyword_ms:.2f}ms）")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""记忆批量写入基准测试
+
+模拟每次分析后写入一批提取出的记忆（部分为已有记忆的更新），对比逐条调用
+insert_user_profile（每条一次查询和提交）与 upsert_user_profiles（一次查询、一个事务）。
+
+运行: python benchmarks/bench_memory_upsert.py [--passes 200 --batch 8]
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('TIME_SYNC_INTERVAL', '0')
+from flask import Flask
+from src.models.user import db
+from src.models.diary import Auth
+from src.models.mcp import UserMemory
+from src.models.engine import sqlite_engine_options, register_sqlite_pragmas
+from src.mcp.memory_search import memory_search
+from src.mcp.usermcp_builtin import BuiltinUserMCP
+# 两种方式的执行日志都按默认采样率缓冲写入
+from src.mcp.execution_log import execution_log_writer
+
+TYPES = ('preference', 'habit', 'fact', 'emotion', 'experience')
+
+
+def create_app():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tempfile.mktemp(suffix='.db')}"
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = sqlite_engine_options()
+    db.init_app(app)
+    register_sqlite_pragmas(app)
+    with app.app_context():
+        db.create_all()
+        db.session.add(Auth(password_hash='x'))
+        db.session.commit()
+        memory_search.ensure_index(db.engine)
+    return app
+
+
+def batches(passes, size, seed=7):
+    rng = random.Random(seed)
+    for _ in range(passes):
+        # 约一半的关键词与已有记忆重复，触发更新
+        yield [{'key': f'话题{rng.randint(0, passes * size // 2)}', 'value': f'内容{rng.random():.6f}',
+                'type': rng.choice(TYPES), 'confidence': round(rng.uniform(0.5, 1.0), 2)} for _ in range(size)]
+
+
+async def per_item(usermcp, passes, size):
+    for batch in batches(passes, size):
+        for memory in batch:
+            await usermcp.insert_user_profile(memory['key'], memory['value'], 1, memory['type'], memory['confidence'])
+
+
+async def bulk(usermcp, passes, size):
+    for batch in batches(passes, size):
+        await usermcp.upsert_user_profiles(batch, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--passes', type=int, default=200)
+    parser.add_argument('--batch', type=int, default=8)
+    args = parser.parse_args()
+
+    for label, runner in (('逐条写入', per_item), ('批量写入', bulk)):
+        app = create_app()
+        with app.app_context():
+            usermcp = BuiltinUserMCP()
+            started = time.perf_counter()
+            asyncio.run(runner(usermcp, args.passes, args.batch))
+            elapsed = time.perf_counter() - started
+            execution_log_writer.flush()
+            count = UserMemory.query.count()
+        print(f"{label}: {args.passes} 批 × {args.batch} 条 共 {elapsed:6.2f}s，"
+              f"每批 {elapsed / args.passes * 1000:7.2f}ms，最终记忆 {count} 条")
+    execution_log_writer.stop()
+
+
+if __name__ == '__main__':
+    main()
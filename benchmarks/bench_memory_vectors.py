@@ -0,0 +1,100 @@
+"""记忆语义检索基准测试
+
+使用本地特征哈希向量（MEMORY_EMBEDDING_BACKEND=local）为一个用户生成大量记忆，统计：
+首次建立索引的耗时、重启后从内存映射文件加载的耗时、一次矩阵乘法的 top-k 检索与逐条计算余弦的对比，
+以及增量写入单条记忆的耗时。
+
+运行: python benchmarks/bench_memory_vectors.py [--memories 20000 --queries 200]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('TIME_SYNC_INTERVAL', '0')
+os.environ['MEMORY_EMBEDDING_BACKEND'] = 'local'
+os.environ['MEMORY_RECALL_MODE'] = 'semantic'
+os.environ['MEMORY_VECTOR_DIR'] = tempfile.mkdtemp()
+import numpy as np
+from flask import Flask
+from src.models.user import db
+from src.models.diary import Auth
+from src.models.mcp import UserMemory
+from src.models.engine import sqlite_engine_options, register_sqlite_pragmas
+from src.mcp.memory_search import memory_search
+from src.mcp.memory_vectors import MemoryVectorIndex, memory_text
+
+WORDS = ['咖啡', '跑步', '爬山', '读书', '电影', '音乐', '猫咪', '加班', '旅行', '做饭', '游泳', '摄影',
+         '画画', '早起', '熬夜', '火锅', '奶茶', '编程', '考试', '朋友', '家人', '健身', '散步', '钢琴']
+
+
+def create_app():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tempfile.mktemp(suffix='.db')}"
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = sqlite_engine_options()
+    db.init_app(app)
+    register_sqlite_pragmas(app)
+    with app.app_context():
+        db.create_all()
+        db.session.add(Auth(password_hash='x'))
+        db.session.commit()
+        memory_search.ensure_index(db.engine)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--memories', type=int, default=20000)
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(5)
+    app = create_app()
+    with app.app_context():
+        db.session.execute(UserMemory.__table__.insert(), [
+            {'user_id': 1, 'memory_type': 'preference', 'key': f'记忆{i}',
+             'value': ''.join(rng.sample(WORDS, 4)), 'confidence': 1.0, 'tags': []}
+            for i in range(args.memories)
+        ])
+        db.session.commit()
+        queries = [''.join(rng.sample(WORDS, 3)) for _ in range(args.queries)]
+
+        index = MemoryVectorIndex()
+        started = time.perf_counter()
+        index.rank(1, queries[0], 10)
+        print(f"首次建立索引: {args.memories} 条记忆 {time.perf_counter() - started:6.2f}s")
+
+        restarted = MemoryVectorIndex()
+        started = time.perf_counter()
+        restarted.rank(1, queries[0], 10)
+        print(f"重启后加载索引并检索: {(time.perf_counter() - started) * 1000:7.1f}ms "
+              f"（计算向量 {len(restarted.embedder._cache)} 次）")
+
+        vectors = restarted._get(1)
+        query_vectors = [restarted.embedder.embed([query])[0] for query in queries]
+        started = time.perf_counter()
+        for query_vector in query_vectors:
+            vectors.top_k(query_vector, 10)
+        vectorized = (time.perf_counter() - started) / len(queries) * 1000
+
+        rows = [np.array(vectors.matrix[row]) for row in range(vectors.count)]
+        started = time.perf_counter()
+        for query_vector in query_vectors[:20]:
+            scores = [(vectors.ids[row], float(np.dot(vector, query_vector))) for row, vector in enumerate(rows)]
+            sorted(scores, key=lambda item: item[1], reverse=True)[:10]
+        loop = (time.perf_counter() - started) / 20 * 1000
+        print(f"top-10 检索: 矩阵乘法 {vectorized:6.2f}ms/次，逐条计算 {loop:7.2f}ms/次")
+
+        started = time.perf_counter()
+        for i in range(100):
+            memory_id = args.memories + 1 + i
+            restarted.update_memories(1, [(memory_id, f'新记忆{i}', ''.join(rng.sample(WORDS, 4)))])
+        print(f"增量写入: {(time.perf_counter() - started) * 10:6.2f}ms/条")
+        print(f"示例: {memory_text('咖啡', queries[0])} -> {vectors.top_k(query_vectors[0], 3)}")
+
+
+if __name__ == '__main__':
+    main()
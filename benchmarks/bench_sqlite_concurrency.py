@@ -0,0 +1,114 @@
+"""SQLite 并发写入压力测试
+
+模拟请求线程并发创建日记条目，同时分析线程并发回写 ai_analysis，
+对比默认连接配置与 src.models.engine 调优配置（WAL、busy_timeout、连接池）下的吞吐量和锁冲突次数。
+
+运行: python benchmarks/bench_sqlite_concurrency.py [--writers 8 --analyzers 8 --ops 200]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('TIME_SYNC_INTERVAL', '0')
+
+from flask import Flask
+from sqlalchemy.exc import OperationalError
+from src.models.user import db
+from src.models.diary import DiaryEntry
+from src.models.engine import sqlite_engine_options, register_sqlite_pragmas
+
+
+def create_app(tuned):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tempfile.mktemp(suffix='.db')}"
+    if tuned:
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = sqlite_engine_options()
+    else:
+        # 旧配置：默认 journal 模式，1 秒锁等待以便在短时间内暴露锁冲突
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'timeout': 1}}
+    db.init_app(app)
+    if tuned:
+        register_sqlite_pragmas(app)
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def run(app, writers, analyzers, ops):
+    errors = {'locked': 0, 'other': 0}
+    lock = threading.Lock()
+    created = []
+
+    def record_error(e):
+        with lock:
+            errors['locked' if 'locked' in str(e) else 'other'] += 1
+
+    def writer():
+        with app.app_context():
+            for i in range(ops):
+                try:
+                    entry = DiaryEntry(text_content=f'压力测试条目 {i}' * 20, ai_analysis='AI理解中...',
+                                       analysis_status='pending')
+                    db.session.add(entry)
+                    db.session.commit()
+                    with lock:
+                        created.append(entry.id)
+                except OperationalError as e:
+                    db.session.rollback()
+                    record_error(e)
+
+    def analyzer():
+        with app.app_context():
+            done = 0
+            while done < ops:
+                with lock:
+                    entry_id = created.pop(0) if created else None
+                if entry_id is None:
+                    time.sleep(0.001)
+                    if not any(t.is_alive() for t in writer_threads):
+                        return
+                    continue
+                try:
+                    entry = db.session.get(DiaryEntry, entry_id)
+                    entry.ai_analysis = '活动总结: 压力测试。' * 30
+                    entry.analysis_status = 'done'
+                    db.session.commit()
+                    # 同时读取今日列表，模拟前端轮询
+                    DiaryEntry.query.order_by(DiaryEntry.timestamp.desc()).limit(20).all()
+                except OperationalError as e:
+                    db.session.rollback()
+                    record_error(e)
+                done += 1
+
+    writer_threads = [threading.Thread(target=writer) for _ in range(writers)]
+    analyzer_threads = [threading.Thread(target=analyzer) for _ in range(analyzers)]
+    started = time.perf_counter()
+    for t in writer_threads + analyzer_threads:
+        t.start()
+    for t in writer_threads + analyzer_threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    return elapsed, errors
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--writers', type=int, default=8)
+    parser.add_argument('--analyzers', type=int, default=8)
+    parser.add_argument('--ops', type=int, default=200)
+    args = parser.parse_args()
+
+    total_writes = args.writers * args.ops * 2
+    for label, tuned in (('默认配置', False), ('调优配置', True)):
+        app = create_app(tuned)
+        elapsed, errors = run(app, args.writers, args.analyzers, args.ops)
+        print(f"{label}: {elapsed:6.2f}s, {total_writes / elapsed:8.0f} 写/秒, "
+              f"database is locked: {errors['locked']}, 其他错误: {errors['other']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""静态文件服务基准测试
+
+对 static 目录中的前端文件，对比原来每次请求 os.path.exists + send_from_directory 的方式与内存清单
+（预压缩 + ETag）在首次访问和带 If-None-Match 再次访问时的响应字节数和耗时，以及启动时建立清单的耗时。
+
+运行: python benchmarks/bench_static_assets.py [--repeat 200]
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from flask import Flask, request, send_from_directory
+from src.services.static_assets import StaticAssets
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src', 'static')
+PATHS = ['index.html', 'assets/index-DUaNkWBt.js', 'assets/index-oWMHbS2h.css', 'js/app.js', 'favicon.ico']
+BROWSER = {'Accept-Encoding': 'gzip, deflate, br'}
+
+
+def create_app(assets):
+    app = Flask(__name__, static_folder=None)
+
+    @app.route('/disk/<path:path>')
+    def disk(path):
+        if os.path.exists(os.path.join(STATIC_DIR, path)):
+            return send_from_directory(STATIC_DIR, path)
+        return '', 404
+
+    @app.route('/manifest/<path:path>')
+    def manifest(path):
+        return assets.response(path, request) or ('', 404)
+
+    return app
+
+
+def measure(client, url, headers, repeat):
+    response = client.get(url, headers=headers)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        client.get(url, headers=headers).close()
+    return (time.perf_counter() - started) / repeat * 1000, response
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    assets = StaticAssets()
+    started = time.perf_counter()
+    count = assets.load(STATIC_DIR)
+    print(f"建立清单: {count} 个文件 {(time.perf_counter() - started) * 1000:.0f}ms")
+    while assets.get_stats()['brotli'] and assets.get_stats()['brotli_ready'] < assets.get_stats()['precompressed']:
+        time.sleep(0.1)
+    print(f"后台 brotli 完成: {(time.perf_counter() - started) * 1000:.0f}ms，{assets.get_stats()}")
+    client = create_app(assets).test_client()
+
+    print(f"{'文件':<28}{'磁盘':>16}{'清单首次':>18}{'清单再次访问':>18}")
+    totals = [0, 0, 0]
+    for path in PATHS:
+        disk_ms, disk = measure(client, f'/disk/{path}', BROWSER, args.repeat)
+        first_ms, first = measure(client, f'/manifest/{path}', BROWSER, args.repeat)
+        revalidate = {**BROWSER, 'If-None-Match': first.headers['ETag']}
+        repeat_ms, repeat = measure(client, f'/manifest/{path}', revalidate, args.repeat)
+        sizes = [len(disk.data), len(first.data), len(repeat.data)]
+        totals = [total + size for total, size in zip(totals, sizes)]
+        print(f"{path:<28}{sizes[0] / 1024:>7.0f}KB {disk_ms:>5.2f}ms"
+              f"{sizes[1] / 1024:>9.0f}KB {first_ms:>5.2f}ms{sizes[2]:>8}B {repeat.status_code} {repeat_ms:>5.2f}ms")
+    print(f"合计传输: 磁盘 {totals[0] / 1024:.0f}KB，清单首次 {totals[1] / 1024:.0f}KB，再次访问 {totals[2]}B")
+
+
+if __name__ == '__main__':
+    main()
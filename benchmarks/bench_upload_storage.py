@@ -0,0 +1,83 @@
+"""上传图片存储基准测试
+
+生成一批手机照片大小的 JPEG，其中一部分重复上传，统计：按内容寻址后磁盘占用与逐个保存原图的对比、
+后台生成三种宽度 WebP 缩略图的耗时，以及时间线按 640 宽度缩略图加载与加载原图的传输字节数对比。
+
+运行: python benchmarks/bench_upload_storage.py [--images 20 --reuploads 10]
+"""
+import io
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from PIL import Image, ImageDraw, ImageFilter
+from src.services import upload_storage as storage_module
+from src.services.upload_storage import UploadStorage
+
+
+class Upload:
+    """模拟 werkzeug 的 FileStorage，只需要 stream 属性"""
+
+    def __init__(self, data):
+        self.stream = io.BytesIO(data)
+
+
+def photo(seed, width=4032, height=3024):
+    rng = random.Random(seed)
+    image = Image.effect_noise((width // 4, height // 4), 60).convert('RGB').resize((width, height))
+    draw = ImageDraw.Draw(image)
+    for _ in range(40):
+        x, y = rng.randrange(width), rng.randrange(height)
+        draw.ellipse((x, y, x + rng.randrange(50, 800), y + rng.randrange(50, 800)),
+                     fill=(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    output = io.BytesIO()
+    image.filter(ImageFilter.GaussianBlur(1)).save(output, format='JPEG', quality=92)
+    return output.getvalue()
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--images', type=int, default=20)
+    parser.add_argument('--reuploads', type=int, default=10)
+    args = parser.parse_args()
+
+    images = [photo(seed) for seed in range(args.images)]
+    rng = random.Random(7)
+    uploads = images + [rng.choice(images) for _ in range(args.reuploads)]
+    storage_module.STATIC_DIR = tempfile.mkdtemp()
+    storage = UploadStorage()
+
+    started = time.perf_counter()
+    paths = [storage.store(Upload(data), 'photo.jpg')[0] for data in uploads]
+    stored_ms = (time.perf_counter() - started) / len(uploads) * 1000
+    storage._executor.shutdown(wait=True)
+    originals = directory_size(storage.upload_dir) - directory_size(storage.thumbnail_dir)
+    print(f"上传 {len(uploads)} 次（其中重复 {args.reuploads} 次）: 保存 {stored_ms:.1f}ms/次")
+    print(f"原图磁盘占用: 逐个保存 {sum(map(len, uploads)) / 1048576:7.1f}MB，按内容寻址 {originals / 1048576:7.1f}MB")
+
+    for image_path in set(paths):
+        for size in storage.sizes:
+            os.remove(storage._thumbnail_file(image_path, size))
+    started = time.perf_counter()
+    for image_path in set(paths):
+        storage.generate_thumbnails(image_path)
+    thumbnail_ms = (time.perf_counter() - started) / len(set(paths)) * 1000
+    print(f"生成缩略图 {storage.sizes}: {thumbnail_ms:.1f}ms/张，占用 {directory_size(storage.thumbnail_dir) / 1048576:.1f}MB")
+
+    full = sum(os.path.getsize(storage.full_path(image_path)) for image_path in paths)
+    thumbnails = sum(os.path.getsize(storage._thumbnail_file(image_path, 640)) for image_path in paths)
+    print(f"时间线加载 {len(paths)} 张图片: 原图 {full / 1048576:7.1f}MB，640 宽缩略图 {thumbnails / 1048576:7.2f}MB "
+          f"（{full / thumbnails:.0f} 倍）")
+    print(storage.get_stats())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""图片预处理基准测试
+
+生成几种典型上传图片（带 EXIF 的手机照片、大尺寸 PNG 截图、带透明通道的 PNG、小尺寸 WebP、GIF），
+对比直接 base64 编码原图与预处理（缩放、重新编码、去除 EXIF）后发送的字节数和耗时，以及命中缓存时的耗时。
+视觉模型按图片尺寸计算 token，缩小尺寸即使字节数变化不大也能降低费用。
+
+运行: python benchmarks/bench_vision_images.py [--repeat 3]
+"""
+import io
+import os
+import sys
+import time
+import base64
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from PIL import Image, ImageDraw, ImageFilter
+from src.services.image_service import ImageService
+
+
+def photo(width, height, seed):
+    """噪声加渐变，接近真实照片的压缩率"""
+    rng = random.Random(seed)
+    image = Image.effect_noise((width // 4, height // 4), 60).convert('RGB').resize((width, height))
+    draw = ImageDraw.Draw(image)
+    for _ in range(40):
+        x, y = rng.randrange(width), rng.randrange(height)
+        draw.ellipse((x, y, x + rng.randrange(50, 800), y + rng.randrange(50, 800)),
+                     fill=(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    return image.filter(ImageFilter.GaussianBlur(1))
+
+
+def screenshot(width, height):
+    image = Image.new('RGB', (width, height), 'white')
+    draw = ImageDraw.Draw(image)
+    for row in range(0, height, 36):
+        draw.text((20, row), '今天的日记 ' * 20, fill=(30, 30, 30))
+    return image
+
+
+def fixtures(directory):
+    files = []
+    exif = Image.Exif()
+    exif[0x0112] = 6  # 方向：旋转 90 度
+    exif[0x010F] = 'PhoneMaker'
+    path = os.path.join(directory, 'phone.jpg')
+    photo(4032, 3024, 1).save(path, quality=95, exif=exif)
+    files.append(('手机照片 4032x3024 JPEG+EXIF', path))
+
+    path = os.path.join(directory, 'screenshot.png')
+    screenshot(2532, 1170).save(path)
+    files.append(('截图 2532x1170 PNG', path))
+
+    path = os.path.join(directory, 'sticker.png')
+    sticker = photo(1200, 1200, 2).convert('RGBA')
+    sticker.putalpha(Image.new('L', sticker.size, 180))
+    sticker.save(path)
+    files.append(('透明贴纸 1200x1200 PNG', path))
+
+    path = os.path.join(directory, 'small.webp')
+    photo(800, 600, 3).save(path, quality=80)
+    files.append(('小图 800x600 WebP', path))
+
+    path = os.path.join(directory, 'anim.gif')
+    frames = [photo(640, 480, seed).convert('P') for seed in range(4)]
+    frames[0].save(path, save_all=True, append_images=frames[1:])
+    files.append(('动图 640x480 GIF', path))
+    return files
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    files = fixtures(directory)
+    print(f"{'图片':<28}{'原图base64':>12}{'预处理后':>12}{'原图耗时':>10}{'预处理耗时':>12}{'缓存命中':>10}  类型与尺寸")
+    for label, path in files:
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            with open(path, 'rb') as f:
+                raw = base64.b64encode(f.read()).decode('utf-8')
+        raw_ms = (time.perf_counter() - started) / args.repeat * 1000
+
+        elapsed = []
+        for _ in range(args.repeat):
+            service = ImageService()
+            started = time.perf_counter()
+            mime, payload = service.encode_for_vision(path)
+            elapsed.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        service.encode_for_vision(path)
+        cached_ms = (time.perf_counter() - started) * 1000
+
+        print(f"{label:<28}{len(raw) / 1024:>10.0f}KB{len(payload) / 1024:>10.0f}KB"
+              f"{raw_ms:>9.1f}ms{sum(elapsed) / len(elapsed) * 1000:>11.1f}ms{cached_ms:>9.1f}ms  {mime} "
+              f"{'x'.join(map(str, Image.open(io.BytesIO(base64.b64decode(payload))).size))}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""本地假 MCP 服务器，用于测试和基准测试 stdio 客户端
+
+按行读取 JSON-RPC 请求，支持 initialize / ping / tools/list / tools/call。
+工具调用在线程中执行，可同时处理多个请求，响应顺序与请求顺序无关。
+
+工具:
+  echo   {"text": "..."}      原样返回文本
+  sleep  {"seconds": 0.1}     等待指定秒数后返回
+  fail   {}                   返回 JSON-RPC 错误
+  get_context {"text": "..."}  等待 --context-delay 秒后返回一段上下文（分析前的上下文工具）
+
+参数:
+  --crash-after N    处理 N 次工具调用后退出，用于测试自动重启
+  --startup-delay S  启动时等待 S 秒，模拟较慢的服务器启动
+  --context-delay S  get_context 的响应延迟
+
+运行: python benchmarks/fake_mcp_server.py [--crash-after N] [--startup-delay S]
+"""
+import sys
+import json
+import time
+import argparse
+import threading
+
+TOOLS = [
+    {'name': 'echo', 'description': '原样返回文本',
+     'inputSchema': {'type': 'object', 'properties': {'text': {'type': 'string'}}}},
+    {'name': 'sleep', 'description': '等待指定秒数后返回',
+     'inputSchema': {'type': 'object', 'properties': {'seconds': {'type': 'number'}}}},
+    {'name': 'fail', 'description': '总是返回错误', 'inputSchema': {'type': 'object', 'properties': {}}},
+    {'name': 'get_context', 'description': '返回与文本相关的上下文',
+     'inputSchema': {'type': 'object', 'properties': {'text': {'type': 'string'}}}},
+]
+
+context_delay = 0.0
+
+write_lock = threading.Lock()
+
+
+def send(message):
+    with write_lock:
+        sys.stdout.write(json.dumps(message, ensure_ascii=False) + '\n')
+        sys.stdout.flush()
+
+
+def text_result(text):
+    return {'content': [{'type': 'text', 'text': text}], 'isError': False}
+
+
+def call_tool(request_id, name, arguments):
+    if name == 'echo':
+        send({'jsonrpc': '2.0', 'id': request_id, 'result': text_result(str(arguments.get('text', '')))})
+    elif name == 'sleep':
+        seconds = float(arguments.get('seconds', 0.1))
+        time.sleep(seconds)
+        send({'jsonrpc': '2.0', 'id': request_id, 'result': text_result(f'slept {seconds}')})
+    elif name == 'get_context':
+        time.sleep(context_delay)
+        text = str(arguments.get('text', ''))
+        send({'jsonrpc': '2.0', 'id': request_id, 'result': text_result(f'上下文: 收到 {len(text)} 字的日记')})
+    elif name == 'fail':
+        send({'jsonrpc': '2.0', 'id': request_id, 'error': {'code': -32000, 'message': 'tool failed'}})
+    else:
+        send({'jsonrpc': '2.0', 'id': request_id, 'error': {'code': -32602, 'message': f'unknown tool: {name}'}})
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--crash-after', type=int, default=0)
+    parser.add_argument('--startup-delay', type=float, default=0)
+    parser.add_argument('--context-delay', type=float, default=0)
+    args = parser.parse_args()
+    global context_delay
+    context_delay = args.context_delay
+    time.sleep(args.startup_delay)
+
+    tool_calls = 0
+    for line in sys.stdin:
+        try:
+            message = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        request_id = message.get('id')
+        method = message.get('method')
+        if request_id is None:
+            continue  # 通知不需要响应
+        if method == 'initialize':
+            send({'jsonrpc': '2.0', 'id': request_id, 'result': {
+                'protocolVersion': message.get('params', {}).get('protocolVersion', '2024-11-05'),
+                'capabilities': {'tools': {}},
+                'serverInfo': {'name': 'fake-mcp-server', 'version': '1.0'}
+            }})
+        elif method == 'ping':
+            send({'jsonrpc': '2.0', 'id': request_id, 'result': {}})
+        elif method == 'tools/list':
+            send({'jsonrpc': '2.0', 'id': request_id, 'result': {'tools': TOOLS}})
+        elif method == 'tools/call':
+            params = message.get('params', {})
+            threading.Thread(target=call_tool, args=(request_id, params.get('name'), params.get('arguments') or {}),
+                             daemon=True).start()
+            tool_calls += 1
+            if args.crash_after and tool_calls >= args.crash_after:
+                time.sleep(0.05)
+                sys.exit(1)
+        else:
+            send({'jsonrpc': '2.0', 'id': request_id, 'error': {'code': -32601, 'message': f'method not found: {method}'}})
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,5 @@
 import os
 import sys
-import asyncio
 import logging
 # DON'T CHANGE THIS !!!
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
@@ -8,32 +7,44 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 logging.basicConfig(level=logging.INFO, encoding='utf-8')
 logger = logging.getLogger(__name__)
 
-from flask import Flask, send_from_directory
+from flask import Flask, request, send_from_directory
 from flask_cors import CORS
 from src.models.user import db
-from src.models.diary import DiaryEntry, DailySummary, Config, Auth
-from src.models.mcp import MCPServer, UserMemory, MCPExecutionLog
+from src.models.engine import sqlite_engine_options, register_sqlite_pragmas
+from src.models.diary import DiaryEntry, DailySummary, DailyDigest, Config, Auth, AnalysisJob
+from src.models.mcp import MCPServer, UserMemory, MCPExecutionLog, MCPExecutionStat
 from src.routes.user import user_bp
 from src.routes.auth import auth_bp
 from src.routes.diary import diary_bp
 from src.routes.config import config_bp
 from src.routes.admin import admin_bp
 from src.routes.mcp import mcp_bp
+from src.services.upload_storage import upload_storage
+from src.services.static_assets import static_assets, is_fingerprinted
+from src.services.json_provider import FastJSONProvider
+from src.services.response_compression import response_compressor
 
 app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
 # 从环境变量加载密钥，防止秘钥泄露。提供默认值以便开发环境运行。
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'diary_app_secret_key_2025')
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+app.config['MAX_CONTENT_LENGTH'] = upload_storage.max_request_bytes  # 单个图片 UPLOAD_MAX_MB（默认 16MB）加文字字段
 
 # 启用CORS
 CORS(app)
 
+# jsonify 使用 orjson（可用时）输出 UTF-8，较大的文本响应按 Accept-Encoding 压缩
+app.json = FastJSONProvider(app)
+response_compressor.init_app(app)
+
 # 数据库配置
 database_dir = os.path.join(os.path.dirname(__file__), 'database')
 os.makedirs(database_dir, exist_ok=True)  # 确保数据库目录存在
 app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(database_dir, 'app.db')}"
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# WAL、busy_timeout、连接池等SQLite并发配置，可通过环境变量覆盖
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = sqlite_engine_options()
 db.init_app(app)
+register_sqlite_pragmas(app)
 
 # 注册蓝图
 app.register_blueprint(user_bp, url_prefix='/api')
@@ -43,6 +54,9 @@ app.register_blueprint(config_bp, url_prefix='/api')
 app.register_blueprint(admin_bp, url_prefix='/api/admin')
 app.register_blueprint(mcp_bp, url_prefix='/api/mcp')
 
+# 启动时建立静态文件清单并预压缩
+static_assets.load(app.static_folder)
+
 def init_default_configs():
     """初始化默认配置"""
     default_configs = [
@@ -343,11 +357,20 @@ def init_default_mcp_servers():
         # 初始化MCP客户端管理器
         from src.mcp.client import get_mcp_manager
         mcp_manager = get_mcp_manager(db.session)
-        asyncio.run(mcp_manager.initialize_builtin_servers())
+        from src.services.async_runner import async_runner
+        async_runner.run(mcp_manager.initialize_builtin_servers())
         
     except Exception as e:
         logger.error(f"初始化MCP服务器失败: {e}")
 
+@app.route('/uploads/thumbs/<path:filename>')
+def serve_thumbnail(filename):
+    """缩略图文件名包含内容哈希，内容不变，可长期缓存；缺失时即时生成"""
+    if not upload_storage.ensure_thumbnail(filename):
+        from flask import abort
+        abort(404)
+    return send_from_directory(upload_storage.thumbnail_dir, filename, max_age=31536000)
+
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
 def serve(path):
@@ -360,9 +383,18 @@ def serve(path):
     if static_folder_path is None:
             return "Static folder not configured", 404
 
+    # 优先从内存清单返回（预压缩、ETag、缓存策略），清单外的文件（如上传图片）再访问磁盘
+    if path != "":
+        response = static_assets.response(path, request)
+        if response is not None:
+            return response
     if path != "" and os.path.exists(os.path.join(static_folder_path, path)):
-        return send_from_directory(static_folder_path, path)
+        max_age = 31536000 if is_fingerprinted(path) else None
+        return send_from_directory(static_folder_path, path, max_age=max_age)
     else:
+        response = static_assets.response('index.html', request)
+        if response is not None:
+            return response
         index_path = os.path.join(static_folder_path, 'index.html')
         if os.path.exists(index_path):
             return send_from_directory(static_folder_path, 'index.html')
@@ -384,6 +416,66 @@ def upgrade_database():
                 connection.execute(text('ALTER TABLE diary_entries ADD COLUMN is_daily_summary BOOLEAN DEFAULT FALSE'))
                 connection.commit()
             logger.info("数据库升级完成：添加了 is_daily_summary 字段")
+
+        if 'analysis_status' not in columns:
+            # 添加显式的AI分析状态字段，并根据原有的 ai_analysis 文本回填状态
+            with db.engine.connect() as connection:
+                connection.execute(text('ALTER TABLE diary_entries ADD COLUMN analysis_status VARCHAR(20)'))
+                connection.execute(text('ALTER TABLE diary_entries ADD COLUMN analysis_attempts INTEGER DEFAULT 0'))
+                connection.execute(text('ALTER TABLE diary_entries ADD COLUMN analysis_started_at DATETIME'))
+                connection.execute(text('ALTER TABLE diary_entries ADD COLUMN analysis_finished_at DATETIME'))
+                # 只有占位文本本身算作待分析，已完成的分析里出现"分析中"等字样不能被当成未完成而重新分析
+                connection.execute(text("""
+                    UPDATE diary_entries SET analysis_status = CASE
+                        WHEN ai_analysis = 'AI理解中...' THEN 'pending'
+                        WHEN ai_analysis LIKE 'AI分析失败%' THEN 'failed'
+                        ELSE 'done'
+                    END
+                    WHERE ai_analysis IS NOT NULL AND (is_daily_summary IS NULL OR is_daily_summary = 0)
+                """))
+                connection.execute(text(
+                    'CREATE INDEX IF NOT EXISTS idx_diary_analysis_status ON diary_entries (analysis_status, timestamp)'
+                ))
+                connection.commit()
+            logger.info("数据库升级完成：添加了 analysis_status 等AI分析状态字段")
+
+        # 按日期查询改为 timestamp 范围比较，为旧数据库补充索引；
+        # 同时把空的 is_daily_summary 规范为 FALSE，使 is_daily_summary = 0 的条件能走复合索引
+        with db.engine.connect() as connection:
+            connection.execute(text('UPDATE diary_entries SET is_daily_summary = 0 WHERE is_daily_summary IS NULL'))
+            connection.execute(text('CREATE INDEX IF NOT EXISTS idx_diary_timestamp ON diary_entries (timestamp)'))
+            connection.execute(text(
+                'CREATE INDEX IF NOT EXISTS idx_diary_summary_timestamp ON diary_entries (is_daily_summary, timestamp)'
+            ))
+            connection.execute(text('CREATE INDEX IF NOT EXISTS idx_daily_summary_date ON daily_summaries (date)'))
+            connection.execute(text('CREATE INDEX IF NOT EXISTS idx_mcp_log_created ON mcp_execution_logs (created_at)'))
+            connection.commit()
+
+        # 记忆按 (user_id, key, memory_type) 唯一：先合并旧数据中的重复记录（保留最新一条），再建唯一索引
+        indexes = [index['name'] for index in inspector.get_indexes('user_memories')]
+        if 'uq_user_memory_key_type' not in indexes:
+            with db.engine.connect() as connection:
+                connection.execute(text('''
+                    UPDATE user_memories SET confidence = (
+                        SELECT MAX(m.confidence) FROM user_memories m
+                        WHERE m.user_id = user_memories.user_id AND m.key = user_memories.key
+                          AND m.memory_type = user_memories.memory_type
+                    )
+                '''))
+                removed = connection.execute(text('''
+                    DELETE FROM user_memories WHERE id NOT IN (
+                        SELECT MAX(id) FROM user_memories GROUP BY user_id, key, memory_type
+                    )
+                ''')).rowcount
+                connection.execute(text(
+                    'CREATE UNIQUE INDEX IF NOT EXISTS uq_user_memory_key_type ON user_memories (user_id, key, memory_type)'
+                ))
+                connection.commit()
+            logger.info(f"数据库升级完成：记忆表添加唯一索引，合并了 {removed} 条重复记忆")
+
+        # 记忆全文索引：创建 FTS5 表和同步触发器，旧数据库首次启动时回填
+        from src.mcp.memory_search import memory_search
+        memory_search.ensure_index(db.engine)
     except Exception as e:
         logger.error(f"数据库升级失败: {e}")
         # 如果升级失败，继续运行（可能字段已存在）
@@ -404,11 +496,25 @@ if __name__ == '__main__':
         os.environ.get('WERKZEUG_RUN_MAIN') == 'true'  # 仅在reloader子进程启动
         or not app.debug  # 非debug模式直接启动
     )
+    from src.services.analysis_queue import analysis_queue
     if should_start_scheduler:
         scheduler_service.start(app)
+        analysis_queue.start(app)  # 启动AI分析队列并恢复未完成的任务
+        with app.app_context():
+            # 预先启动已启用的外部MCP服务器进程
+            from src.mcp.client import get_mcp_manager
+            from src.services.async_runner import async_runner
+            async_runner.run(get_mcp_manager(db.session).start_enabled_servers())
     
     try:
         app.run(host='0.0.0.0', port=5000, debug=True)
     finally:
         # 停止定时任务服务
         scheduler_service.stop()
+        analysis_queue.stop()
+        from src.mcp.client import get_mcp_manager
+        from src.services.async_runner import async_runner
+        async_runner.run(get_mcp_manager(db.session).stop_all())
+        async_runner.stop()
+        from src.mcp.execution_log import execution_log_writer
+        execution_log_writer.stop()  # 写入缓冲区中剩余的MCP执行日志
@@ -1,49 +1,74 @@
+import os
 import asyncio
 import json
 import logging
 from typing import Dict, List, Optional, Any
 from datetime import datetime
+from .stdio_client import MCPServerPool
+from .execution_log import execution_log_writer
 
 logger = logging.getLogger(__name__)
 
 class MCPClientManager:
     """MCP客户端管理器"""
-    
+
     def __init__(self, db_session=None):
-        self.clients = {}  # server_name -> client_info
+        self.clients = {}  # server_name -> client_info（内置服务器）
+        self.pools = {}    # server_name -> MCPServerPool（外部子进程服务器）
         self.db = db_session
         self.builtin_usermcp = None
-        
+        # 每个外部服务器预先启动的进程数、单次请求超时和健康检查间隔
+        self.pool_size = int(os.environ.get('MCP_POOL_SIZE', 1))
+        self.request_timeout = float(os.environ.get('MCP_REQUEST_TIMEOUT', 30))
+        self.health_interval = float(os.environ.get('MCP_HEALTH_INTERVAL', 30))
+        # 分析时并发调用各服务器：单个服务器超时、整体截止时间，以及用于获取上下文的工具名
+        self.server_timeout = float(os.environ.get('MCP_SERVER_TIMEOUT', 3))
+        self.context_deadline = float(os.environ.get('MCP_CONTEXT_DEADLINE', 5))
+        self.context_tools = [name.strip() for name in
+                              os.environ.get('MCP_CONTEXT_TOOLS', 'get_context').split(',') if name.strip()]
+        self._health_task = None
+
     async def start_server(self, server_config: dict) -> bool:
-        """启动MCP服务器并建立连接"""
+        """启动MCP服务器子进程并完成握手，需在后台事件循环中调用"""
         try:
             server_name = server_config.get('name')
             command = server_config.get('command')
             args = server_config.get('args', [])
-            
+
             logger.info(f"启动MCP服务器: {server_name}")
-            
-            # 这里实际应该使用真正的MCP客户端库
-            # 暂时用模拟实现
-            client_info = {
-                'name': server_name,
-                'command': command,
-                'args': args,
-                'status': 'running',
-                'started_at': datetime.now()
-            }
-            
-            self.clients[server_name] = client_info
+
+            if command == 'builtin':
+                if server_name == 'usermcp':
+                    await self.initialize_builtin_servers()
+                    return True
+                logger.error(f"未知的内置MCP服务器: {server_name}")
+                return False
+
+            if server_name in self.pools:
+                await self.stop_server(server_name)
+
+            pool = MCPServerPool(
+                server_name, command, args, server_config.get('env') or {},
+                size=self.pool_size, request_timeout=self.request_timeout
+            )
+            await pool.start()
+            self.pools[server_name] = pool
+            self._ensure_health_check()
             logger.info(f"MCP服务器 {server_name} 启动成功")
             return True
-            
+
         except Exception as e:
             logger.error(f"启动MCP服务器失败: {e}")
             return False
-    
+
     async def stop_server(self, server_name: str) -> bool:
         """停止MCP服务器"""
         try:
+            if server_name in self.pools:
+                pool = self.pools.pop(server_name)
+                await pool.close()
+                logger.info(f"MCP服务器 {server_name} 已停止")
+                return True
             if server_name in self.clients:
                 del self.clients[server_name]
                 logger.info(f"MCP服务器 {server_name} 已停止")
@@ -52,32 +77,172 @@ class MCPClientManager:
         except Exception as e:
             logger.error(f"停止MCP服务器失败: {e}")
             return False
-    
-    async def query_user_context(self, user_id: int, context: str) -> Dict[str, Any]:
+
+    async def start_enabled_servers(self):
+        """预先启动所有已启用的外部MCP服务器（需在应用上下文中提交）"""
+        from src.models.mcp import MCPServer
+        from src.services.async_runner import async_runner
+
+        def load_configs():
+            servers = MCPServer.query.filter(MCPServer.enabled == True, MCPServer.builtin == False).all()
+            return [{'name': s.name, 'command': s.command, 'args': s.args or [], 'env': s.env or {}} for s in servers]
+
+        configs = await async_runner.run_db(load_configs)
+        results = await asyncio.gather(*(self.start_server(config) for config in configs))
+        return sum(1 for result in results if result)
+
+    async def stop_all(self):
+        """停止所有外部MCP服务器进程"""
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+        await asyncio.gather(*(self.stop_server(name) for name in list(self.pools)), return_exceptions=True)
+
+    def _ensure_health_check(self):
+        if self.health_interval > 0 and (self._health_task is None or self._health_task.done()):
+            self._health_task = asyncio.get_running_loop().create_task(self._health_loop())
+
+    async def _health_loop(self):
+        """定期检查外部服务器进程，失败的进程自动重启"""
+        while True:
+            await asyncio.sleep(self.health_interval)
+            for pool in list(self.pools.values()):
+                try:
+                    await pool.ensure_healthy()
+                except Exception as e:
+                    logger.error(f"MCP服务器 {pool.name} 健康检查失败: {e}")
+
+    async def call_tool(self, server_name: str, tool_name: str, arguments: Dict[str, Any] = None,
+                        timeout: float = None) -> Any:
+        """调用外部MCP服务器的工具，复用常驻进程"""
+        pool = self.pools.get(server_name)
+        if pool is None:
+            raise ConnectionError(f"MCP服务器 {server_name} 未启动")
+        return await pool.call_tool(tool_name, arguments, timeout)
+
+    async def list_tools(self, server_name: str) -> List[Dict[str, Any]]:
+        """获取外部MCP服务器提供的工具列表"""
+        pool = self.pools.get(server_name)
+        if pool is None:
+            raise ConnectionError(f"MCP服务器 {server_name} 未启动")
+        return await pool.list_tools()
+
+    async def execute_tools(self, calls: List[Dict[str, Any]], server_timeout: float = None,
+                            deadline: float = None) -> List[Dict[str, Any]]:
+        """并发执行一组相互独立的工具调用，返回与 calls 顺序一致的结果。
+
+        每个调用为 {'server', 'tool', 'arguments'}，也可以用 'call' 直接给出协程函数（用于内置服务器）。
+        单个调用超过 server_timeout 记为 timeout；到达整体截止时间 deadline 时取消仍未完成的调用，
+        已完成的结果照常返回。
+        """
+        server_timeout = server_timeout or self.server_timeout
+        loop = asyncio.get_running_loop()
+
+        async def run(call):
+            started = loop.time()
+            result = {'server': call['server'], 'tool': call.get('tool'), 'status': 'ok', 'result': None}
+            try:
+                if call.get('call'):
+                    coro = call['call']()
+                else:
+                    coro = self.call_tool(call['server'], call['tool'], call.get('arguments'), server_timeout)
+                result['result'] = await asyncio.wait_for(coro, server_timeout)
+            except asyncio.TimeoutError:
+                result['status'] = 'timeout'
+            except Exception as e:
+                result['status'] = 'error'
+                result['error'] = str(e)
+            elapsed = loop.time() - started
+            result['elapsed_ms'] = round(elapsed * 1000, 1)
+            if not call.get('call'):
+                # 内置服务器自行记录日志，这里只记录外部服务器的调用
+                execution_log_writer.record(call['server'], call['tool'], None, call.get('arguments'),
+                                            result['result'], elapsed, 'success' if result['status'] == 'ok'
+                                            else result['status'], result.get('error'))
+            return result
+
+        tasks = [loop.create_task(run(call)) for call in calls]
+        if not tasks:
+            return []
+        done, pending = await asyncio.wait(tasks, timeout=deadline or self.context_deadline)
+        for task in pending:
+            task.cancel()
+
+        results = []
+        for call, task in zip(calls, tasks):
+            if task in done:
+                results.append(task.result())
+            else:
+                results.append({'server': call['server'], 'tool': call.get('tool'), 'status': 'timeout',
+                                'result': None, 'elapsed_ms': None})
+        timed_out = [r['server'] for r in results if r['status'] != 'ok']
+        if timed_out:
+            logger.warning(f"部分MCP工具调用未成功，已返回其余结果: {timed_out}")
+        return results
+
+    async def gather_context(self, user_id: int, content: str, keywords: List[str] = None) -> Dict[str, Any]:
+        """分析前并发收集上下文：内置用户记忆与各外部服务器的上下文工具同时查询"""
+        calls = []
+        if self.builtin_usermcp and keywords:
+            calls.append({'server': 'usermcp', 'tool': 'query_user_profile',
+                          'call': lambda: self.query_user_context(user_id, content, keywords)})
+        for name, pool in self.pools.items():
+            available = {tool.get('name') for tool in pool.tools}
+            for tool in self.context_tools:
+                if tool in available:
+                    calls.append({'server': name, 'tool': tool,
+                                  'arguments': {'text': content, 'keywords': keywords or []}})
+                    break
+
+        context = {'memories': [], 'external': [], 'calls': []}
+        for result in await self.execute_tools(calls):
+            context['calls'].append({k: result.get(k) for k in ('server', 'tool', 'status', 'elapsed_ms')})
+            if result['status'] != 'ok' or not result['result']:
+                continue
+            if result['server'] == 'usermcp' and result['tool'] == 'query_user_profile':
+                context['memories'] = result['result'].get('memories', [])
+                context['keywords'] = result['result'].get('keywords', [])
+            else:
+                text = self._tool_text(result['result'])
+                if text:
+                    context['external'].append({'server': result['server'], 'text': text})
+        return context
+
+    @staticmethod
+    def _tool_text(result: Any, limit: int = 500) -> str:
+        """提取工具结果中的文本内容"""
+        if not isinstance(result, dict) or result.get('isError'):
+            return ''
+        texts = [item.get('text', '') for item in result.get('content', [])
+                 if isinstance(item, dict) and item.get('type') == 'text']
+        return '\n'.join(text for text in texts if text).strip()[:limit]
+
+    async def query_user_context(self, user_id: int, context: str, keywords: List[str] = None) -> Dict[str, Any]:
         """查询用户上下文信息"""
         try:
             if self.builtin_usermcp:
-                return await self.builtin_usermcp.query_user_profile(context, user_id)
+                return await self.builtin_usermcp.query_user_profile(context, user_id, keywords)
             return {}
         except Exception as e:
             logger.error(f"查询用户上下文失败: {e}")
             return {}
-    
+
     async def update_user_memory(self, user_id: int, memory_data: Dict[str, Any]) -> bool:
         """更新用户记忆"""
         try:
             if self.builtin_usermcp and memory_data:
-                for key, value in memory_data.items():
-                    await self.builtin_usermcp.insert_user_profile(key, str(value), user_id)
-                return True
+                result = await self.builtin_usermcp.upsert_user_profiles(
+                    [{'key': key, 'value': str(value)} for key, value in memory_data.items()], user_id
+                )
+                return 'error' not in result
             return False
         except Exception as e:
             logger.error(f"更新用户记忆失败: {e}")
             return False
-    
+
     def get_server_status(self) -> List[Dict[str, Any]]:
         """获取所有服务器状态"""
-        return [
+        builtin = [
             {
                 'name': info['name'],
                 'status': info['status'],
@@ -87,13 +252,14 @@ class MCPClientManager:
             }
             for info in self.clients.values()
         ]
-    
+        return builtin + [pool.get_status() for pool in self.pools.values()]
+
     async def initialize_builtin_servers(self):
         """初始化内置服务器"""
         try:
             from .usermcp_builtin import BuiltinUserMCP
             self.builtin_usermcp = BuiltinUserMCP(self.db)
-            
+
             # 添加到客户端列表
             self.clients['usermcp'] = {
                 'name': 'usermcp',
@@ -102,9 +268,9 @@ class MCPClientManager:
                 'status': 'running',
                 'started_at': datetime.now()
             }
-            
+
             logger.info("内置usermcp服务器初始化完成")
-            
+
         except Exception as e:
             logger.error(f"初始化内置服务器失败: {e}")
 
@@ -116,4 +282,4 @@ def get_mcp_manager(db_session=None) -> MCPClientManager:
     global mcp_manager
     if mcp_manager is None:
         mcp_manager = MCPClientManager(db_session)
-    return mcp_manager
\ No newline at end of file
+    return mcp_manager
@@ -0,0 +1,216 @@
+import os
+import json
+import random
+import logging
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from src.models.mcp import MCPExecutionLog, MCPExecutionStat
+from src.models.user import db
+
+logger = logging.getLogger(__name__)
+
+
+class ExecutionLogWriter:
+    """MCP执行日志的缓冲写入器。
+
+    调用方只把日志放入内存缓冲区，由后台线程每隔 MCP_LOG_FLUSH_MS 毫秒或攒够 MCP_LOG_BATCH_SIZE 条
+    时在一个事务中批量写入。成功的调用按 MCP_LOG_SUCCESS_SAMPLE_RATE 采样写入明细，失败的调用全部写入；
+    所有调用都会计入按天汇总的 mcp_execution_stats，清理旧明细后统计仍然保留。
+    """
+
+    def __init__(self):
+        self.flush_interval = float(os.environ.get('MCP_LOG_FLUSH_MS', 500)) / 1000
+        self.batch_size = int(os.environ.get('MCP_LOG_BATCH_SIZE', 50))
+        self.sample_rate = float(os.environ.get('MCP_LOG_SUCCESS_SAMPLE_RATE', 0.1))
+        self.max_blob_chars = int(os.environ.get('MCP_LOG_MAX_BLOB_CHARS', 2000))
+        self.retention_days = int(os.environ.get('MCP_LOG_RETENTION_DAYS', 30))
+        self.max_buffer = 10000
+        self.app = None
+        self._buffer = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._recorded = 0
+        self._written = 0
+        self._sampled_out = 0
+        self._dropped = 0
+        self._flushes = 0
+        self._pruned = 0
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, app):
+        if self.running:
+            return
+        self.app = app
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._flush_loop, name='mcp-log-writer', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止后台线程并写入剩余日志"""
+        self._stop_event.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        if self.app is not None:
+            self.flush()
+
+    def record(self, server_name, tool_name, user_id, input_data, output_data, execution_time,
+               status='success', error_message=None):
+        """记录一次调用，不访问数据库"""
+        keep = status != 'success' or random.random() < self.sample_rate
+        item = {
+            'server_name': server_name,
+            'tool_name': tool_name,
+            'user_id': user_id,
+            'execution_time': execution_time,
+            'status': status,
+            'error_message': error_message,
+            'created_at': datetime.utcnow(),
+            'keep': keep
+        }
+        if keep:
+            item['input_data'] = self._truncate(input_data)
+            item['output_data'] = self._truncate(output_data)
+
+        with self._lock:
+            self._recorded += 1
+            if not keep:
+                self._sampled_out += 1
+            if len(self._buffer) >= self.max_buffer:
+                # 数据库长时间不可写时丢弃最旧的记录，避免内存无限增长
+                self._buffer.popleft()
+                self._dropped += 1
+            self._buffer.append(item)
+            full = len(self._buffer) >= self.batch_size
+
+        if not self.running:
+            from flask import current_app, has_app_context
+            if has_app_context():
+                self.start(current_app._get_current_object())
+        if full:
+            self._wakeup.set()
+
+    def _truncate(self, data):
+        if data is None:
+            return None
+        try:
+            text = json.dumps(data, ensure_ascii=False, default=str)
+        except Exception:
+            text = str(data)
+        if len(text) <= self.max_blob_chars:
+            return data
+        return {'truncated': True, 'size': len(text), 'preview': text[:self.max_blob_chars]}
+
+    def _flush_loop(self):
+        while not self._stop_event.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"写入MCP执行日志失败: {e}")
+
+    def flush(self):
+        """把缓冲区中的日志和统计在一个事务中写入数据库"""
+        with self._flush_lock:
+            with self._lock:
+                items = list(self._buffer)
+                self._buffer.clear()
+            if not items:
+                return 0
+
+            rows = [{key: item[key] for key in (
+                'server_name', 'tool_name', 'user_id', 'input_data', 'output_data',
+                'execution_time', 'status', 'error_message', 'created_at'
+            )} for item in items if item['keep']]
+
+            stats = {}
+            for item in items:
+                key = (item['created_at'].date(), item['server_name'], item['tool_name'])
+                stat = stats.setdefault(key, {'calls': 0, 'errors': 0, 'total_time': 0.0, 'max_time': 0.0})
+                elapsed = item['execution_time'] or 0.0
+                stat['calls'] += 1
+                stat['errors'] += 0 if item['status'] == 'success' else 1
+                stat['total_time'] += elapsed
+                stat['max_time'] = max(stat['max_time'], elapsed)
+
+            if self.app is None:
+                from flask import current_app
+                self.app = current_app._get_current_object()
+            with self.app.app_context():
+                try:
+                    if rows:
+                        db.session.execute(MCPExecutionLog.__table__.insert(), rows)
+                    for (day, server_name, tool_name), stat in stats.items():
+                        statement = sqlite_insert(MCPExecutionStat.__table__).values(
+                            day=day, server_name=server_name, tool_name=tool_name, **stat
+                        )
+                        excluded = statement.excluded
+                        table = MCPExecutionStat.__table__.c
+                        db.session.execute(statement.on_conflict_do_update(
+                            index_elements=['day', 'server_name', 'tool_name'],
+                            set_={
+                                'calls': table.calls + excluded.calls,
+                                'errors': table.errors + excluded.errors,
+                                'total_time': table.total_time + excluded.total_time,
+                                'max_time': db.func.max(table.max_time, excluded.max_time)
+                            }
+                        ))
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    # 写入失败时放回缓冲区，下次重试
+                    with self._lock:
+                        self._buffer.extendleft(reversed(items))
+                    raise
+
+            with self._lock:
+                self._written += len(rows)
+                self._flushes += 1
+            return len(rows)
+
+    def prune(self, retention_days=None):
+        """删除超过保留天数的日志明细，按天统计不受影响，需在应用上下文中调用"""
+        retention_days = self.retention_days if retention_days is None else retention_days
+        cutoff = datetime.utcnow() - timedelta(days=retention_days)
+        try:
+            deleted = MCPExecutionLog.query.filter(
+                MCPExecutionLog.created_at < cutoff
+            ).delete(synchronize_session=False)
+            db.session.commit()
+            with self._lock:
+                self._pruned += deleted
+            if deleted:
+                logger.info(f"已清理 {deleted} 条 {retention_days} 天前的MCP执行日志")
+            return deleted
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"清理MCP执行日志失败: {e}")
+            return 0
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'running': self.running,
+                'buffered': len(self._buffer),
+                'recorded': self._recorded,
+                'written': self._written,
+                'sampled_out': self._sampled_out,
+                'dropped': self._dropped,
+                'flushes': self._flushes,
+                'pruned': self._pruned,
+                'sample_rate': self.sample_rate,
+                'retention_days': self.retention_days
+            }
+
+
+# 全局MCP执行日志写入器
+execution_log_writer = ExecutionLogWriter()
@@ -0,0 +1,92 @@
+import re
+from collections import Counter
+from typing import List
+
+# 常见虚词、代词和日记中的高频套话，作为切分边界；单字不在其中，否则会把“会议”“地铁”“过敏”之类的词切开
+STOP_WORDS = (
+    '今天', '昨天', '明天', '早上', '晚上', '中午', '下午', '上午', '现在', '刚才', '一下', '一点', '一些', '一个', '一起',
+    '然后', '因为', '所以', '但是', '不过', '而且', '如果', '虽然', '还是', '或者', '就是', '可是', '只是', '已经',
+    '感觉', '觉得', '好像', '可能', '应该', '有点', '非常', '特别', '比较', '真的', '自己', '我们', '你们', '他们',
+    '她们', '这个', '那个', '这样', '那样', '什么', '怎么', '为什么', '没有', '不是', '还有', '一直', '有些',
+)
+# 很少作为词开头的单字虚词：片段中前面已有两个字以上时在此处切开
+SEPARATOR_CHARS = frozenset('的了很太挺都也又就还吗呢吧啊呀哦嗯和与把被让给跟从向我你他她它们这那是去')
+# 片段首尾的单字虚词，去掉后仍不少于两个字时才去掉
+LEADING_CHARS = frozenset('我你他她它这那把被让给跟从对向在和与也都就还又很太挺不没是的了着去')
+TRAILING_CHARS = frozenset('的了过吗呢吧啊呀哦嗯得地们')
+ENGLISH_STOP_WORDS = frozenset(
+    'a an the and or but to of in on at for with is are was were be been it this that i you he she we they my'.split()
+)
+
+_CJK = '\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff'
+_CLAUSE_PATTERN = re.compile(f'[{_CJK}]+|[a-z][a-z0-9]+')
+# 长的停用词优先匹配，避免被拆成单字
+_STOP_PATTERN = re.compile('|'.join(sorted(map(re.escape, STOP_WORDS), key=len, reverse=True)))
+
+# 超过该长度的片段按两字一组拆开，避免整句成为一个关键词
+MAX_PHRASE_LENGTH = 4
+
+
+def _split_separators(piece: str) -> List[str]:
+    segments, current = [], ''
+    for char in piece:
+        if char in SEPARATOR_CHARS and len(current) >= 2:
+            segments.append(current)
+            current = ''
+        else:
+            current += char
+    segments.append(current)
+    return segments
+
+
+def _strip_edges(segment: str) -> str:
+    while len(segment) > 2 and segment[0] in LEADING_CHARS:
+        segment = segment[1:]
+    while len(segment) > 2 and segment[-1] in TRAILING_CHARS:
+        segment = segment[:-1]
+    return segment
+
+
+def _split_long(segment: str) -> List[str]:
+    """过长的片段在中间的虚词处切开（两侧都不少于两个字），仍然过长时按两字一组拆开"""
+    if len(segment) <= MAX_PHRASE_LENGTH:
+        return [segment]
+    for i in range(2, len(segment) - 2):
+        if segment[i] in LEADING_CHARS:
+            return _split_long(_strip_edges(segment[:i])) + _split_long(_strip_edges(segment[i + 1:]))
+    return [segment[i:i + 2] for i in range(0, len(segment) - 1, 2)]
+
+
+def _fragments(clause: str) -> List[str]:
+    if not clause[0].isascii():
+        fragments = []
+        for piece in _STOP_PATTERN.split(clause):
+            for segment in map(_strip_edges, _split_separators(piece)):
+                if len(segment) >= 2:
+                    fragments.extend(_split_long(segment))
+        return fragments
+    return [] if clause in ENGLISH_STOP_WORDS else [clause]
+
+
+def extract_keywords(content: str, limit: int = 8) -> List[str]:
+    """从日记文本中提取关键词，本地完成，不依赖网络和分词库。
+
+    以标点和多字停用词切分出候选短语，再在单字虚词处切开、去掉首尾的虚词，按出现次数、长度和首次出现位置排序，返回前 limit 个。
+    """
+    counts = Counter()
+    first_seen = {}
+    for clause in _CLAUSE_PATTERN.findall((content or '').lower()):
+        for fragment in _fragments(clause):
+            counts[fragment] += 1
+            first_seen.setdefault(fragment, len(first_seen))
+
+    ranked = sorted(counts, key=lambda word: (-counts[word], -min(len(word), MAX_PHRASE_LENGTH), first_seen[word]))
+    keywords = []
+    for word in ranked:
+        # 已被更长关键词包含的词不再重复
+        if any(word in chosen for chosen in keywords):
+            continue
+        keywords.append(word)
+        if len(keywords) >= limit:
+            break
+    return keywords
@@ -0,0 +1,275 @@
+import os
+import re
+import time
+import struct
+import hashlib
+import logging
+import operator
+import threading
+from datetime import datetime
+from typing import Dict, List, Any
+from src.models.mcp import UserMemory
+from src.models.user import db
+
+logger = logging.getLogger(__name__)
+
+# 正则兜底提取生成的模板内容，比较相似度时只保留其中的主题
+_TEMPLATE_PATTERN = re.compile(r'^用户提到了关于\s*(.+?)\s*的偏好$')
+_PUNCT_PATTERN = re.compile(r'[\s,，。.!！?？、;；:："“”\'‘’()（）\[\]【】]+')
+
+
+def normalize(content: str) -> str:
+    """去掉模板、标点和空白并转为小写"""
+    content = (content or '').strip()
+    match = _TEMPLATE_PATTERN.match(content)
+    if match:
+        content = match.group(1)
+    return _PUNCT_PATTERN.sub('', content).lower()
+
+
+def is_template(value: str) -> bool:
+    return bool(_TEMPLATE_PATTERN.match((value or '').strip()))
+
+
+def shingles(text: str) -> set:
+    """规范化文本的二字组集合"""
+    if len(text) < 2:
+        return {text}
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+def keys_related(left: str, right: str) -> bool:
+    """关键词互相包含或二字组重合超过一半"""
+    if left in right or right in left:
+        return True
+    left_grams, right_grams = shingles(left), shingles(right)
+    return len(left_grams & right_grams) * 2 > len(left_grams | right_grams)
+
+
+class MemoryConsolidator:
+    """用户记忆去重与合并。
+
+    同一类型的记忆以“关键词 + 内容”的二字组作为 shingle 计算 MinHash 签名，通过 LSH 分桶找出候选对，
+    估计的 Jaccard 相似度达到阈值且关键词相关，或规范化后的关键词相同即视为重复；
+    正则兜底生成的模板记忆不参与上述比较，主题出现在其他记忆中时只并入最匹配的一条（关键词与主题相同或包含主题优先，
+    其次置信度高），因此模板只会被删除，不会把两条本不重复的记忆连到同一簇。
+    每个重复簇保留一条（优先非模板内容、置信度高、更新时间新的记录），
+    置信度按 1 - ∏(1 - c) 聚合，标签取并集，其余记录删除。
+    """
+
+    def __init__(self, num_perm: int = 32, bands: int = 8, cache_size: int = 200000):
+        self.threshold = float(os.environ.get('MEMORY_SIMILARITY_THRESHOLD', 0.6))
+        self.interval_hours = float(os.environ.get('MEMORY_CONSOLIDATION_INTERVAL_HOURS', 6))
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        # 每个 64 字节的 blake2b 摘要提供 8 个独立的 64 位哈希，用不同的 salt 凑够 num_perm 个
+        self._salts = [f'memory-{i}'.encode() for i in range(num_perm // 8)]
+        self._signatures = {}  # 规范化文本 -> 签名，定期合并时未变化的记忆无需重新计算
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self._stats = {}  # user_id -> 统计
+
+    def signature(self, content: str):
+        signature = self._signatures.get(content)
+        if signature is None:
+            rows = []
+            for shingle in shingles(content):
+                data = shingle.encode('utf-8')
+                values = ()
+                for salt in self._salts:
+                    values += struct.unpack('<8Q', hashlib.blake2b(data, digest_size=64, salt=salt).digest())
+                rows.append(values)
+            signature = tuple(map(min, zip(*rows)))
+            if len(self._signatures) >= self.cache_size:
+                self._signatures.clear()
+            self._signatures[content] = signature
+        return signature
+
+    def similarity(self, left, right) -> float:
+        return sum(map(operator.eq, left, right)) / self.num_perm
+
+    def find_clusters(self, memories: List[UserMemory]) -> List[List[UserMemory]]:
+        """返回包含两条及以上记忆的重复簇"""
+        parent = list(range(len(memories)))
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        def union(i, j):
+            root_i, root_j = find(i), find(j)
+            if root_i != root_j:
+                parent[root_j] = root_i
+
+        signatures = []
+        keys = []
+        buckets = {}
+        exact = {}
+        for index, memory in enumerate(memories):
+            key = normalize(memory.key)
+            keys.append(key)
+            signatures.append(None)
+            if is_template(memory.value):
+                continue
+            # 规范化后的关键词相同直接合并
+            identity = (memory.memory_type, key)
+            if key and identity in exact:
+                union(exact[identity], index)
+            else:
+                exact[identity] = index
+
+            signature = self.signature(f"{key}{normalize(memory.value)}")
+            signatures[index] = signature
+            # 关键词相关的两条记忆至少有一个共同的关键词二字组，分桶时一并作为桶键，
+            # 避免措辞相同但主题不同的记忆落入同一个大桶
+            bands = [(band, hash(signature[band * self.rows:(band + 1) * self.rows])) for band in range(self.bands)]
+            for gram in shingles(key):
+                for band in bands:
+                    buckets.setdefault((memory.memory_type, gram, band), []).append(index)
+
+        checked = set()
+        for candidates in buckets.values():
+            for position, i in enumerate(candidates):
+                for j in candidates[position + 1:]:
+                    if (i, j) in checked:
+                        continue
+                    checked.add((i, j))
+                    # 内容常有“喜欢”“经常”之类的共同措辞，还需关键词相关才合并
+                    if self.similarity(signatures[i], signatures[j]) >= self.threshold and \
+                            keys_related(keys[i], keys[j]):
+                        union(i, j)
+
+        # 模板记忆信息量少，主题包含在同类型其他记忆的关键词或内容中即视为重复；
+        # 在非模板记忆分簇之后再并入，每条模板只并入一个簇
+        self._match_templates(memories, union)
+
+        clusters = {}
+        for index, memory in enumerate(memories):
+            clusters.setdefault(find(index), []).append(memory)
+        return [cluster for cluster in clusters.values() if len(cluster) > 1]
+
+    @staticmethod
+    def _match_templates(memories: List[UserMemory], union):
+        """把每条模板记忆并入最匹配的一条非模板记忆，主题相同的模板记忆互相合并"""
+        postings = {}
+        texts = {}
+        for index, memory in enumerate(memories):
+            if is_template(memory.value):
+                continue
+            text = normalize(memory.key) + normalize(memory.value)
+            texts[index] = text
+            for gram in set(text[i:i + 2] for i in range(max(len(text) - 1, 1))):
+                postings.setdefault((memory.memory_type, gram), set()).add(index)
+
+        topics = {}
+        for index, memory in enumerate(memories):
+            if not is_template(memory.value):
+                continue
+            topic = normalize(memory.value)
+            same_topic = topics.setdefault((memory.memory_type, topic), index)
+            if same_topic != index:
+                union(same_topic, index)
+                continue
+            grams = set(topic[i:i + 2] for i in range(max(len(topic) - 1, 1)))
+            candidates = None
+            for gram in grams:
+                found = postings.get((memory.memory_type, gram), set())
+                candidates = found if candidates is None else candidates & found
+                if not candidates:
+                    break
+            matches = [other for other in candidates or () if topic in texts[other]]
+            if matches:
+                best = max(matches, key=lambda other: (
+                    normalize(memories[other].key) == topic, topic in normalize(memories[other].key),
+                    memories[other].confidence or 0.0, -memories[other].id
+                ))
+                union(best, index)
+
+    @staticmethod
+    def _survivor(cluster: List[UserMemory]) -> UserMemory:
+        return max(cluster, key=lambda m: (
+            not is_template(m.value), m.confidence or 0.0, m.updated_at or datetime.min, -m.id
+        ))
+
+    def consolidate_user(self, user_id: int, dry_run: bool = False) -> Dict[str, Any]:
+        """合并一个用户的重复记忆，需在应用上下文中调用"""
+        started = time.monotonic()
+        memories = UserMemory.query.filter(UserMemory.user_id == user_id).all()
+        clusters = self.find_clusters(memories)
+
+        removed_ids = []
+        merges = []
+        for cluster in clusters:
+            survivor = self._survivor(cluster)
+            others = [m for m in cluster if m.id != survivor.id]
+            remaining = 1.0
+            for memory in cluster:
+                remaining *= 1.0 - min(max(memory.confidence or 0.0, 0.0), 1.0)
+            tags = list(dict.fromkeys(tag for memory in [survivor] + others for tag in (memory.tags or [])))
+            merges.append({'kept': survivor.key, 'merged': [m.key for m in others]})
+            if dry_run:
+                continue
+            survivor.confidence = round(1.0 - remaining, 4)
+            survivor.tags = tags
+            survivor.updated_at = max(m.updated_at or datetime.min for m in cluster)
+            removed_ids.extend(m.id for m in others)
+
+        if not dry_run and removed_ids:
+            try:
+                UserMemory.query.filter(UserMemory.id.in_(removed_ids)).delete(synchronize_session=False)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+
+        result = {
+            'user_id': user_id,
+            'scanned': len(memories),
+            'clusters': len(clusters),
+            'removed': sum(len(m['merged']) for m in merges),
+            'duration_ms': round((time.monotonic() - started) * 1000, 1),
+            'dry_run': dry_run,
+            'merges': merges[:50]
+        }
+        if not dry_run:
+            self._record(user_id, result)
+            if result['removed']:
+                logger.info(f"用户 {user_id} 记忆合并完成：{len(clusters)} 个重复簇，删除 {result['removed']} 条")
+        return result
+
+    def consolidate_all(self) -> List[Dict[str, Any]]:
+        """合并所有用户的重复记忆（定时任务调用）"""
+        user_ids = [row[0] for row in db.session.query(UserMemory.user_id).distinct()]
+        results = []
+        for user_id in user_ids:
+            try:
+                results.append(self.consolidate_user(user_id))
+            except Exception as e:
+                logger.error(f"合并用户 {user_id} 的记忆失败: {e}")
+        return results
+
+    def _record(self, user_id, result):
+        with self._lock:
+            stats = self._stats.setdefault(user_id, {'runs': 0, 'clusters_merged': 0, 'memories_removed': 0})
+            stats['runs'] += 1
+            stats['clusters_merged'] += result['clusters']
+            stats['memories_removed'] += result['removed']
+            stats['last_run'] = datetime.utcnow().isoformat()
+            stats['last_scanned'] = result['scanned']
+            stats['last_removed'] = result['removed']
+            stats['last_duration_ms'] = result['duration_ms']
+
+    def get_stats(self, user_id: int) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats.get(user_id, {'runs': 0, 'clusters_merged': 0, 'memories_removed': 0,
+                                                   'last_run': None}))
+        stats['threshold'] = self.threshold
+        stats['interval_hours'] = self.interval_hours
+        return stats
+
+
+# 全局记忆合并实例
+memory_consolidator = MemoryConsolidator()
@@ -0,0 +1,195 @@
+import re
+import logging
+from typing import List, Tuple, Optional
+from sqlalchemy import event, inspect, text
+from src.models.mcp import UserMemory
+from src.models.user import db
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = 'user_memory_fts'
+
+# 汉字按字切分，英文和数字按词切分
+_TOKEN_PATTERN = re.compile('[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+|[a-z0-9]+')
+_CJK_PATTERN = re.compile('[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]')
+
+# 查询词数量上限，避免整篇日记生成过长的 MATCH 表达式
+MAX_QUERY_TERMS = 64
+
+
+def _runs(content: str) -> List[str]:
+    return _TOKEN_PATTERN.findall((content or '').lower())
+
+
+def index_tokens(content: str) -> str:
+    """生成写入全文索引的词串：中文同时保留单字和相邻二字组，英文数字保留整词"""
+    tokens = []
+    for run in _runs(content):
+        if _CJK_PATTERN.match(run):
+            tokens.extend(run)
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    return ' '.join(tokens)
+
+
+def query_terms(content: str) -> List[str]:
+    """把查询文本切分为检索词：中文取二字组（单字查询保留单字），去重并保持顺序"""
+    terms = []
+    for run in _runs(content):
+        if _CJK_PATTERN.match(run):
+            terms.extend([run] if len(run) == 1 else [run[i:i + 2] for i in range(len(run) - 1)])
+        else:
+            terms.append(run)
+    return list(dict.fromkeys(terms))[:MAX_QUERY_TERMS]
+
+
+class MemorySearchIndex:
+    """用户记忆全文检索。
+
+    使用 SQLite FTS5 虚拟表 user_memory_fts（rowid 与 user_memories.id 一致），
+    中文在写入前切分为单字和二字组，检索结果按 bm25 相关度 × 置信度排序。
+    新增和修改通过 ORM 事件同步，删除由数据库触发器同步（批量删除同样生效）；
+    SQLite 不支持 FTS5 时退回 LIKE 匹配。
+    """
+
+    def __init__(self):
+        self._ready = set()  # 已建立全文索引的数据库 URL
+
+    def is_available(self, engine=None) -> bool:
+        engine = engine or db.engine
+        return str(engine.url) in self._ready
+
+    def ensure_index(self, engine=None):
+        """创建全文索引表和删除触发器，索引与记忆表数量不一致时重建"""
+        engine = engine or db.engine
+        if engine.dialect.name != 'sqlite':
+            return
+        try:
+            with engine.begin() as connection:
+                connection.execute(text(
+                    f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(key_tokens, value_tokens)'
+                ))
+                connection.execute(text(f"""
+                    CREATE TRIGGER IF NOT EXISTS user_memories_fts_delete AFTER DELETE ON user_memories
+                    BEGIN
+                        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+                    END
+                """))
+                memory_count = connection.execute(text('SELECT COUNT(*) FROM user_memories')).scalar()
+                indexed_count = connection.execute(text(f'SELECT COUNT(*) FROM {FTS_TABLE}')).scalar()
+                if memory_count != indexed_count:
+                    self._rebuild(connection)
+                    logger.info(f"记忆全文索引已重建，共 {memory_count} 条")
+            self._ready.add(str(engine.url))
+        except Exception as e:
+            logger.error(f"初始化记忆全文索引失败，将使用LIKE匹配: {e}")
+
+    def _rebuild(self, connection, batch_size=1000):
+        connection.execute(text(f'DELETE FROM {FTS_TABLE}'))
+        rows = connection.execute(text('SELECT id, key, value FROM user_memories')).fetchall()
+        for start in range(0, len(rows), batch_size):
+            connection.execute(
+                text(f'INSERT INTO {FTS_TABLE} (rowid, key_tokens, value_tokens) VALUES (:id, :k, :v)'),
+                [{'id': row[0], 'k': index_tokens(row[1]), 'v': index_tokens(row[2])}
+                 for row in rows[start:start + batch_size]]
+            )
+
+    def index_rows(self, connection, rows):
+        """写入或覆盖索引，rows 为 (id, key, value) 序列，需与记忆写入处于同一事务"""
+        if not rows or not self.is_available(connection.engine):
+            return
+        params = [{'id': row[0], 'k': index_tokens(row[1]), 'v': index_tokens(row[2])} for row in rows]
+        connection.execute(text(f'DELETE FROM {FTS_TABLE} WHERE rowid = :id'), params)
+        connection.execute(
+            text(f'INSERT INTO {FTS_TABLE} (rowid, key_tokens, value_tokens) VALUES (:id, :k, :v)'),
+            params
+        )
+
+    def rank(self, user_id: int, query: str, limit: Optional[int] = 10, memory_type: str = None,
+             match_all: bool = False) -> List[Tuple[int, float]]:
+        """返回按相关度排序的 (记忆ID, 相关度)。
+
+        match_all=False 时任一检索词命中即可，适合用整段日记召回记忆；
+        match_all=True 时要求全部检索词命中，适合用户输入的搜索词。
+        """
+        return self._rank_terms(user_id, query_terms(query), [query], limit, memory_type, match_all)
+
+    def rank_keywords(self, user_id: int, keywords: List[str], limit: Optional[int] = 10,
+                      memory_type: str = None) -> List[Tuple[int, float]]:
+        """用一组关键词批量检索，一次查询返回命中任一关键词的记忆（已去重）"""
+        terms = list(dict.fromkeys(term for keyword in keywords for term in query_terms(keyword)))
+        return self._rank_terms(user_id, terms[:MAX_QUERY_TERMS], keywords, limit, memory_type, False)
+
+    def _rank_terms(self, user_id, terms, phrases, limit, memory_type, match_all):
+        if not terms:
+            return []
+        if not self.is_available():
+            return self._rank_like(user_id, phrases, limit, memory_type)
+
+        # 英文词使用前缀匹配，中文词为完整的二字组或单字
+        expressions = [f'"{term}"' if _CJK_PATTERN.match(term) else f'"{term}"*' for term in terms]
+        match = (' AND ' if match_all else ' OR ').join(expressions)
+        sql = f"""
+            SELECT m.id, bm25({FTS_TABLE}, 2.0, 1.0) * COALESCE(m.confidence, 1.0) AS score
+            FROM {FTS_TABLE} JOIN user_memories m ON m.id = {FTS_TABLE}.rowid
+            WHERE {FTS_TABLE} MATCH :match AND m.user_id = :user_id
+            {'AND m.memory_type = :memory_type' if memory_type else ''}
+            ORDER BY score, m.id
+            LIMIT :limit
+        """
+        params = {'match': match, 'user_id': user_id, 'memory_type': memory_type,
+                  'limit': limit if limit is not None else -1}
+        # bm25 越小越相关，取反后作为相关度
+        return [(row[0], round(-row[1], 6)) for row in db.session.execute(text(sql), params)]
+
+    def _rank_like(self, user_id, phrases, limit, memory_type):
+        memories = UserMemory.query.filter(
+            UserMemory.user_id == user_id,
+            db.or_(*[condition for phrase in phrases
+                     for condition in (UserMemory.key.contains(phrase), UserMemory.value.contains(phrase))])
+        )
+        if memory_type:
+            memories = memories.filter(UserMemory.memory_type == memory_type)
+        memories = memories.order_by(UserMemory.confidence.desc()).with_entities(UserMemory.id, UserMemory.confidence)
+        if limit is not None:
+            memories = memories.limit(limit)
+        return [(memory_id, confidence or 0.0) for memory_id, confidence in memories]
+
+    def search(self, user_id: int, query: str, limit: Optional[int] = 10, memory_type: str = None,
+               match_all: bool = False) -> List[Tuple[UserMemory, float]]:
+        """检索记忆，返回按相关度排序的 (UserMemory, 相关度)"""
+        return self._with_memories(self.rank(user_id, query, limit, memory_type, match_all))
+
+    def search_keywords(self, user_id: int, keywords: List[str], limit: Optional[int] = 10,
+                        memory_type: str = None) -> List[Tuple[UserMemory, float]]:
+        """按关键词批量检索记忆，返回按相关度排序的 (UserMemory, 相关度)"""
+        return self._with_memories(self.rank_keywords(user_id, keywords, limit, memory_type))
+
+    def _with_memories(self, ranked):
+        scores = dict(ranked)
+        return [(memory, scores[memory.id]) for memory in self.load([memory_id for memory_id, _ in ranked])]
+
+    @staticmethod
+    def load(memory_ids: List[int]) -> List[UserMemory]:
+        """按给定顺序加载记忆"""
+        if not memory_ids:
+            return []
+        memories = {m.id: m for m in UserMemory.query.filter(UserMemory.id.in_(memory_ids)).all()}
+        return [memories[memory_id] for memory_id in memory_ids if memory_id in memories]
+
+
+# 全局记忆检索实例
+memory_search = MemorySearchIndex()
+
+
+@event.listens_for(UserMemory, 'after_insert')
+def _index_after_insert(mapper, connection, target):
+    memory_search.index_rows(connection, [(target.id, target.key, target.value)])
+
+
+@event.listens_for(UserMemory, 'after_update')
+def _index_after_update(mapper, connection, target):
+    state = inspect(target)
+    if state.attrs.key.history.has_changes() or state.attrs.value.history.has_changes():
+        memory_search.index_rows(connection, [(target.id, target.key, target.value)])
@@ -0,0 +1,428 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Tuple, Optional, Any
+from src.models.mcp import UserMemory
+from src.models.user import db
+from src.mcp.memory_search import index_tokens
+
+try:
+    import numpy as np  # 语义检索为可选功能，未安装 numpy 时只使用全文检索
+    _HAS_NUMPY = True
+except Exception:
+    np = None
+    _HAS_NUMPY = False
+
+logger = logging.getLogger(__name__)
+
+RECALL_MODES = ('lexical', 'semantic', 'hybrid')
+
+
+def memory_text(key: str, value: str) -> str:
+    """用于生成向量的记忆文本"""
+    return f"{key}：{value}"
+
+
+class EmbeddingClient:
+    """文本向量化。
+
+    默认通过已配置的 OpenAI 兼容接口的 embeddings 端点计算；MEMORY_EMBEDDING_BACKEND=local 时
+    使用本地的特征哈希向量（按 index_tokens 切词后散列到固定维度），无需网络，供测试和基准使用。
+    结果按内容哈希缓存，返回 L2 归一化的 float32 矩阵。
+    """
+
+    def __init__(self):
+        self.backend = os.environ.get('MEMORY_EMBEDDING_BACKEND', 'api')
+        self.model = os.environ.get('MEMORY_EMBEDDING_MODEL', 'text-embedding-3-small')
+        self.local_dim = int(os.environ.get('MEMORY_EMBEDDING_DIM', 256))
+        self.batch_size = int(os.environ.get('MEMORY_EMBEDDING_BATCH', 64))
+        self.cache_size = 20000
+        self._cache = OrderedDict()  # 内容哈希 -> 向量
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.cache_hits = 0
+
+    @property
+    def name(self) -> str:
+        return f"local-{self.local_dim}" if self.backend == 'local' else self.model
+
+    def content_hash(self, text: str) -> str:
+        return hashlib.sha256(f"{self.name}\n{text}".encode('utf-8')).hexdigest()[:32]
+
+    def embed(self, texts: List[str], hashes: List[str] = None):
+        hashes = hashes or [self.content_hash(text) for text in texts]
+        vectors = [None] * len(texts)
+        missing = []
+        with self._lock:
+            for index, content_hash in enumerate(hashes):
+                cached = self._cache.get(content_hash)
+                if cached is not None:
+                    self._cache.move_to_end(content_hash)
+                    vectors[index] = cached
+                    self.cache_hits += 1
+                else:
+                    missing.append(index)
+
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start:start + self.batch_size]
+            computed = self._compute([texts[index] for index in batch])
+            with self._lock:
+                for index, vector in zip(batch, computed):
+                    vectors[index] = vector
+                    self._cache[hashes[index]] = vector
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        if not vectors:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.vstack(vectors)
+
+    def _compute(self, texts: List[str]):
+        if self.backend == 'local':
+            matrix = np.vstack([self._local_vector(text) for text in texts])
+        else:
+            from src.services.ai_service import ai_service
+            ai_service._load_config()
+            if not ai_service.client:
+                raise RuntimeError("AI服务未配置，无法计算向量")
+            response = ai_service.client.embeddings.create(model=self.model, input=texts)
+            self.requests += 1
+            matrix = np.asarray([item.embedding for item in response.data], dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return list(matrix / norms)
+
+    def _local_vector(self, text: str):
+        vector = np.zeros(self.local_dim, dtype=np.float32)
+        for token in index_tokens(text).split():
+            digest = int.from_bytes(hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest(), 'little')
+            # 二字组比单字更能区分语义，权重更高
+            weight = 1.0 if len(token) == 1 else 2.0
+            vector[digest % self.local_dim] += weight if (digest >> 63) & 1 else -weight
+        return vector
+
+
+class _UserVectors:
+    """单个用户的向量矩阵，保存为内存映射文件：向量（.f32）、记忆ID（.ids）、内容哈希（.sha），
+    元数据（.json）只记录维度、容量和行数。
+
+    文件按容量预留行，追加时写入空闲行，容量不足时翻倍；删除时用最后一行填补空位，
+    因此每次更新只改动涉及的行。
+    """
+
+    FILES = (('f32', 'float32'), ('ids', 'int64'), ('sha', 'S32'))
+
+    def __init__(self, path: str, dim: int):
+        self.path = path
+        self.dim = dim
+        self.ids = []
+        self.hashes = []
+        self.positions = {}  # 记忆ID -> 行号
+        self.capacity = 0
+        self.arrays = {}  # 后缀 -> np.memmap
+        self.db_state = None
+        self.lock = threading.Lock()
+
+    @property
+    def count(self) -> int:
+        return len(self.ids)
+
+    @property
+    def matrix(self):
+        return self.arrays.get('f32')
+
+    def _shape(self, suffix, capacity):
+        return (capacity, self.dim) if suffix == 'f32' else (capacity,)
+
+    def load(self) -> bool:
+        try:
+            with open(f"{self.path}.json", 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta.get('dim') != self.dim:
+                return False
+            capacity, count = meta['capacity'], meta['count']
+            arrays = {}
+            if capacity:
+                for suffix, dtype in self.FILES:
+                    arrays[suffix] = np.memmap(f"{self.path}.{suffix}", dtype=dtype, mode='r+',
+                                               shape=self._shape(suffix, capacity))
+            self.capacity = capacity
+            self.arrays = arrays
+            self.ids = arrays['ids'][:count].tolist() if count else []
+            self.hashes = [h.decode() for h in arrays['sha'][:count]] if count else []
+            self.positions = {memory_id: row for row, memory_id in enumerate(self.ids)}
+            self.db_state = meta.get('db_state')
+            return True
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            logger.warning(f"加载记忆向量索引失败，将重新生成: {e}")
+            self.ids, self.hashes, self.positions, self.capacity, self.arrays = [], [], {}, 0, {}
+            return False
+
+    def save(self):
+        for array in self.arrays.values():
+            array.flush()
+        meta = {'dim': self.dim, 'capacity': self.capacity, 'count': self.count, 'db_state': self.db_state}
+        temp_path = f"{self.path}.json.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(temp_path, f"{self.path}.json")
+
+    def _grow(self, needed: int):
+        capacity = max(64, self.capacity)
+        while capacity < needed:
+            capacity *= 2
+        arrays = {}
+        for suffix, dtype in self.FILES:
+            temp_path = f"{self.path}.{suffix}.tmp"
+            array = np.memmap(temp_path, dtype=dtype, mode='w+', shape=self._shape(suffix, capacity))
+            if self.count:
+                array[:self.count] = self.arrays[suffix][:self.count]
+            array.flush()
+            del array
+            os.replace(temp_path, f"{self.path}.{suffix}")
+            arrays[suffix] = np.memmap(f"{self.path}.{suffix}", dtype=dtype, mode='r+',
+                                       shape=self._shape(suffix, capacity))
+        self.arrays = arrays
+        self.capacity = capacity
+
+    def _write(self, row, memory_id, content_hash, vector):
+        self.arrays['f32'][row] = vector
+        self.arrays['ids'][row] = memory_id
+        self.arrays['sha'][row] = content_hash.encode()
+
+    def upsert(self, memory_ids: List[int], hashes: List[str], vectors):
+        new = sum(1 for memory_id in memory_ids if memory_id not in self.positions)
+        if self.count + new > self.capacity:
+            self._grow(self.count + new)
+        for memory_id, content_hash, vector in zip(memory_ids, hashes, vectors):
+            row = self.positions.get(memory_id)
+            if row is None:
+                row = self.count
+                self.ids.append(memory_id)
+                self.hashes.append(content_hash)
+                self.positions[memory_id] = row
+            else:
+                self.hashes[row] = content_hash
+            self._write(row, memory_id, content_hash, vector)
+
+    def remove(self, memory_ids: List[int]):
+        for memory_id in memory_ids:
+            row = self.positions.pop(memory_id, None)
+            if row is None:
+                continue
+            last = self.count - 1
+            if row != last:
+                moved = self.ids[last]
+                self.ids[row] = moved
+                self.hashes[row] = self.hashes[last]
+                self.positions[moved] = row
+                self._write(row, moved, self.hashes[last], self.matrix[last])
+            self.ids.pop()
+            self.hashes.pop()
+
+    def top_k(self, query_vector, limit: int) -> List[Tuple[int, float]]:
+        if not self.count:
+            return []
+        # 向量已归一化，一次矩阵乘法得到全部余弦相似度
+        scores = self.matrix[:self.count] @ query_vector
+        limit = min(limit, self.count)
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top])]
+        return [(self.ids[row], float(scores[row])) for row in top]
+
+
+class MemoryVectorIndex:
+    """用户记忆语义检索。
+
+    每个用户一份向量矩阵，持久化到 MEMORY_VECTOR_DIR 下的内存映射文件，重启后直接加载而不重新计算。
+    写入和删除记忆时增量更新；检索前比较数据库中记忆的数量和最后更新时间，
+    其他途径（批量删除、合并等）造成的差异按内容哈希补齐，只为新增或修改的记忆计算向量。
+    MEMORY_RECALL_MODE 为 semantic 或 hybrid 时 query_user_profile 默认使用语义检索。
+    """
+
+    def __init__(self):
+        mode = os.environ.get('MEMORY_RECALL_MODE', 'lexical')
+        self.mode = mode if mode in RECALL_MODES else 'lexical'
+        self.directory = os.environ.get('MEMORY_VECTOR_DIR') or os.path.join(
+            os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'database', 'vectors'
+        )
+        self.max_query_chars = 2000
+        self.embedder = EmbeddingClient()
+        self._users = {}  # user_id -> _UserVectors
+        self._lock = threading.Lock()
+        self.searches = 0
+        self.syncs = 0
+
+    @property
+    def available(self) -> bool:
+        return _HAS_NUMPY
+
+    @property
+    def active(self) -> bool:
+        """是否需要在写入记忆时维护向量索引"""
+        return _HAS_NUMPY and self.mode != 'lexical'
+
+    def _dimension(self) -> Optional[int]:
+        if self.embedder.backend == 'local':
+            return self.embedder.local_dim
+        return None
+
+    def _get(self, user_id: int, dim: int = None) -> Optional[_UserVectors]:
+        with self._lock:
+            vectors = self._users.get(user_id)
+            if vectors is not None:
+                return vectors
+            directory = os.path.join(self.directory, self.embedder.name.replace('/', '_'))
+            path = os.path.join(directory, f"user_{user_id}")
+            dim = dim or self._dimension() or self._stored_dimension(path)
+            if dim is None:
+                return None
+            os.makedirs(directory, exist_ok=True)
+            vectors = _UserVectors(path, dim)
+            vectors.load()
+            self._users[user_id] = vectors
+            return vectors
+
+    @staticmethod
+    def _stored_dimension(path: str) -> Optional[int]:
+        try:
+            with open(f"{path}.json", 'r', encoding='utf-8') as f:
+                return json.load(f).get('dim')
+        except Exception:
+            return None
+
+    def _embed_rows(self, rows):
+        texts = [memory_text(key, value) for _, key, value in rows]
+        hashes = [self.embedder.content_hash(text) for text in texts]
+        return hashes, self.embedder.embed(texts, hashes)
+
+    def update_memories(self, user_id: int, rows: List[Tuple[int, str, str]], states=None):
+        """新增或修改记忆后增量更新向量，rows 为 (id, key, value)，states 为写入前后 read_state 的结果"""
+        if not self.active or not rows:
+            return
+        hashes, matrix = self._embed_rows(rows)
+        vectors = self._get(user_id, matrix.shape[1])
+        with vectors.lock:
+            vectors.upsert([row[0] for row in rows], hashes, matrix)
+            self._advance(vectors, states)
+            vectors.save()
+
+    def remove_memories(self, user_id: int, memory_ids: List[int], states=None):
+        """删除记忆后移除对应向量，states 同 update_memories"""
+        if not self.active or not memory_ids:
+            return
+        vectors = self._get(user_id)
+        if vectors is None:
+            return
+        with vectors.lock:
+            vectors.remove(memory_ids)
+            self._advance(vectors, states)
+            vectors.save()
+
+    @staticmethod
+    def _advance(vectors: _UserVectors, states):
+        # 写入前索引已与数据库一致时，增量更新后同样一致，记下写入后的状态，下次检索不必全量对齐
+        if states and states[0] is not None and vectors.db_state == states[0]:
+            vectors.db_state = states[1]
+
+    @staticmethod
+    def read_state(user_id: int):
+        """读取用户记忆的 (数量, 最大ID, 最近更新时间)，用于判断向量索引是否需要对齐，需在应用上下文中调用"""
+        count, last_id, last_updated = db.session.query(
+            db.func.count(UserMemory.id), db.func.max(UserMemory.id), db.func.max(UserMemory.updated_at)
+        ).filter(UserMemory.user_id == user_id).one()
+        return [count, last_id, last_updated.isoformat() if last_updated else None]
+
+    def snapshot(self, user_id: int):
+        """读取检索前需要的数据库状态，返回 (state, rows)，rows 为 (id, key, value)，
+        向量索引已与数据库一致时 rows 为 None。需在应用上下文中、由持有数据库会话的线程调用"""
+        vectors = self._get(user_id)
+        state = self.read_state(user_id)
+        if vectors is not None and vectors.db_state == state:
+            return state, None
+        rows = db.session.query(UserMemory.id, UserMemory.key, UserMemory.value).filter(
+            UserMemory.user_id == user_id
+        ).all()
+        return state, [(row.id, row.key, row.value) for row in rows]
+
+    def sync(self, user_id: int, rows: List[Tuple[int, str, str]], state,
+             vectors: _UserVectors = None) -> _UserVectors:
+        """按内容哈希把向量索引与 snapshot 读出的记忆对齐，不访问数据库"""
+        hashes = {memory_id: self.embedder.content_hash(memory_text(key, value)) for memory_id, key, value in rows}
+
+        vectors = vectors or self._get(user_id)
+        stale = rows
+        if vectors is not None:
+            stale = [row for row in rows if vectors.positions.get(row[0]) is None or
+                     vectors.hashes[vectors.positions[row[0]]] != hashes[row[0]]]
+        matrix = None
+        if stale:
+            _, matrix = self._embed_rows(stale)
+            vectors = vectors or self._get(user_id, matrix.shape[1])
+        if vectors is None:
+            return None
+
+        with vectors.lock:
+            vectors.remove([memory_id for memory_id in list(vectors.positions) if memory_id not in hashes])
+            if stale:
+                vectors.upsert([row[0] for row in stale], [hashes[row[0]] for row in stale], matrix)
+            vectors.db_state = state
+            vectors.save()
+        self.syncs += 1
+        return vectors
+
+    def search(self, user_id: int, query: str, limit: int, state, rows=None) -> List[Tuple[int, float]]:
+        """按 snapshot 的结果做语义检索，只计算向量和相似度、不访问数据库，可以在线程中执行"""
+        if not _HAS_NUMPY:
+            raise RuntimeError("未安装 numpy，无法使用语义检索")
+        query = (query or '').strip()[:self.max_query_chars]
+        if not query:
+            return []
+        vectors = self._get(user_id)
+        if rows is not None and (vectors is None or vectors.db_state != state):
+            vectors = self.sync(user_id, rows, state, vectors)
+        if vectors is None:
+            return []
+        query_vector = self.embedder.embed([query])[0]
+        self.searches += 1
+        with vectors.lock:
+            return vectors.top_k(query_vector, limit)
+
+    def rank(self, user_id: int, query: str, limit: int = 10) -> List[Tuple[int, float]]:
+        """语义检索，返回按余弦相似度排序的 (记忆ID, 相似度)，需在应用上下文中调用"""
+        return self.search(user_id, query, limit, *self.snapshot(user_id))
+
+    @staticmethod
+    def fuse(*rankings: List[Tuple[int, float]], limit: int = 10, k: int = 60) -> List[Tuple[int, float]]:
+        """按倒数排名融合多路检索结果（RRF）"""
+        scores = {}
+        for ranking in rankings:
+            for position, (memory_id, _) in enumerate(ranking):
+                scores[memory_id] = scores.get(memory_id, 0.0) + 1.0 / (k + position + 1)
+        fused = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+        return [(memory_id, round(score, 6)) for memory_id, score in fused]
+
+    def get_stats(self, user_id: int = None) -> Dict[str, Any]:
+        stats = {
+            'mode': self.mode,
+            'available': self.available,
+            'model': self.embedder.name,
+            'embedding_requests': self.embedder.requests,
+            'cache_hits': self.embedder.cache_hits,
+            'searches': self.searches,
+            'syncs': self.syncs
+        }
+        vectors = self._users.get(user_id) if user_id is not None else None
+        if vectors is not None:
+            stats['vectors'] = vectors.count
+            stats['dim'] = vectors.dim
+        return stats
+
+
+# 全局记忆向量检索实例
+memory_vectors = MemoryVectorIndex()
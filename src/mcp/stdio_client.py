@@ -0,0 +1,310 @@
+import os
+import json
+import asyncio
+import logging
+import itertools
+from typing import Dict, List, Optional, Any
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+PROTOCOL_VERSION = "2024-11-05"
+CLIENT_INFO = {"name": "ai-diary", "version": "1.0"}
+
+
+class MCPError(Exception):
+    """MCP 服务器返回的 JSON-RPC 错误"""
+
+    def __init__(self, code, message, data=None):
+        super().__init__(f"[{code}] {message}")
+        self.code = code
+        self.data = data
+
+
+class StdioMCPClient:
+    """通过标准输入输出与 MCP 服务器子进程通信的 JSON-RPC 客户端。
+
+    子进程启动并完成 initialize 握手后保持常驻，所有请求共用同一对管道，
+    以请求 ID 区分响应，因此多个工具调用可以同时进行。必须在同一个事件循环中使用。
+    """
+
+    def __init__(self, name: str, command: str, args: List[str] = None, env: Dict[str, str] = None,
+                 request_timeout: float = 30.0):
+        self.name = name
+        self.command = command
+        self.args = list(args or [])
+        self.env = dict(env or {})
+        self.request_timeout = request_timeout
+        self.process = None
+        self.server_info = {}
+        self.tools = []
+        self.started_at = None
+        self.last_error = None
+        self._ids = itertools.count(1)
+        self._pending = {}  # 请求ID -> Future
+        self._reader = None
+        self._stderr_reader = None
+        self._write_lock = asyncio.Lock()
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.returncode is None and \
+            self._reader is not None and not self._reader.done()
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._pending)
+
+    async def start(self):
+        """启动子进程并完成握手"""
+        env = os.environ.copy()
+        env.update({str(k): str(v) for k, v in self.env.items()})
+        self.process = await asyncio.create_subprocess_exec(
+            self.command, *[str(arg) for arg in self.args],
+            stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+            env=env, limit=16 * 1024 * 1024
+        )
+        self._reader = asyncio.create_task(self._read_loop())
+        self._stderr_reader = asyncio.create_task(self._drain_stderr())
+        try:
+            result = await self.request("initialize", {
+                "protocolVersion": PROTOCOL_VERSION,
+                "capabilities": {},
+                "clientInfo": CLIENT_INFO
+            })
+            self.server_info = result.get("serverInfo", {}) if isinstance(result, dict) else {}
+            await self.notify("notifications/initialized")
+            self.tools = await self.list_tools()
+        except Exception as e:
+            self.last_error = str(e)
+            await self.close()
+            raise
+        self.started_at = datetime.now()
+        self.last_error = None
+        logger.info(f"MCP服务器 {self.name} 已启动，PID: {self.process.pid}，工具数: {len(self.tools)}")
+
+    async def request(self, method: str, params: Dict[str, Any] = None, timeout: float = None) -> Any:
+        """发送请求并等待对应ID的响应"""
+        if not self.alive:
+            raise ConnectionError(f"MCP服务器 {self.name} 未运行")
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        message = {"jsonrpc": "2.0", "id": request_id, "method": method}
+        if params is not None:
+            message["params"] = params
+        try:
+            await self._send(message)
+            return await asyncio.wait_for(future, timeout or self.request_timeout)
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def notify(self, method: str, params: Dict[str, Any] = None):
+        message = {"jsonrpc": "2.0", "method": method}
+        if params is not None:
+            message["params"] = params
+        await self._send(message)
+
+    async def _send(self, message):
+        data = (json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8")
+        async with self._write_lock:
+            self.process.stdin.write(data)
+            await self.process.stdin.drain()
+
+    async def _read_loop(self):
+        stdout = self.process.stdout
+        try:
+            while True:
+                line = await stdout.readline()
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"MCP服务器 {self.name} 输出了无法解析的内容: {line[:200]!r}")
+                    continue
+                future = self._pending.get(message.get("id")) if isinstance(message, dict) else None
+                if future is None or future.done():
+                    # 服务器主动发送的通知或已超时的响应
+                    continue
+                if "error" in message:
+                    error = message["error"] or {}
+                    future.set_exception(MCPError(error.get("code"), error.get("message"), error.get("data")))
+                else:
+                    future.set_result(message.get("result"))
+        except Exception as e:
+            self.last_error = str(e)
+            logger.error(f"读取MCP服务器 {self.name} 输出失败: {e}")
+        finally:
+            error = ConnectionError(f"MCP服务器 {self.name} 连接已断开")
+            for future in list(self._pending.values()):
+                if not future.done():
+                    future.set_exception(error)
+
+    async def _drain_stderr(self):
+        # 持续读取标准错误输出，避免管道写满导致子进程阻塞
+        stderr = self.process.stderr
+        try:
+            while True:
+                line = await stderr.readline()
+                if not line:
+                    break
+                logger.debug(f"[{self.name}] {line.decode('utf-8', 'replace').rstrip()}")
+        except Exception:
+            pass
+
+    async def list_tools(self) -> List[Dict[str, Any]]:
+        result = await self.request("tools/list", {})
+        return (result or {}).get("tools", [])
+
+    async def call_tool(self, tool_name: str, arguments: Dict[str, Any] = None, timeout: float = None) -> Any:
+        return await self.request("tools/call", {"name": tool_name, "arguments": arguments or {}}, timeout)
+
+    async def ping(self, timeout: float = 5.0) -> bool:
+        try:
+            await self.request("ping", {}, timeout)
+            return True
+        except MCPError:
+            # 不支持 ping 的服务器会返回错误响应，能响应即说明进程正常
+            return True
+        except Exception as e:
+            self.last_error = str(e)
+            return False
+
+    async def close(self):
+        """关闭子进程"""
+        process = self.process
+        if process is not None and process.returncode is None:
+            try:
+                process.stdin.close()
+                await asyncio.wait_for(process.wait(), 2)
+            except Exception:
+                process.kill()
+                await process.wait()
+        for task in (self._reader, self._stderr_reader):
+            if task is not None and not task.done():
+                task.cancel()
+
+
+class MCPServerPool:
+    """同一 MCP 服务器配置的一组常驻子进程。
+
+    请求分配给当前进行中请求最少的进程；进程退出或健康检查失败时按退避时间自动重启。
+    """
+
+    def __init__(self, name: str, command: str, args: List[str] = None, env: Dict[str, str] = None,
+                 size: int = 1, request_timeout: float = 30.0):
+        self.name = name
+        self.command = command
+        self.args = list(args or [])
+        self.env = dict(env or {})
+        self.size = max(1, size)
+        self.request_timeout = request_timeout
+        self.clients = [self._new_client() for _ in range(self.size)]
+        self.restarts = 0
+        self.failures = 0
+        self.calls = 0
+        self.started_at = None
+        self._next_restart = {}  # 客户端下标 -> 允许重启的事件循环时间
+        self._backoff = {}
+        self._restart_lock = asyncio.Lock()
+
+    def _new_client(self):
+        return StdioMCPClient(self.name, self.command, self.args, self.env, self.request_timeout)
+
+    @property
+    def status(self) -> str:
+        alive = sum(1 for client in self.clients if client.alive)
+        if alive == len(self.clients):
+            return 'running'
+        return 'degraded' if alive else 'failed'
+
+    @property
+    def tools(self) -> List[Dict[str, Any]]:
+        for client in self.clients:
+            if client.tools:
+                return client.tools
+        return []
+
+    async def start(self):
+        """预先启动全部进程，至少一个启动成功即视为成功"""
+        results = await asyncio.gather(*(client.start() for client in self.clients), return_exceptions=True)
+        errors = [result for result in results if isinstance(result, Exception)]
+        if len(errors) == len(self.clients):
+            raise errors[0]
+        self.started_at = datetime.now()
+
+    async def ensure_healthy(self, ping: bool = True):
+        """检查各进程，已退出或无响应的进程按退避时间重启"""
+        loop = asyncio.get_running_loop()
+        for index, client in enumerate(self.clients):
+            healthy = client.alive and (not ping or await client.ping())
+            if healthy:
+                self._backoff.pop(index, None)
+                continue
+            if loop.time() < self._next_restart.get(index, 0):
+                continue
+            await self._restart(index)
+
+    async def _restart(self, index):
+        async with self._restart_lock:
+            old = self.clients[index]
+            if old.alive and await old.ping():
+                return
+            await old.close()
+            client = self._new_client()
+            self.clients[index] = client
+            self.restarts += 1
+            try:
+                await client.start()
+                self._backoff.pop(index, None)
+                logger.warning(f"MCP服务器 {self.name} 的进程已重启（累计 {self.restarts} 次）")
+            except Exception as e:
+                delay = min(60.0, self._backoff.get(index, 0.5) * 2)
+                self._backoff[index] = delay
+                self._next_restart[index] = asyncio.get_running_loop().time() + delay
+                client.last_error = str(e)
+                logger.error(f"重启MCP服务器 {self.name} 失败，{delay:.0f} 秒后重试: {e}")
+
+    async def _acquire(self) -> StdioMCPClient:
+        alive = [client for client in self.clients if client.alive]
+        if not alive:
+            await self.ensure_healthy(ping=False)
+            alive = [client for client in self.clients if client.alive]
+            if not alive:
+                raise ConnectionError(f"MCP服务器 {self.name} 不可用")
+        return min(alive, key=lambda client: client.in_flight)
+
+    async def call_tool(self, tool_name: str, arguments: Dict[str, Any] = None, timeout: float = None) -> Any:
+        client = await self._acquire()
+        self.calls += 1
+        try:
+            return await client.call_tool(tool_name, arguments, timeout)
+        except Exception:
+            self.failures += 1
+            raise
+
+    async def list_tools(self) -> List[Dict[str, Any]]:
+        client = await self._acquire()
+        client.tools = await client.list_tools()
+        return client.tools
+
+    async def close(self):
+        await asyncio.gather(*(client.close() for client in self.clients), return_exceptions=True)
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'status': self.status,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'command': self.command,
+            'args': self.args,
+            'pool_size': self.size,
+            'pids': [client.process.pid for client in self.clients if client.alive],
+            'in_flight': sum(client.in_flight for client in self.clients),
+            'tools': [tool.get('name') for tool in self.tools],
+            'calls': self.calls,
+            'failures': self.failures,
+            'restarts': self.restarts,
+            'last_error': next((client.last_error for client in self.clients if client.last_error), None)
+        }
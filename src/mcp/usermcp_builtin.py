@@ -1,9 +1,16 @@
 import json
+import asyncio
 import logging
 from typing import Dict, List, Optional, Any
 from datetime import datetime
-from src.models.mcp import UserMemory, MCPExecutionLog
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from src.models.mcp import UserMemory
 from src.models.user import db
+from src.mcp.memory_search import memory_search
+from src.mcp.memory_vectors import memory_vectors
+from src.mcp.execution_log import execution_log_writer
+from src.mcp.memory_consolidation import memory_consolidator
+from src.services.async_runner import async_runner
 
 logger = logging.getLogger(__name__)
 
@@ -14,12 +21,15 @@ class BuiltinUserMCP:
         self.db = db_session or db.session
         self.server_name = "usermcp"
         
-    async def query_user_profile(self, query: str, user_id: int = None) -> Dict[str, Any]:
+    async def query_user_profile(self, query: str, user_id: int = None,
+                                 keywords: List[str] = None, mode: str = None) -> Dict[str, Any]:
         """查询用户档案
         
         Args:
             query: 查询内容，可以是关键词、上下文等
             user_id: 用户ID
+            keywords: 预先提取的关键词，提供时按关键词批量检索
+            mode: 检索方式 lexical/semantic/hybrid，默认取 MEMORY_RECALL_MODE
             
         Returns:
             Dict containing user profile information
@@ -29,35 +39,36 @@ class BuiltinUserMCP:
             if not user_id:
                 return {"error": "用户ID为空"}
             
-            # 简单的关键词匹配查询
-            memories = UserMemory.query.filter(
-                UserMemory.user_id == user_id,
-                db.or_(
-                    UserMemory.key.contains(query),
-                    UserMemory.value.contains(query)
-                )
-            ).order_by(UserMemory.confidence.desc()).limit(10).all()
+            mode = mode or memory_vectors.mode
+            # 数据库查询通过 run_db 在独立会话的线程中执行，不阻塞共享的事件循环
+            # 全文检索，任一检索词命中即召回，按相关度 × 置信度排序
+            if keywords:
+                ranked = await async_runner.run_db(memory_search.rank_keywords, user_id, keywords, limit=10)
+            else:
+                ranked = await async_runner.run_db(memory_search.rank, user_id, query, limit=10)
+            
+            if mode != 'lexical':
+                try:
+                    # 先读出数据库状态，计算向量和相似度的线程只拿到普通数据，不使用数据库会话
+                    state, rows = await async_runner.run_db(memory_vectors.snapshot, user_id)
+                    semantic = await asyncio.to_thread(memory_vectors.search, user_id, query, 10, state, rows)
+                    ranked = semantic if mode == 'semantic' else memory_vectors.fuse(ranked, semantic, limit=10)
+                except Exception as e:
+                    logger.warning(f"语义检索失败，使用全文检索结果: {e}")
+                    mode = 'lexical'
             
             result = {
                 "user_id": user_id,
                 "query": query,
-                "memories": []
+                "keywords": keywords or [],
+                "mode": mode,
+                "memories": await async_runner.run_db(self._profile_items, ranked)
             }
             
-            for memory in memories:
-                result["memories"].append({
-                    "type": memory.memory_type,
-                    "key": memory.key,
-                    "value": memory.value,
-                    "confidence": memory.confidence,
-                    "tags": memory.tags,
-                    "created_at": memory.created_at.isoformat()
-                })
-            
             # 记录执行日志
             execution_time = (datetime.now() - start_time).total_seconds()
             self._log_execution("usermcp_query_user_profile", user_id, 
-                              {"query": query}, result, execution_time)
+                              {"query": query, "keywords": keywords}, result, execution_time)
             
             return result
             
@@ -72,6 +83,20 @@ class BuiltinUserMCP:
             
             return {"error": error_msg}
     
+    @staticmethod
+    def _profile_items(ranked) -> List[Dict[str, Any]]:
+        """按 (记忆ID, 相关度) 的顺序加载记忆，返回可在线程间传递的字典"""
+        scores = dict(ranked)
+        return [{
+            "type": memory.memory_type,
+            "key": memory.key,
+            "value": memory.value,
+            "confidence": memory.confidence,
+            "relevance": scores[memory.id],
+            "tags": memory.tags,
+            "created_at": memory.created_at.isoformat()
+        } for memory in memory_search.load([memory_id for memory_id, _ in ranked])]
+    
     async def insert_user_profile(self, key: str, value: str, user_id: int = None, 
                                  memory_type: str = "preference", confidence: float = 1.0,
                                  tags: List[str] = None) -> Dict[str, Any]:
@@ -96,38 +121,43 @@ class BuiltinUserMCP:
             if not key or not value:
                 return {"error": "关键词或内容为空"}
             
-            # 检查是否已存在相同的记忆
-            existing = UserMemory.query.filter(
-                UserMemory.user_id == user_id,
-                UserMemory.key == key,
-                UserMemory.memory_type == memory_type
-            ).first()
-            
-            if existing:
-                # 更新现有记忆
-                existing.value = value
-                existing.confidence = max(existing.confidence, confidence)
-                existing.tags = list(set((existing.tags or []) + (tags or [])))
-                existing.updated_at = datetime.utcnow()
-                operation = "updated"
-                memory_id = existing.id
-            else:
-                # 创建新记忆
-                memory = UserMemory(
-                    user_id=user_id,
-                    memory_type=memory_type,
-                    key=key,
-                    value=value,
-                    confidence=confidence,
-                    source='ai_analysis',
-                    tags=tags or []
-                )
-                self.db.add(memory)
-                self.db.flush()  # 获取ID但不提交
-                memory_id = memory.id
-                operation = "created"
-            
-            self.db.commit()
+            def write():
+                # 检查是否已存在相同的记忆
+                existing = UserMemory.query.filter(
+                    UserMemory.user_id == user_id,
+                    UserMemory.key == key,
+                    UserMemory.memory_type == memory_type
+                ).first()
+                
+                if existing:
+                    # 更新现有记忆
+                    existing.value = value
+                    existing.confidence = max(existing.confidence, confidence)
+                    existing.tags = list(set((existing.tags or []) + (tags or [])))
+                    existing.updated_at = datetime.utcnow()
+                    operation = "updated"
+                    memory_id = existing.id
+                else:
+                    # 创建新记忆
+                    memory = UserMemory(
+                        user_id=user_id,
+                        memory_type=memory_type,
+                        key=key,
+                        value=value,
+                        confidence=confidence,
+                        source='ai_analysis',
+                        tags=tags or []
+                    )
+                    self.db.add(memory)
+                    self.db.flush()  # 获取ID但不提交
+                    memory_id = memory.id
+                    operation = "created"
+                
+                self.db.commit()
+                return operation, memory_id
+            
+            (operation, memory_id), states = await async_runner.run_db(self._tracked_write, user_id, write)
+            await self._update_vectors(user_id, [(memory_id, key, value)], states=states)
             
             result = {
                 "operation": operation,
@@ -146,7 +176,6 @@ class BuiltinUserMCP:
             return result
             
         except Exception as e:
-            self.db.rollback()
             execution_time = (datetime.now() - start_time).total_seconds()
             error_msg = str(e)
             logger.error(f"插入用户档案失败: {error_msg}")
@@ -157,6 +186,111 @@ class BuiltinUserMCP:
             
             return {"error": error_msg}
     
+    async def upsert_user_profiles(self, memories: List[Dict[str, Any]], user_id: int = None,
+                                   source: str = "ai_analysis") -> Dict[str, Any]:
+        """批量插入或更新用户档案
+        
+        一次查询取出已存在的 (user_id, key, memory_type) 记录用于合并标签，
+        再以 INSERT ... ON CONFLICT 在同一个事务中写入全部记忆。
+        
+        Args:
+            memories: 记忆列表，每项包含 key、value，可选 type/memory_type、confidence、tags
+            user_id: 用户ID
+            source: 记忆来源
+            
+        Returns:
+            Dict containing operation result
+        """
+        start_time = datetime.now()
+        try:
+            if not user_id:
+                return {"error": "用户ID为空"}
+            
+            # 过滤无效项，同一批次内相同的记忆合并为一条
+            batch = {}
+            for memory in memories or []:
+                key = str(memory.get('key') or '').strip()
+                value = str(memory.get('value') or '').strip()
+                if not key or not value:
+                    continue
+                memory_type = memory.get('memory_type') or memory.get('type') or 'preference'
+                confidence = float(memory.get('confidence', 1.0))
+                tags = list(memory.get('tags') or [])
+                merged = batch.get((key, memory_type))
+                if merged:
+                    merged['value'] = value
+                    merged['confidence'] = max(merged['confidence'], confidence)
+                    merged['tags'] = list(dict.fromkeys(merged['tags'] + tags))
+                else:
+                    batch[(key, memory_type)] = {'key': key, 'memory_type': memory_type, 'value': value,
+                                                 'confidence': confidence, 'tags': tags}
+            if not batch:
+                return {"created": 0, "updated": 0, "memory_ids": []}
+            
+            def write():
+                existing = {
+                    (row.key, row.memory_type): row
+                    for row in self.db.query(
+                        UserMemory.key, UserMemory.memory_type, UserMemory.confidence, UserMemory.tags
+                    ).filter(
+                        UserMemory.user_id == user_id,
+                        db.tuple_(UserMemory.key, UserMemory.memory_type).in_(list(batch))
+                    )
+                }
+                
+                now = datetime.utcnow()
+                rows = []
+                for identity, memory in batch.items():
+                    current = existing.get(identity)
+                    if current:
+                        memory['confidence'] = max(current.confidence or 0.0, memory['confidence'])
+                        memory['tags'] = list(dict.fromkeys((current.tags or []) + memory['tags']))
+                    rows.append(dict(memory, user_id=user_id, source=source, created_at=now, updated_at=now))
+                
+                statement = sqlite_insert(UserMemory.__table__).values(rows)
+                statement = statement.on_conflict_do_update(
+                    index_elements=['user_id', 'key', 'memory_type'],
+                    set_={
+                        'value': statement.excluded.value,
+                        'confidence': statement.excluded.confidence,
+                        'tags': statement.excluded.tags,
+                        'updated_at': statement.excluded.updated_at
+                    }
+                ).returning(UserMemory.id, UserMemory.key, UserMemory.value)
+                written = self.db.execute(statement).fetchall()
+                # 批量写入不经过 ORM 事件，需要显式同步全文索引
+                memory_search.index_rows(self.db.connection(), written)
+                self.db.commit()
+                return len(existing), [tuple(row) for row in written]
+            
+            (updated, written), states = await async_runner.run_db(self._tracked_write, user_id, write)
+            await self._update_vectors(user_id, written, states=states)
+            
+            result = {
+                "created": len(batch) - updated,
+                "updated": updated,
+                "memory_ids": [row[0] for row in written]
+            }
+            
+            # 记录执行日志
+            execution_time = (datetime.now() - start_time).total_seconds()
+            self._log_execution("usermcp_upsert_user_profiles", user_id,
+                              {"count": len(batch), "keys": [key for key, _ in batch]},
+                              result, execution_time)
+            
+            return result
+            
+        except Exception as e:
+            execution_time = (datetime.now() - start_time).total_seconds()
+            error_msg = str(e)
+            logger.error(f"批量写入用户档案失败: {error_msg}")
+            
+            self._log_execution("usermcp_upsert_user_profiles", user_id,
+                              {"count": len(memories or [])}, None,
+                              execution_time, "error", error_msg)
+            
+            return {"error": error_msg}
+    
     async def delete_user_profile(self, key: str, user_id: int = None, 
                                  memory_type: str = None) -> Dict[str, Any]:
         """删除用户档案
@@ -177,26 +311,32 @@ class BuiltinUserMCP:
             if not key:
                 return {"error": "关键词为空"}
             
-            # 构建查询条件
-            query = UserMemory.query.filter(
-                UserMemory.user_id == user_id,
-                UserMemory.key == key
-            )
-            
-            if memory_type:
-                query = query.filter(UserMemory.memory_type == memory_type)
-            
-            memories = query.all()
-            deleted_count = len(memories)
+            def delete():
+                # 构建查询条件
+                query = UserMemory.query.filter(
+                    UserMemory.user_id == user_id,
+                    UserMemory.key == key
+                )
+                
+                if memory_type:
+                    query = query.filter(UserMemory.memory_type == memory_type)
+                
+                # 删除记忆
+                memories = query.all()
+                memory_ids = [memory.id for memory in memories]
+                for memory in memories:
+                    self.db.delete(memory)
+                
+                self.db.commit()
+                return memory_ids
+            
+            memory_ids, states = await async_runner.run_db(self._tracked_write, user_id, delete)
+            deleted_count = len(memory_ids)
             
             if deleted_count == 0:
                 return {"message": "未找到匹配的记忆", "deleted_count": 0}
             
-            # 删除记忆
-            for memory in memories:
-                self.db.delete(memory)
-            
-            self.db.commit()
+            await self._update_vectors(user_id, removed_ids=memory_ids, states=states)
             
             result = {
                 "message": f"成功删除 {deleted_count} 条记忆",
@@ -213,7 +353,6 @@ class BuiltinUserMCP:
             return result
             
         except Exception as e:
-            self.db.rollback()
             execution_time = (datetime.now() - start_time).total_seconds()
             error_msg = str(e)
             logger.error(f"删除用户档案失败: {error_msg}")
@@ -243,30 +382,45 @@ class BuiltinUserMCP:
             return {
                 "total_count": total_count,
                 "type_stats": [{"type": stat.memory_type, "count": stat.count} for stat in type_stats],
-                "recent_memories": [memory.to_dict() for memory in recent_memories]
+                "recent_memories": [memory.to_dict() for memory in recent_memories],
+                "consolidation": memory_consolidator.get_stats(user_id),
+                "vectors": memory_vectors.get_stats(user_id)
             }
             
         except Exception as e:
             logger.error(f"获取用户记忆统计失败: {e}")
             return {"error": str(e)}
     
+    @staticmethod
+    def _tracked_write(user_id: int, write):
+        """在同一数据库会话中执行写入，并读取写入前后的记忆状态，供增量更新向量后记录"""
+        if not memory_vectors.active:
+            return write(), None
+        before = memory_vectors.read_state(user_id)
+        result = write()
+        return result, (before, memory_vectors.read_state(user_id))
+    
+    async def _update_vectors(self, user_id: int, rows=None, removed_ids: List[int] = None, states=None):
+        """增量更新语义检索向量，失败时只记录日志，下次检索会按数据库补齐"""
+        if not memory_vectors.active:
+            return
+        try:
+            # 只把普通的 (id, key, value) 和记忆ID 传入线程，线程中不访问数据库会话
+            if rows:
+                plain_rows = [(int(row[0]), str(row[1]), str(row[2])) for row in rows]
+                await asyncio.to_thread(memory_vectors.update_memories, user_id, plain_rows, states)
+            if removed_ids:
+                await asyncio.to_thread(memory_vectors.remove_memories, user_id,
+                                        [int(i) for i in removed_ids], states)
+        except Exception as e:
+            logger.warning(f"更新记忆向量失败: {e}")
+    
     def _log_execution(self, tool_name: str, user_id: int, input_data: Dict,
                       output_data: Dict, execution_time: float,
                       status: str = "success", error_message: str = None):
-        """记录执行日志"""
+        """记录执行日志（放入缓冲区，由后台线程批量写入，不占用当前事务）"""
         try:
-            log = MCPExecutionLog(
-                server_name=self.server_name,
-                tool_name=tool_name,
-                user_id=user_id,
-                input_data=input_data,
-                output_data=output_data,
-                execution_time=execution_time,
-                status=status,
-                error_message=error_message
-            )
-            self.db.add(log)
-            self.db.commit()
+            execution_log_writer.record(self.server_name, tool_name, user_id, input_data, output_data,
+                                        execution_time, status, error_message)
         except Exception as e:
             logger.error(f"记录执行日志失败: {e}")
-            self.db.rollback()
\ No newline at end of file
@@ -1,8 +1,16 @@
 from src.models.user import db
-from datetime import datetime
+from datetime import datetime, time, timedelta
 from src.services.time_service import time_service
+from src.services.upload_storage import upload_storage
 import json
 
+# AI分析状态
+ANALYSIS_PENDING = 'pending'
+ANALYSIS_RUNNING = 'running'
+ANALYSIS_DONE = 'done'
+ANALYSIS_FAILED = 'failed'
+ANALYSIS_ACTIVE_STATUSES = (ANALYSIS_PENDING, ANALYSIS_RUNNING)
+
 class DiaryEntry(db.Model):
     """日记条目模型"""
     __tablename__ = 'diary_entries'
@@ -13,10 +21,33 @@ class DiaryEntry(db.Model):
     image_path = db.Column(db.String(255))  # 图片存储路径
     ai_analysis = db.Column(db.Text)  # AI分析结果
     is_daily_summary = db.Column(db.Boolean, default=False)  # 是否为每日总结
+    analysis_status = db.Column(db.String(20))  # AI分析状态：pending, running, done, failed；无需分析时为空
+    analysis_attempts = db.Column(db.Integer, default=0)  # AI分析尝试次数
+    analysis_started_at = db.Column(db.DateTime)  # 最近一次分析开始时间
+    analysis_finished_at = db.Column(db.DateTime)  # 最近一次分析结束时间
     created_at = db.Column(db.DateTime, default=lambda: time_service.get_beijing_time())
+
+    __table_args__ = (
+        db.Index('idx_diary_analysis_status', 'analysis_status', 'timestamp'),
+        db.Index('idx_diary_timestamp', 'timestamp'),
+        db.Index('idx_diary_summary_timestamp', 'is_daily_summary', 'timestamp'),
+    )
     
     def __repr__(self):
         return f'<DiaryEntry {self.id} at {self.timestamp}>'
+
+    @classmethod
+    def on_date(cls, target_date):
+        """按日期过滤的范围条件。
+
+        使用 [当天0点, 次日0点) 的范围比较代替 func.date(timestamp)，使查询可以走 timestamp 索引。
+        """
+        start = datetime.combine(target_date, time.min)
+        return db.and_(cls.timestamp >= start, cls.timestamp < start + timedelta(days=1))
+
+    @property
+    def is_analyzing(self):
+        return self.analysis_status in ANALYSIS_ACTIVE_STATUSES
     
     def to_dict(self):
         return {
@@ -24,7 +55,12 @@ class DiaryEntry(db.Model):
             'timestamp': self.timestamp.isoformat() if self.timestamp else None,
             'text_content': self.text_content,
             'image_path': self.image_path,
+            'thumbnails': upload_storage.thumbnail_urls(self.image_path),
             'ai_analysis': self.ai_analysis,
+            'analysis_status': self.analysis_status,
+            'analysis_attempts': self.analysis_attempts or 0,
+            'analysis_started_at': self.analysis_started_at.isoformat() if self.analysis_started_at else None,
+            'analysis_finished_at': self.analysis_finished_at.isoformat() if self.analysis_finished_at else None,
             'is_daily_summary': self.is_daily_summary,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
@@ -38,6 +74,10 @@ class DailySummary(db.Model):
     summary_content = db.Column(db.Text, nullable=False)  # AI汇总的日记内容
     entry_count = db.Column(db.Integer, default=0)  # 当日条目数量
     created_at = db.Column(db.DateTime, default=lambda: time_service.get_beijing_time())
+
+    __table_args__ = (
+        db.Index('idx_daily_summary_date', 'date'),
+    )
     
     def __repr__(self):
         return f'<DailySummary {self.date}>'
@@ -51,6 +91,69 @@ class DailySummary(db.Model):
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
+class DailyDigest(db.Model):
+    """每日滚动摘要：条目分析完成后增量合并，零点基于摘要生成每日汇总"""
+    __tablename__ = 'daily_digests'
+
+    id = db.Column(db.Integer, primary_key=True)
+    date = db.Column(db.Date, nullable=False, unique=True)
+    content = db.Column(db.Text, default='')  # 当前的摘要正文
+    entry_versions = db.Column(db.JSON, default=dict)  # 已合并的条目：{条目ID: 内容指纹}
+    stale = db.Column(db.Boolean, default=False)  # 已合并的条目被修改过，摘要需要重建
+    folds = db.Column(db.Integer, default=0)  # 调用模型更新摘要的次数
+    prompt_tokens = db.Column(db.Integer, default=0)  # 更新摘要累计的提示词 token（估算）
+    updated_at = db.Column(db.DateTime, default=lambda: time_service.get_beijing_time(),
+                           onupdate=lambda: time_service.get_beijing_time())
+
+    def __repr__(self):
+        return f'<DailyDigest {self.date}>'
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'date': self.date.isoformat() if self.date else None,
+            'content': self.content,
+            'entry_count': len(self.entry_versions or {}),
+            'stale': bool(self.stale),
+            'folds': self.folds or 0,
+            'prompt_tokens': self.prompt_tokens or 0,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+class AnalysisJob(db.Model):
+    """AI分析任务队列模型，保证任务在重启后不丢失"""
+    __tablename__ = 'analysis_jobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    entry_id = db.Column(db.Integer, nullable=False, index=True)
+    user_id = db.Column(db.Integer)
+    image_path = db.Column(db.String(500))  # 图片的完整路径
+    status = db.Column(db.String(20), default='queued', nullable=False)  # queued, running, failed
+    attempts = db.Column(db.Integer, default=0)
+    last_error = db.Column(db.Text)
+    next_run_at = db.Column(db.DateTime, default=lambda: time_service.get_beijing_time(), nullable=False)
+    created_at = db.Column(db.DateTime, default=lambda: time_service.get_beijing_time())
+    started_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('idx_analysis_job_status_next', 'status', 'next_run_at'),
+    )
+
+    def __repr__(self):
+        return f'<AnalysisJob {self.id} entry={self.entry_id} {self.status}>'
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'entry_id': self.entry_id,
+            'status': self.status,
+            'attempts': self.attempts,
+            'last_error': self.last_error,
+            'next_run_at': self.next_run_at.isoformat() if self.next_run_at else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None
+        }
+
 class Config(db.Model):
     """系统配置模型"""
     __tablename__ = 'configs'
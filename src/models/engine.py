@@ -0,0 +1,75 @@
+import os
+import logging
+from sqlalchemy import event
+from src.models.user import db
+
+logger = logging.getLogger(__name__)
+
+# SQLite 连接参数，均可通过同名环境变量覆盖
+SQLITE_DEFAULTS = {
+    'SQLITE_JOURNAL_MODE': 'WAL',          # WAL 模式下读写互不阻塞
+    'SQLITE_SYNCHRONOUS': 'NORMAL',        # WAL 模式下 NORMAL 已能保证数据库不损坏
+    'SQLITE_BUSY_TIMEOUT_MS': '15000',     # 遇到写锁时最多等待的毫秒数，而不是立即报 database is locked
+    'SQLITE_MMAP_SIZE': str(256 * 1024 * 1024),
+    'SQLITE_CACHE_SIZE_KB': str(16 * 1024),
+}
+
+# 连接池参数
+POOL_DEFAULTS = {
+    'DB_POOL_SIZE': '10',
+    'DB_MAX_OVERFLOW': '20',
+    'DB_POOL_TIMEOUT': '30',
+    'DB_POOL_RECYCLE': '3600',
+}
+
+
+def _setting(name, defaults):
+    return os.environ.get(name, defaults[name])
+
+
+def get_sqlite_settings():
+    """返回当前生效的 SQLite 配置"""
+    return {name: _setting(name, SQLITE_DEFAULTS) for name in SQLITE_DEFAULTS}
+
+
+def sqlite_engine_options():
+    """生成 SQLALCHEMY_ENGINE_OPTIONS，需在 db.init_app 之前写入 app.config"""
+    busy_timeout_ms = int(_setting('SQLITE_BUSY_TIMEOUT_MS', SQLITE_DEFAULTS))
+    return {
+        'pool_size': int(_setting('DB_POOL_SIZE', POOL_DEFAULTS)),
+        'max_overflow': int(_setting('DB_MAX_OVERFLOW', POOL_DEFAULTS)),
+        'pool_timeout': float(_setting('DB_POOL_TIMEOUT', POOL_DEFAULTS)),
+        'pool_recycle': int(_setting('DB_POOL_RECYCLE', POOL_DEFAULTS)),
+        'pool_pre_ping': True,
+        'connect_args': {
+            # 连接会在分析队列、定时任务等多个线程间复用
+            'check_same_thread': False,
+            'timeout': busy_timeout_ms / 1000,
+        },
+    }
+
+
+def _apply_pragmas(dbapi_connection, connection_record):
+    settings = get_sqlite_settings()
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f"PRAGMA journal_mode={settings['SQLITE_JOURNAL_MODE']}")
+        cursor.execute(f"PRAGMA synchronous={settings['SQLITE_SYNCHRONOUS']}")
+        cursor.execute(f"PRAGMA busy_timeout={int(settings['SQLITE_BUSY_TIMEOUT_MS'])}")
+        cursor.execute(f"PRAGMA mmap_size={int(settings['SQLITE_MMAP_SIZE'])}")
+        # 负数表示以 KB 为单位
+        cursor.execute(f"PRAGMA cache_size=-{int(settings['SQLITE_CACHE_SIZE_KB'])}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+    finally:
+        cursor.close()
+
+
+def register_sqlite_pragmas(app):
+    """为应用的数据库引擎注册连接钩子，每个新连接建立时设置 PRAGMA"""
+    with app.app_context():
+        engine = db.engine
+        if engine.dialect.name != 'sqlite':
+            return
+        if not event.contains(engine, 'connect', _apply_pragmas):
+            event.listen(engine, 'connect', _apply_pragmas)
+        logger.info(f"SQLite 连接配置: {get_sqlite_settings()}")
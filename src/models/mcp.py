@@ -47,6 +47,8 @@ class UserMemory(db.Model):
     __table_args__ = (
         db.Index('idx_user_memory_type', 'user_id', 'memory_type'),
         db.Index('idx_user_key', 'user_id', 'key'),
+        # 同一用户同一类型下关键词唯一，批量写入时以此做 ON CONFLICT 更新
+        db.Index('uq_user_memory_key_type', 'user_id', 'key', 'memory_type', unique=True),
     )
 
     def to_dict(self):
@@ -78,6 +80,11 @@ class MCPExecutionLog(db.Model):
     error_message = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # 按时间清理旧日志
+    __table_args__ = (
+        db.Index('idx_mcp_log_created', 'created_at'),
+    )
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -90,4 +97,32 @@ class MCPExecutionLog(db.Model):
             'status': self.status,
             'error_message': self.error_message,
             'created_at': self.created_at.isoformat() if self.created_at else None
-        }
\ No newline at end of file
+        }
+
+class MCPExecutionStat(db.Model):
+    """MCP调用按天汇总的统计（包括未采样写入日志的调用，清理旧日志后仍保留）"""
+    __tablename__ = 'mcp_execution_stats'
+
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    server_name = db.Column(db.String(100), nullable=False)
+    tool_name = db.Column(db.String(100), nullable=False)
+    calls = db.Column(db.Integer, default=0)
+    errors = db.Column(db.Integer, default=0)
+    total_time = db.Column(db.Float, default=0.0)  # 累计执行时间(秒)
+    max_time = db.Column(db.Float, default=0.0)
+
+    __table_args__ = (
+        db.UniqueConstraint('day', 'server_name', 'tool_name', name='uq_mcp_stat_day_tool'),
+    )
+
+    def to_dict(self):
+        return {
+            'day': self.day.isoformat() if self.day else None,
+            'server_name': self.server_name,
+            'tool_name': self.tool_name,
+            'calls': self.calls,
+            'errors': self.errors,
+            'avg_time': round(self.total_time / self.calls, 4) if self.calls else None,
+            'max_time': self.max_time
+        }
@@ -4,6 +4,14 @@ from src.models.user import db
 from src.services.ai_service import ai_service
 from src.services.telegram_service import telegram_service
 from src.services.scheduler_service import scheduler_service
+from src.services.analysis_queue import analysis_queue
+from src.services.async_runner import async_runner
+from src.services.image_service import image_service
+from src.services.upload_storage import upload_storage
+from src.services.static_assets import static_assets
+from src.services.response_compression import response_compressor
+from src.services.daily_digest import daily_digest
+from src.mcp.execution_log import execution_log_writer
 from datetime import datetime, date
 from src.services.time_service import time_service
 from functools import wraps
@@ -109,11 +117,15 @@ def reload_services():
     """重新加载服务配置"""
     try:
         # 重新加载AI服务配置
+        ai_service.invalidate_config()
         ai_service._load_config()
         
         # 重新加载Telegram服务配置
         telegram_service._load_config()
         
+        # 重新加载静态文件清单
+        static_assets.load()
+        
         return jsonify({
             'success': True,
             'message': '服务配置重新加载成功'
@@ -142,7 +154,17 @@ def system_status():
                 'ai_configured': ai_configured,
                 'telegram_configured': telegram_configured,
                 'scheduler_running': scheduler_running,
-                'timestamp': time_service.get_beijing_time().isoformat()
+                'timestamp': time_service.get_beijing_time().isoformat(),
+                'time_sync': time_service.get_stats(),
+                'analysis_queue': analysis_queue.get_stats(),
+                'ai_endpoints': ai_service.get_endpoint_stats(),
+                'async_runner': async_runner.get_stats(),
+                'mcp_log_writer': execution_log_writer.get_stats(),
+                'vision_images': image_service.get_stats(),
+                'uploads': upload_storage.get_stats(),
+                'static_assets': static_assets.get_stats(),
+                'response_compression': response_compressor.get_stats(),
+                'daily_digest': daily_digest.get_stats()
             }
         })
         
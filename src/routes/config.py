@@ -2,6 +2,7 @@ from flask import Blueprint, jsonify, request, session
 from src.models.diary import Config
 from src.models.user import db
 from src.services.notion_service import notion_service
+from src.services.ai_service import ai_service
 from functools import wraps
 
 config_bp = Blueprint('config', __name__)
@@ -77,6 +78,7 @@ def create_or_update_configs():
             updated_configs.append(config)
         
         db.session.commit()
+        ai_service.invalidate_config()
         
         return jsonify({
             'success': True,
@@ -99,6 +101,7 @@ def delete_config(key):
         
         db.session.delete(config)
         db.session.commit()
+        ai_service.invalidate_config()
         
         return jsonify({
             'success': True,
@@ -175,6 +178,7 @@ def init_default_configs():
                 created_count += 1
         
         db.session.commit()
+        ai_service.invalidate_config()
         
         return jsonify({
             'success': True,
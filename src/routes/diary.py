@@ -1,27 +1,45 @@
-from flask import Blueprint, jsonify, request, session
-from werkzeug.utils import secure_filename
+from flask import Blueprint, Response, jsonify, request, session
 from src.models.diary import DiaryEntry, DailySummary
 from src.models.user import db
-from src.services.ai_service import ai_service
+from src.services.analysis_queue import analysis_queue
+from src.services.analysis_stream import analysis_stream
+from src.services.analysis_events import analysis_events
 from src.services.notion_service import notion_service
+from src.services.upload_storage import upload_storage, UploadRejected
 from datetime import datetime, date, timedelta
 from src.services.time_service import time_service
 import logging
-import os
-import uuid
-import threading
+import json
+import queue
+import time
 from functools import wraps
 
 logger = logging.getLogger(__name__)
 
 diary_bp = Blueprint('diary', __name__)
 
-# 配置上传文件夹
-UPLOAD_FOLDER = 'uploads'
+# 允许上传的图片类型
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 
-def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+# SSE 连接的心跳间隔与最长保持时间（秒）
+SSE_KEEPALIVE_SECONDS = 15
+SSE_MAX_SECONDS = 300
+# 每页条数限制在 1~100：0 或负数会让游标分页取到空页，超大值会一次读出整张表
+MAX_PER_PAGE = 100
+
+def _parse_keyset_cursor(value, parse_key):
+    """解析 "<排序键>,<id>" 形式的游标，空值表示第一页；格式错误时抛出 ValueError"""
+    if not value:
+        return None
+    key, entry_id = value.rsplit(',', 1)
+    return parse_key(key), int(entry_id)
+
+def _keyset_page(query, key_column, id_column, cursor, per_page):
+    """按 (key, id) 倒序做游标分页，多取一条判断是否还有下一页，不统计总数"""
+    if cursor:
+        query = query.filter(db.tuple_(key_column, id_column) < cursor)
+    items = query.order_by(key_column.desc(), id_column.desc()).limit(per_page + 1).all()
+    return items[:per_page], len(items) > per_page
 
 def require_auth(f):
     """认证装饰器，要求用户已登录。使用wraps保留元数据。"""
@@ -33,58 +51,28 @@ def require_auth(f):
 
     return decorated_function
 
-def analyze_entry_async(entry_id, text_content, image_path, user_id=None):
-    """异步分析日记条目"""
-    try:
-        # 重新获取数据库连接
-        from src.main import app
-        with app.app_context():
-            analysis = ai_service.analyze_entry(text_content, image_path, user_id)
-
-            # 更新数据库 - 确保线程安全
-            entry = DiaryEntry.query.get(entry_id)
-            if entry:
-                entry.ai_analysis = analysis
-                db.session.commit()
-                logger.info(f"AI分析完成，条目ID: {entry_id}, 分析结果: {analysis[:50]}...")
-            else:
-                logger.warning(f"未找到条目ID: {entry_id}")
-    except Exception as e:
-        logger.error(f"异步AI分析失败: {e}")
-        # 如果分析失败，将状态更新为错误信息
-        try:
-            from src.main import app
-            with app.app_context():
-                entry = DiaryEntry.query.get(entry_id)
-                if entry:
-                    entry.ai_analysis = f"AI分析失败: {str(e)}"
-                    db.session.commit()
-        except:
-            pass
-
 @diary_bp.route('/entries', methods=['POST'])
 @require_auth
 def create_entry():
     """创建日记条目"""
     try:
-        text_content = request.form.get('text_content', '')
         image_path = None
         full_image_path = None
         
-        # 处理图片上传
-        if 'image' in request.files:
-            file = request.files['image']
-            if file and file.filename != '' and allowed_file(file.filename):
-                # 创建上传目录
-                upload_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static', UPLOAD_FOLDER)
-                os.makedirs(upload_dir, exist_ok=True)
-                
-                # 生成唯一文件名
-                filename = str(uuid.uuid4()) + '.' + file.filename.rsplit('.', 1)[1].lower()
-                file_path = os.path.join(upload_dir, filename)
-                file.save(file_path)
-                image_path = f'{UPLOAD_FOLDER}/{filename}'
-                full_image_path = file_path
+        if request.mimetype == 'multipart/form-data':
+            # 流式接收图片：边读边校验文件头和大小，按内容哈希保存，缩略图在后台生成
+            try:
+                fields, stored = upload_storage.receive(request, 'image', ALLOWED_EXTENSIONS)
+            except UploadRejected as e:
+                # 请求体可能没有读完，关闭连接避免残留数据被当作下一个请求
+                response = jsonify({'success': False, 'message': str(e)})
+                response.headers['Connection'] = 'close'
+                return response, e.status
+            text_content = fields.get('text_content', '')
+            if stored:
+                image_path, full_image_path = stored
+        else:
+            text_content = request.form.get('text_content', '')
         
         # 创建日记条目，初始AI分析状态为"AI理解中"
         entry = DiaryEntry(
@@ -97,16 +85,9 @@ def create_entry():
         db.session.add(entry)
         db.session.commit()
         
-        # 异步进行AI分析
+        # 加入AI分析队列，由后台工作线程异步分析
         if text_content or full_image_path:
-            # 获取当前用户ID
-            user_id = session.get('user_id')
-            thread = threading.Thread(
-                target=analyze_entry_async,
-                args=(entry.id, text_content, full_image_path, user_id)
-            )
-            thread.daemon = True
-            thread.start()
+            analysis_queue.enqueue(entry, full_image_path, session.get('user_id'))
         
         return jsonify({
             'success': True,
@@ -136,8 +117,8 @@ def generate_daily_summary():
         
         # 获取指定日期的所有日记条目（排除已存在的每日总结）
         entries = DiaryEntry.query.filter(
-            db.func.date(DiaryEntry.timestamp) == date_obj,
-            DiaryEntry.is_daily_summary != True
+            DiaryEntry.on_date(date_obj),
+            DiaryEntry.is_daily_summary == False
         ).all()
         
         if not entries:
@@ -191,18 +172,23 @@ def generate_daily_summary():
 @diary_bp.route('/entries', methods=['GET'])
 @require_auth
 def get_entries():
-    """获取日记条目列表"""
+    """获取日记条目列表
+
+    默认按 page/per_page 分页；携带 after 参数（"<timestamp>,<id>"，首页传空值）时改用游标分页，
+    直接从上一页最后一条之后开始读取，不统计总数。
+    """
     try:
         # 获取查询参数
         page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 20, type=int)
+        per_page = max(1, min(request.args.get('per_page', 20, type=int), MAX_PER_PAGE))
         date_str = request.args.get('date')  # 格式: YYYY-MM-DD
+        after = request.args.get('after')
         
         query = DiaryEntry.query
         
         # 时间线视图：只显示普通日记，排除每日总结
         if request.args.get('view') != 'history':  # 默认时间线视图
-            query = query.filter(DiaryEntry.is_daily_summary != True)
+            query = query.filter(DiaryEntry.is_daily_summary == False)
         # 历史日记视图：显示包括每日总结在内的所有记录
         
         # 按日期过滤
@@ -210,13 +196,30 @@ def get_entries():
             try:
                 target_date = datetime.strptime(date_str, '%Y-%m-%d').date()
                 query = query.filter(
-                    db.func.date(DiaryEntry.timestamp) == target_date
+                    DiaryEntry.on_date(target_date)
                 )
             except ValueError:
                 return jsonify({'success': False, 'message': '日期格式错误'}), 400
         
+        # 游标分页
+        if after is not None:
+            try:
+                cursor = _parse_keyset_cursor(after, datetime.fromisoformat)
+            except ValueError:
+                return jsonify({'success': False, 'message': '游标格式错误'}), 400
+            items, has_next = _keyset_page(query, DiaryEntry.timestamp, DiaryEntry.id, cursor, per_page)
+            return jsonify({
+                'success': True,
+                'entries': [entry.to_dict() for entry in items],
+                'pagination': {
+                    'per_page': per_page,
+                    'has_next': has_next,
+                    'next_cursor': f"{items[-1].timestamp.isoformat()},{items[-1].id}" if has_next else None
+                }
+            })
+
         # 按时间倒序排列并分页
-        entries = query.order_by(DiaryEntry.timestamp.desc()).paginate(
+        entries = query.order_by(DiaryEntry.timestamp.desc(), DiaryEntry.id.desc()).paginate(
             page=page, per_page=per_page, error_out=False
         )
         
@@ -270,13 +273,8 @@ def update_entry(entry_id):
         entry.ai_analysis = "AI理解中..."
         db.session.commit()
         
-        # 异步进行AI分析
-        thread = threading.Thread(
-            target=analyze_entry_async,
-            args=(entry.id, new_text, None)
-        )
-        thread.daemon = True
-        thread.start()
+        # 加入AI分析队列，由后台工作线程异步分析
+        analysis_queue.enqueue(entry)
         
         return jsonify({
             'success': True,
@@ -293,20 +291,15 @@ def delete_entry(entry_id):
     """删除日记条目"""
     try:
         entry = DiaryEntry.query.get_or_404(entry_id)
-        
-        # 删除关联的图片文件
-        if entry.image_path:
-            file_path = os.path.join(
-                os.path.dirname(os.path.dirname(__file__)), 
-                'static', 
-                entry.image_path
-            )
-            if os.path.exists(file_path):
-                os.remove(file_path)
+        image_path = entry.image_path
         
         db.session.delete(entry)
         db.session.commit()
         
+        # 图片可能被其他条目共用，没有其他引用时才删除文件和缩略图
+        if image_path:
+            upload_storage.release(image_path)
+        
         return jsonify({
             'success': True,
             'message': '日记条目删除成功'
@@ -318,22 +311,45 @@ def delete_entry(entry_id):
 @diary_bp.route('/summaries', methods=['GET'])
 @require_auth
 def get_summaries():
-    """获取每日汇总列表"""
+    """获取每日汇总列表
+
+    与条目列表相同，携带 after 参数（"<date>,<id>"，首页传空值）时使用游标分页。
+    """
     try:
         # 获取查询参数
         page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 30, type=int)
+        per_page = max(1, min(request.args.get('per_page', 30, type=int), MAX_PER_PAGE))
         days = request.args.get('days', 365, type=int)  # 默认获取一年内的
+        after = request.args.get('after')
         
         # 计算日期范围
         end_date = date.today()
         start_date = end_date - timedelta(days=days)
         
         # 查询汇总
-        summaries = DailySummary.query.filter(
+        query = DailySummary.query.filter(
             DailySummary.date >= start_date,
             DailySummary.date <= end_date
-        ).order_by(DailySummary.date.desc()).paginate(
+        )
+
+        # 游标分页
+        if after is not None:
+            try:
+                cursor = _parse_keyset_cursor(after, date.fromisoformat)
+            except ValueError:
+                return jsonify({'success': False, 'message': '游标格式错误'}), 400
+            items, has_next = _keyset_page(query, DailySummary.date, DailySummary.id, cursor, per_page)
+            return jsonify({
+                'success': True,
+                'summaries': [summary.to_dict() for summary in items],
+                'pagination': {
+                    'per_page': per_page,
+                    'has_next': has_next,
+                    'next_cursor': f"{items[-1].date.isoformat()},{items[-1].id}" if has_next else None
+                }
+            })
+
+        summaries = query.order_by(DailySummary.date.desc(), DailySummary.id.desc()).paginate(
             page=page, per_page=per_page, error_out=False
         )
         
@@ -415,45 +431,130 @@ def get_analysis_status(entry_id):
             'success': True,
             'entry_id': entry_id,
             'ai_analysis': entry.ai_analysis,
-            'is_analyzing': entry.ai_analysis == "AI理解中..." if entry.ai_analysis else False
+            'analysis_status': entry.analysis_status,
+            'is_analyzing': entry.is_analyzing
         })
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
+def _sse(event, data):
+    """格式化一条SSE消息"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@diary_bp.route('/entries/<int:entry_id>/analysis-stream', methods=['GET'])
+@require_auth
+def stream_analysis(entry_id):
+    """以SSE实时推送日记条目的AI分析输出
+
+    事件类型：delta（新增文本）、reset（重试时清空已收到的文本）、
+    done / failed（分析结束，携带最终结果）、timeout（超过最长保持时间）。
+    """
+    try:
+        # 先订阅再读取数据库，避免两者之间分析恰好完成而错过结束事件
+        partial, subscriber = analysis_stream.subscribe(entry_id)
+        entry = DiaryEntry.query.get(entry_id)
+        if entry is None:
+            analysis_stream.unsubscribe(entry_id, subscriber)
+            return jsonify({'success': False, 'message': '条目不存在'}), 404
+        current = entry.ai_analysis
+        is_analyzing = entry.is_analyzing
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+    def generate():
+        try:
+            if not is_analyzing:
+                yield _sse('done', {'entry_id': entry_id, 'ai_analysis': current})
+                return
+            if partial:
+                yield _sse('delta', {'text': partial})
+
+            deadline = time.monotonic() + SSE_MAX_SECONDS
+            while time.monotonic() < deadline:
+                try:
+                    event, text = subscriber.get(timeout=SSE_KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                if event == 'delta':
+                    yield _sse('delta', {'text': text})
+                elif event == 'reset':
+                    yield _sse('reset', {})
+                else:
+                    yield _sse(event, {'entry_id': entry_id, 'ai_analysis': text})
+                    return
+            yield _sse('timeout', {'entry_id': entry_id})
+        finally:
+            analysis_stream.unsubscribe(entry_id, subscriber)
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+def _today_analysis_status():
+    """查询今日所有条目的AI分析状态"""
+    today = time_service.get_beijing_time().date()
+    entries = DiaryEntry.query.filter(
+        DiaryEntry.on_date(today)
+    ).order_by(DiaryEntry.timestamp.desc()).all()
+
+    return [{
+        'id': entry.id,
+        'ai_analysis': entry.ai_analysis,
+        'analysis_status': entry.analysis_status,
+        'is_analyzing': entry.is_analyzing,
+        'timestamp': entry.timestamp.isoformat()
+    } for entry in entries]
+
 @diary_bp.route('/entries/today/analysis-status', methods=['GET'])
 @require_auth
 def get_today_analysis_status():
     """获取今日所有条目的AI分析状态"""
     try:
-        today = time_service.get_beijing_time().date()
-        entries = DiaryEntry.query.filter(
-            db.func.date(DiaryEntry.timestamp) == today
-        ).order_by(DiaryEntry.timestamp.desc()).all()
-        
-        result = []
-        for entry in entries:
-            # 判断是否还在分析中
-            is_analyzing = False
-            if entry.ai_analysis:
-                # 检查多种"分析中"的状态
-                analyzing_keywords = ['AI理解中', 'AI理解中...', '分析中', '处理中']
-                is_analyzing = any(keyword in entry.ai_analysis for keyword in analyzing_keywords)
-            
-            result.append({
-                'id': entry.id,
-                'ai_analysis': entry.ai_analysis,
-                'is_analyzing': is_analyzing,
-                'timestamp': entry.timestamp.isoformat()
-            })
-        
         return jsonify({
             'success': True,
-            'entries': result
+            'entries': _today_analysis_status()
         })
     except Exception as e:
         logger.error(f"获取分析状态失败: {e}")
         return jsonify({'success': False, 'message': str(e)}), 500
 
+@diary_bp.route('/entries/analysis-updates', methods=['GET'])
+@require_auth
+def get_analysis_updates():
+    """长轮询获取AI分析状态的变化
+
+    携带上次返回的 cursor 时，只返回此后状态发生变化的条目，没有变化时在内存中等待
+    最多 timeout 秒（默认25，最大60），不查询数据库。未携带 cursor 或 cursor 失效时
+    返回今日完整状态（reset 为 true）作为新的基线。
+    """
+    try:
+        cursor = request.args.get('cursor')
+        timeout = min(max(request.args.get('timeout', 25, type=float), 0), 60)
+
+        if cursor:
+            entries, next_cursor = analysis_events.changes_since(cursor, timeout)
+            if entries is not None:
+                return jsonify({
+                    'success': True,
+                    'cursor': next_cursor,
+                    'reset': False,
+                    'entries': entries
+                })
+
+        # 先取 cursor 再查询，查询期间发生的变化会在下一次请求中再次返回
+        next_cursor = analysis_events.cursor
+        return jsonify({
+            'success': True,
+            'cursor': next_cursor,
+            'reset': True,
+            'entries': _today_analysis_status()
+        })
+    except Exception as e:
+        logger.error(f"获取分析状态变化失败: {e}")
+        return jsonify({'success': False, 'message': str(e)}), 500
+
 @diary_bp.route('/notion/sync', methods=['POST'])
 @require_auth
 def sync_to_notion():
@@ -1,12 +1,18 @@
+import logging
 from flask import Blueprint, request, jsonify, session
-from src.models.mcp import MCPServer, UserMemory, MCPExecutionLog
+from src.models.mcp import MCPServer, UserMemory, MCPExecutionLog, MCPExecutionStat
 from src.models.user import db
 from src.mcp.client import get_mcp_manager
+from src.mcp.memory_search import memory_search
+from src.mcp.memory_consolidation import memory_consolidator
+from src.services.async_runner import async_runner
+from src.mcp.execution_log import execution_log_writer
+from datetime import datetime, timedelta
 from functools import wraps
 import json
-import asyncio
 
 mcp_bp = Blueprint('mcp', __name__)
+logger = logging.getLogger(__name__)
 
 def require_auth(f):
     """认证装饰器"""
@@ -80,6 +86,9 @@ def update_server(server_id):
     try:
         server = MCPServer.query.get_or_404(server_id)
         data = request.json
+        mcp_manager = get_mcp_manager(db.session)
+        old_name = server.name
+        was_running = not server.builtin and old_name in mcp_manager.pools
         
         if data.get('name') and data['name'] != server.name:
             # 检查新名称是否已存在
@@ -99,6 +108,17 @@ def update_server(server_id):
             
         db.session.commit()
         
+        # 正在运行的服务器按新配置重启进程
+        if was_running:
+            async_runner.run(mcp_manager.stop_server(old_name))
+            if server.enabled:
+                async_runner.run(mcp_manager.start_server({
+                    'name': server.name,
+                    'command': server.command,
+                    'args': server.args,
+                    'env': server.env
+                }))
+        
         return jsonify({'message': '服务器配置更新成功', 'server': server.to_dict()})
     except Exception as e:
         db.session.rollback()
@@ -116,8 +136,7 @@ def delete_server(server_id):
         
         # 停止服务器（如果正在运行）
         mcp_manager = get_mcp_manager(db.session)
-        import asyncio
-        asyncio.run(mcp_manager.stop_server(server.name))
+        async_runner.run(mcp_manager.stop_server(server.name))
         
         db.session.delete(server)
         db.session.commit()
@@ -135,12 +154,10 @@ def toggle_server(server_id):
         server = MCPServer.query.get_or_404(server_id)
         mcp_manager = get_mcp_manager(db.session)
         
-        # 由于Flask路由不支持async，我们需要使用asyncio.run
-        import asyncio
-        
+        # Flask路由不支持async，交给常驻的后台事件循环执行
         if server.enabled:
             # 启动服务器
-            success = asyncio.run(mcp_manager.start_server({
+            success = async_runner.run(mcp_manager.start_server({
                 'name': server.name,
                 'command': server.command,
                 'args': server.args,
@@ -152,7 +169,7 @@ def toggle_server(server_id):
                 return jsonify({'error': f'服务器 {server.name} 启动失败'}), 500
         else:
             # 停止服务器
-            success = asyncio.run(mcp_manager.stop_server(server.name))
+            success = async_runner.run(mcp_manager.stop_server(server.name))
             if success:
                 return jsonify({'message': f'服务器 {server.name} 停止成功'})
             else:
@@ -161,6 +178,24 @@ def toggle_server(server_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@mcp_bp.route('/servers/<int:server_id>/tools', methods=['GET'])
+@require_auth
+def get_server_tools(server_id):
+    """获取MCP服务器提供的工具列表"""
+    try:
+        server = MCPServer.query.get_or_404(server_id)
+        if server.builtin:
+            return jsonify({'tools': []})
+        
+        mcp_manager = get_mcp_manager(db.session)
+        if server.name not in mcp_manager.pools:
+            return jsonify({'error': f'服务器 {server.name} 未启动'}), 400
+        
+        tools = async_runner.run(mcp_manager.list_tools(server.name), timeout=mcp_manager.request_timeout)
+        return jsonify({'tools': tools})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @mcp_bp.route('/memories', methods=['GET'])
 @require_auth
 def get_memories():
@@ -175,17 +210,29 @@ def get_memories():
         memory_type = request.args.get('type')
         search = request.args.get('search')
         
+        if search:
+            # 搜索时按相关度排序，要求全部检索词命中
+            ranked = memory_search.rank(user_id, search, limit=None, memory_type=memory_type, match_all=True)
+            page_ids = [memory_id for memory_id, _ in ranked[(page - 1) * per_page:page * per_page]]
+            scores = dict(ranked)
+            memories = []
+            for memory in memory_search.load(page_ids):
+                memory_dict = memory.to_dict()
+                memory_dict['relevance'] = scores[memory.id]
+                memories.append(memory_dict)
+            
+            return jsonify({
+                'memories': memories,
+                'total': len(ranked),
+                'pages': (len(ranked) + per_page - 1) // per_page,
+                'current_page': page
+            })
+        
         query = UserMemory.query.filter(UserMemory.user_id == user_id)
         
         if memory_type:
             query = query.filter(UserMemory.memory_type == memory_type)
         
-        if search:
-            query = query.filter(db.or_(
-                UserMemory.key.contains(search),
-                UserMemory.value.contains(search)
-            ))
-        
         pagination = query.order_by(UserMemory.updated_at.desc()).paginate(
             page=page, per_page=per_page, error_out=False
         )
@@ -220,6 +267,21 @@ def get_memory_stats():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@mcp_bp.route('/memories/consolidate', methods=['POST'])
+@require_auth
+def consolidate_memories():
+    """立即合并当前用户的重复记忆，dry_run 为真时只返回将要合并的记忆"""
+    try:
+        user_id = session.get('user_id')
+        if not user_id:
+            return jsonify({'error': '未找到用户'}), 404
+        data = request.get_json(silent=True) or {}
+        result = memory_consolidator.consolidate_user(user_id, dry_run=bool(data.get('dry_run')))
+        return jsonify({'result': result})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
 @mcp_bp.route('/memories/clear', methods=['DELETE'])
 @require_auth
 def clear_all_memories():
@@ -295,6 +357,13 @@ def delete_memories_batch():
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+def _flush_execution_logs():
+    """查询前写入缓冲区中的日志；写入失败（例如数据库被锁）时日志已放回缓冲区，只返回已落库的数据"""
+    try:
+        execution_log_writer.flush()
+    except Exception as e:
+        logger.warning(f"写入MCP执行日志失败，本次查询不含缓冲区中的日志: {e}")
+
 @mcp_bp.route('/logs', methods=['GET'])
 @require_auth
 def get_execution_logs():
@@ -308,6 +377,9 @@ def get_execution_logs():
         per_page = request.args.get('per_page', 20, type=int)
         server_name = request.args.get('server')
         
+        # 先写入缓冲区中尚未落库的日志
+        _flush_execution_logs()
+        
         query = MCPExecutionLog.query.filter(MCPExecutionLog.user_id == user_id)
         
         if server_name:
@@ -326,4 +398,25 @@ def get_execution_logs():
             'current_page': page
         })
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
\ No newline at end of file
+        return jsonify({'error': str(e)}), 500
+
+@mcp_bp.route('/logs/stats', methods=['GET'])
+@require_auth
+def get_execution_stats():
+    """获取MCP调用按天汇总的统计（包含未采样写入明细的调用）"""
+    try:
+        days = request.args.get('days', 7, type=int)
+        server_name = request.args.get('server')
+        _flush_execution_logs()
+        
+        # 统计日期与日志的 created_at 一致，使用 UTC 日期
+        since = datetime.utcnow().date() - timedelta(days=max(days, 1) - 1)
+        query = MCPExecutionStat.query.filter(MCPExecutionStat.day >= since)
+        if server_name:
+            query = query.filter(MCPExecutionStat.server_name == server_name)
+        
+        stats = query.order_by(MCPExecutionStat.day.desc(), MCPExecutionStat.server_name,
+                               MCPExecutionStat.tool_name).all()
+        return jsonify({'stats': [stat.to_dict() for stat in stats]})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
@@ -1,26 +1,98 @@
+import os
+import time
 import openai
-import base64
 import json
 import re
 import asyncio
 import logging
+import threading
+import httpx
 from openai import NotFoundError, BadRequestError
 from datetime import datetime
 from src.mcp.client import get_mcp_manager
+from src.mcp.keywords import extract_keywords
+from src.services.async_runner import async_runner
+from src.services.image_service import image_service
 from src.models.user import db
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_SUMMARY_PROMPT = "请根据用户今天的所有日记条目，生成一份完整的日记总结。"
+
+# 滚动摘要：每条日记分析完成后把它合并进当天的摘要，零点只需基于摘要生成总结
+DIGEST_PROMPT = (
+    "你负责维护用户当天日记的滚动摘要。根据已有摘要和新增的日记条目，输出更新后的完整摘要："
+    "按时间顺序保留事件、情绪变化和值得记住的细节，合并重复内容，不要编造，不超过{max_chars}字。只输出摘要正文。"
+)
+
+_CJK = re.compile(r'[\u3000-\u9fff\uac00-\ud7af\uff00-\uffef]')
+
+
+def estimate_tokens(text) -> int:
+    """粗略估算 token 数：中日韩字符约 1 个 token，其余约 4 个字符 1 个 token"""
+    if not text:
+        return 0
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def clip_to_tokens(text, max_tokens, keep='head'):
+    """把文本截断到约 max_tokens 个 token 以内，keep='tail' 时保留末尾"""
+    if not text or estimate_tokens(text) <= max_tokens:
+        return text or ''
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        part = text[:middle] if keep == 'head' else text[-middle:]
+        if estimate_tokens(part) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    part = text[:low] if keep == 'head' else text[len(text) - low:]
+    return part + '…' if keep == 'head' else '…' + part
+
+
 class AIService:
+    # 快照中缓存的配置项
+    CONFIG_KEYS = ('ai_api_url', 'ai_api_key', 'ai_model', 'ai_prompt_template', 'ai_summary_prompt')
+    # 支持的接口：Chat Completions 与 Responses API
+    ENDPOINTS = ('chat', 'responses')
+
     def __init__(self):
         self.client = None
         self.api_url = None
         self.api_key = None
         self.model = None
+        # 配置快照：写配置时递增 _config_version，读取时版本一致则直接复用
+        self._config = {}
+        self._config_version = 0
+        self._loaded_version = None
+        self._config_lock = threading.Lock()
+        self._http_client = None
+        # 接口探测缓存：(api_url, model) -> (endpoint, 探测时间)
+        self.endpoint_ttl = float(os.environ.get('AI_ENDPOINT_TTL', 3600))
+        self._endpoint_cache = {}
+        self._endpoint_lock = threading.Lock()
+        self._endpoint_stats = {
+            endpoint: {'calls': 0, 'successes': 0, 'failures': 0, 'total_latency': 0.0, 'last_latency': 0.0,
+                       'streams': 0, 'total_ttft': 0.0, 'last_ttft': 0.0}
+            for endpoint in self.ENDPOINTS
+        }
+
+    def invalidate_config(self):
+        """使配置快照失效，下次调用时重新从数据库加载"""
+        with self._config_lock:
+            self._config_version += 1
+
+    def get_config_value(self, key, default=None):
+        """从配置快照中读取配置值"""
+        value = self._config.get(key)
+        return value if value else default
 
     def test_connection(self):
         """测试与AI服务的连通性"""
         # 重新加载配置
+        self.invalidate_config()
         self._load_config()
         if not self.client:
             return False, "AI服务未配置"
@@ -34,50 +106,72 @@ class AIService:
     def _load_config(self):
         """加载AI配置。
 
+        配置未变更时直接复用内存快照与已有客户端；只有API地址或密钥变化时才重建客户端。
         当配置不完整或缺少API密钥时，主动清除已有的客户端实例，防止沿用过期配置。
         """
-        try:
-            from src.models.diary import Config
-
-            api_url_config = Config.query.filter_by(key='ai_api_url').first()
-            api_key_config = Config.query.filter_by(key='ai_api_key').first()
-            model_config = Config.query.filter_by(key='ai_model').first()
-
-            # 判断配置是否完整且包含有效的API密钥
-            if api_url_config and api_key_config and model_config and api_key_config.value:
-                self.api_url = api_url_config.value
-                self.api_key = api_key_config.value
-                self.model = model_config.value
-
-                # 初始化OpenAI客户端
-                self.client = openai.OpenAI(
-                    api_key=self.api_key,
-                    base_url=self.api_url
-                )
-            else:
-                # 配置不完整或缺少密钥，清除已有实例并打印警告
-                if any([self.client, self.api_url, self.api_key, self.model]):
-                    logger.warning("AI配置不完整或缺失，已清除旧的AI客户端配置")
-                self.client = None
-                self.api_url = None
-                self.api_key = None
-                self.model = None
-        except Exception as e:
-            # 如果加载配置失败，也要清除配置，避免复用旧实例
-            self.client = None
-            self.api_url = None
-            self.api_key = None
-            self.model = None
-            logger.error(f"加载AI配置失败: {e}")
+        if self._loaded_version == self._config_version:
+            return
+
+        with self._config_lock:
+            version = self._config_version
+            if self._loaded_version == version:
+                return
+            try:
+                from src.models.diary import Config
+
+                rows = Config.query.filter(Config.key.in_(self.CONFIG_KEYS)).all()
+                config = {row.key: row.value for row in rows}
+                api_url = config.get('ai_api_url')
+                api_key = config.get('ai_api_key')
+                model = config.get('ai_model')
+
+                # 判断配置是否完整且包含有效的API密钥
+                if api_url and api_key and model:
+                    if self.client is None or (api_url, api_key) != (self.api_url, self.api_key):
+                        self._replace_client(openai.OpenAI(
+                            api_key=api_key,
+                            base_url=api_url,
+                            http_client=self._build_http_client()
+                        ))
+                    self.api_url = api_url
+                    self.api_key = api_key
+                    self.model = model
+                else:
+                    # 配置不完整或缺少密钥，清除已有实例并打印警告
+                    if any([self.client, self.api_url, self.api_key, self.model]):
+                        logger.warning("AI配置不完整或缺失，已清除旧的AI客户端配置")
+                    self._clear_client()
+
+                self._config = config
+                self._loaded_version = version
+            except Exception as e:
+                # 如果加载配置失败，也要清除配置，避免复用旧实例；下次调用会重新尝试加载
+                self._clear_client()
+                self._config = {}
+                self._loaded_version = None
+                logger.error(f"加载AI配置失败: {e}")
+
+    def _build_http_client(self):
+        """创建可复用的HTTP连接池，保持长连接以避免重复TLS握手"""
+        self._http_client = httpx.Client(
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=120),
+            timeout=httpx.Timeout(120.0, connect=10.0)
+        )
+        return self._http_client
+
+    def _replace_client(self, client):
+        # 不主动关闭旧客户端，其他线程可能仍在使用，交由垃圾回收释放连接
+        self.client = client
+
+    def _clear_client(self):
+        self._replace_client(None)
+        self.api_url = None
+        self.api_key = None
+        self.model = None
     
     def _encode_image(self, image_path):
-        """将图片编码为base64"""
-        try:
-            with open(image_path, "rb") as image_file:
-                return base64.b64encode(image_file.read()).decode('utf-8')
-        except Exception as e:
-            logger.error(f"图片编码失败: {e}")
-            return None
+        """将图片预处理并编码为base64，返回 (MIME类型, base64字符串)"""
+        return image_service.encode_for_vision(image_path)
 
     def _extract_text_from_message(self, message):
         """从AI返回的消息中提取纯文本内容，兼容思考类型模型"""
@@ -108,36 +202,176 @@ class AIService:
 
         return ""
 
-    def _call_ai_api(self, messages, max_tokens, temperature):
-        """调用底层AI接口，兼容Chat Completions和Responses API"""
-        # 优先尝试 Chat Completions 接口
+    def _call_ai_api(self, messages, max_tokens, temperature, on_token=None):
+        """调用底层AI接口，兼容Chat Completions和Responses API
+
+        每个 (api_url, model) 首次调用时探测可用接口并记住结果，之后直接调用该接口；
+        缓存超过 AI_ENDPOINT_TTL 秒后重新探测。已记住的接口报错时会尝试另一个接口。
+        提供 on_token 回调时使用流式输出，每收到一段文本即回调一次，返回值仍为完整文本。
+        """
+        key = (self.api_url, self.model)
+        known = self._get_known_endpoint(key)
+        if known:
+            order = [known] + [e for e in self.ENDPOINTS if e != known]
+        else:
+            # 优先尝试 Chat Completions 接口
+            order = list(self.ENDPOINTS)
+
+        last_error = None
+        for endpoint in order:
+            try:
+                text = self._invoke_endpoint(endpoint, messages, max_tokens, temperature, on_token)
+            except (NotFoundError, BadRequestError, AttributeError) as e:
+                # 若接口不存在或不支持，尝试另一个接口
+                last_error = e
+                continue
+            if endpoint != known:
+                self._remember_endpoint(key, endpoint)
+            return text
+        raise last_error
+
+    def _invoke_endpoint(self, endpoint, messages, max_tokens, temperature, on_token=None):
+        """调用指定接口并记录成功率、耗时与首个token耗时"""
+        started = time.monotonic()
+        ttft = None
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                max_tokens=max_tokens,
-                temperature=temperature,
-            )
-            return self._extract_text_from_message(response.choices[0].message)
-        except (NotFoundError, BadRequestError, AttributeError):
-            # 若接口不存在或不支持，尝试新的 Responses API
-            response = self.client.responses.create(
-                model=self.model,
-                input=messages,
-                max_output_tokens=max_tokens,
-                temperature=temperature,
-            )
-            # Responses API 提供 output_text 字段作为最终文本
-            if getattr(response, "output_text", None):
-                return response.output_text.strip()
-            # 兼容旧结构，提取第一个输出消息
-            output = getattr(response, "output", None)
-            if output:
-                return self._extract_text_from_message(output[0])
-            return ""
+            if on_token is not None:
+                stream = self._stream_chat_completions if endpoint == 'chat' else self._stream_responses
+                parts = []
+                for delta in stream(messages, max_tokens, temperature):
+                    if ttft is None:
+                        ttft = time.monotonic() - started
+                    parts.append(delta)
+                    on_token(delta)
+                text = "".join(parts).strip()
+            elif endpoint == 'chat':
+                text = self._call_chat_completions(messages, max_tokens, temperature)
+            else:
+                text = self._call_responses(messages, max_tokens, temperature)
+        except Exception:
+            self._record_endpoint_call(endpoint, False, time.monotonic() - started)
+            raise
+        self._record_endpoint_call(endpoint, True, time.monotonic() - started, ttft)
+        return text
+
+    def _call_chat_completions(self, messages, max_tokens, temperature):
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+        )
+        return self._extract_text_from_message(response.choices[0].message)
+
+    def _call_responses(self, messages, max_tokens, temperature):
+        response = self.client.responses.create(
+            model=self.model,
+            input=messages,
+            max_output_tokens=max_tokens,
+            temperature=temperature,
+        )
+        # Responses API 提供 output_text 字段作为最终文本
+        if getattr(response, "output_text", None):
+            return response.output_text.strip()
+        # 兼容旧结构，提取第一个输出消息
+        output = getattr(response, "output", None)
+        if output:
+            return self._extract_text_from_message(output[0])
+        return ""
+
+    def _stream_chat_completions(self, messages, max_tokens, temperature):
+        """流式调用 Chat Completions，逐段产出文本（忽略思考过程）"""
+        stream = self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stream=True,
+        )
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = getattr(chunk.choices[0].delta, "content", None)
+            if isinstance(delta, str) and delta:
+                yield delta
+
+    def _stream_responses(self, messages, max_tokens, temperature):
+        """流式调用 Responses API，逐段产出文本"""
+        stream = self.client.responses.create(
+            model=self.model,
+            input=messages,
+            max_output_tokens=max_tokens,
+            temperature=temperature,
+            stream=True,
+        )
+        for event in stream:
+            if getattr(event, "type", None) == "response.output_text.delta" and event.delta:
+                yield event.delta
+
+    def _get_known_endpoint(self, key):
+        with self._endpoint_lock:
+            cached = self._endpoint_cache.get(key)
+            if not cached:
+                return None
+            endpoint, detected_at = cached
+            if time.monotonic() - detected_at > self.endpoint_ttl:
+                del self._endpoint_cache[key]
+                return None
+            return endpoint
+
+    def _remember_endpoint(self, key, endpoint):
+        with self._endpoint_lock:
+            self._endpoint_cache[key] = (endpoint, time.monotonic())
+        logger.info(f"AI接口探测完成: {key[0]} / {key[1]} 使用 {endpoint}")
+
+    def _record_endpoint_call(self, endpoint, success, latency, ttft=None):
+        with self._endpoint_lock:
+            stats = self._endpoint_stats[endpoint]
+            stats['calls'] += 1
+            stats['successes' if success else 'failures'] += 1
+            stats['total_latency'] += latency
+            stats['last_latency'] = latency
+            if ttft is not None:
+                stats['streams'] += 1
+                stats['total_ttft'] += ttft
+                stats['last_ttft'] = ttft
+
+    def get_endpoint_stats(self):
+        """获取接口探测结果与各接口的调用统计"""
+        now = time.monotonic()
+        with self._endpoint_lock:
+            detected = [
+                {
+                    'api_url': api_url,
+                    'model': model,
+                    'endpoint': endpoint,
+                    'age_seconds': round(now - detected_at, 1)
+                }
+                for (api_url, model), (endpoint, detected_at) in self._endpoint_cache.items()
+            ]
+            endpoints = {}
+            for endpoint, stats in self._endpoint_stats.items():
+                calls = stats['calls']
+                streams = stats['streams']
+                endpoints[endpoint] = {
+                    'calls': calls,
+                    'successes': stats['successes'],
+                    'failures': stats['failures'],
+                    'avg_latency_ms': round(stats['total_latency'] / calls * 1000, 1) if calls else None,
+                    'last_latency_ms': round(stats['last_latency'] * 1000, 1) if calls else None,
+                    'streams': streams,
+                    'avg_ttft_ms': round(stats['total_ttft'] / streams * 1000, 1) if streams else None,
+                    'last_ttft_ms': round(stats['last_ttft'] * 1000, 1) if streams else None
+                }
+        return {'ttl_seconds': self.endpoint_ttl, 'detected': detected, 'endpoints': endpoints}
     
-    def analyze_entry(self, text_content=None, image_path=None, user_id=None):
-        """分析日记条目（增强版，支持用户上下文）"""
+    def analyze_entry(self, text_content=None, image_path=None, user_id=None, extract_memories=True,
+                      on_token=None):
+        """分析日记条目（增强版，支持用户上下文）
+
+        extract_memories为False时不在后台提取记忆，由调用方（如分析队列的工作线程）自行处理。
+        提供on_token时以流式方式调用模型，每收到一段文本即回调。
+        """
         # 重新加载配置
         self._load_config()
         
@@ -145,22 +379,23 @@ class AIService:
             return "AI服务未配置"
         
         try:
-            from src.models.diary import Config
-            
             # 获取提示词模板
-            prompt_config = Config.query.filter_by(key='ai_prompt_template').first()
-            base_prompt = prompt_config.value if prompt_config else "请分析这个用户的日记内容，猜测用户在做什么。"
+            base_prompt = self.get_config_value('ai_prompt_template', "请分析这个用户的日记内容，猜测用户在做什么。")
             
             # 获取用户上下文（如果提供了用户ID）
             user_context = ""
             if user_id:
                 context_data = self._get_user_context_sync(user_id, text_content or "")
                 if context_data and context_data.get('memories'):
-                    memories = context_data['memories'][:5]  # 限制到最相关的5条记忆
+                    memories = self._dedupe_memories(context_data['memories'])[:5]  # 限制到最相关的5条记忆
                     if memories:
                         user_context = "\n\n用户背景信息（请在回复中自然体现对用户的了解）：\n"
                         for memory in memories:
                             user_context += f"- {memory['key']}: {memory['value']}\n"
+                if context_data and context_data.get('external'):
+                    user_context += "\n\n其他参考信息：\n"
+                    for item in context_data['external']:
+                        user_context += f"- [{item['server']}] {item['text']}\n"
             
             # 增强提示词
             enhanced_prompt = base_prompt + user_context
@@ -170,13 +405,14 @@ class AIService:
             
             # 如果有图片，优先处理图片
             if image_path:
-                # 编码图片
-                base64_image = self._encode_image(image_path)
-                if base64_image:
+                # 编码图片（缩放、去除EXIF，并使用实际的MIME类型）
+                encoded_image = self._encode_image(image_path)
+                if encoded_image:
+                    mime_type, base64_image = encoded_image
                     user_content.append({
                         "type": "image_url",
                         "image_url": {
-                            "url": f"data:image/jpeg;base64,{base64_image}"
+                            "url": f"data:{mime_type};base64,{base64_image}"
                         }
                     })
             
@@ -222,12 +458,12 @@ class AIService:
             ai_response = self._call_ai_api(
                 messages=messages,
                 max_tokens=500,
-                temperature=0.7
+                temperature=0.7,
+                on_token=on_token
             )
             
             # 在后台线程中处理记忆提取（不阻塞响应）
-            if user_id:
-                import threading
+            if user_id and extract_memories:
                 memory_thread = threading.Thread(
                     target=self._extract_and_store_memories_sync,
                     args=(user_id, text_content, ai_response, image_path)
@@ -242,24 +478,42 @@ class AIService:
             return f"AI分析失败: {str(e)}"
     
     def _get_user_context_sync(self, user_id, content):
-        """获取用户上下文信息（同步版本）"""
+        """获取用户上下文信息（同步版本）
+
+        先从日记中提取少量关键词，再并发查询内置用户记忆和各外部MCP服务器的上下文工具，
+        慢的服务器超时后只使用已返回的结果。
+        """
         try:
             mcp_manager = get_mcp_manager(db.session)
-            if mcp_manager and mcp_manager.builtin_usermcp:
-                # 创建临时事件循环运行异步代码
-                import asyncio
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                try:
-                    return loop.run_until_complete(
-                        mcp_manager.query_user_context(user_id, content)
-                    )
-                finally:
-                    loop.close()
+            if mcp_manager and (mcp_manager.builtin_usermcp or mcp_manager.pools):
+                started = time.monotonic()
+                keywords = extract_keywords(content)
+                if not keywords and not mcp_manager.pools:
+                    return {}
+                # 在常驻的后台事件循环中执行，避免每次分析都创建新的事件循环
+                context_data = async_runner.run(mcp_manager.gather_context(user_id, content, keywords))
+                logger.debug(f"用户上下文检索完成，关键词: {keywords}, "
+                             f"命中 {len(context_data.get('memories', []))} 条记忆，"
+                             f"外部上下文 {len(context_data.get('external', []))} 条，"
+                             f"耗时 {(time.monotonic() - started) * 1000:.1f}ms")
+                return context_data
             return {}
         except Exception as e:
             logger.error(f"获取用户上下文失败: {e}")
             return {}
+
+    @staticmethod
+    def _dedupe_memories(memories):
+        """合并内容相同的记忆（不同类型下可能重复记录），保留排序靠前的一条"""
+        seen = set()
+        unique = []
+        for memory in memories:
+            signature = (str(memory.get('key', '')).strip(), str(memory.get('value', '')).strip())
+            if signature in seen:
+                continue
+            seen.add(signature)
+            unique.append(memory)
+        return unique
     
     async def _get_user_context(self, user_id, content):
         """获取用户上下文信息"""
@@ -275,24 +529,23 @@ class AIService:
     def _extract_and_store_memories_sync(self, user_id, content, ai_response, image_path=None):
         """同步版本的记忆提取和存储（用于线程调用）"""
         try:
+            from flask import has_app_context
+            if has_app_context():
+                self._run_memory_extraction(user_id, content, ai_response, image_path)
+                return
+
             # 在Flask应用上下文中运行异步代码
             from src.main import app
             with app.app_context():
-                import asyncio
-                
-                # 创建新的事件循环（因为线程中没有事件循环）
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                try:
-                    loop.run_until_complete(
-                        self._extract_and_store_memories(user_id, content, ai_response, image_path)
-                    )
-                finally:
-                    loop.close()
-                    
+                self._run_memory_extraction(user_id, content, ai_response, image_path)
+
         except Exception as e:
             logger.error(f"同步提取存储记忆失败: {e}")
     
+    def _run_memory_extraction(self, user_id, content, ai_response, image_path=None):
+        """在后台事件循环中执行记忆提取（因为线程中没有事件循环）"""
+        async_runner.run(self._extract_and_store_memories(user_id, content, ai_response, image_path))
+
     async def _extract_and_store_memories(self, user_id, content, ai_response, image_path=None):
         """提取并存储用户记忆"""
         try:
@@ -303,14 +556,11 @@ class AIService:
             # 使用AI提取记忆信息
             memories_to_store = await self._extract_memories_with_ai(content, ai_response)
             
-            # 存储记忆
-            for memory in memories_to_store:
-                await mcp_manager.builtin_usermcp.insert_user_profile(
-                    key=memory['key'],
-                    value=memory['value'],
-                    user_id=user_id,
-                    memory_type=memory['type'],
-                    confidence=memory.get('confidence', 0.8)
+            # 一次事务批量写入本次提取的全部记忆
+            if memories_to_store:
+                await mcp_manager.builtin_usermcp.upsert_user_profiles(
+                    [dict(memory, confidence=memory.get('confidence', 0.8)) for memory in memories_to_store],
+                    user_id=user_id
                 )
                 
         except Exception as e:
@@ -339,7 +589,9 @@ class AIService:
                 {"role": "system", "content": extraction_prompt},
                 {"role": "user", "content": f"日记内容：{content}\n\nAI理解：{ai_response}"}
             ]
-            result = self._call_ai_api(
+            # 模型调用是阻塞的，放到线程中执行，避免占用共享的事件循环
+            result = await asyncio.to_thread(
+                self._call_ai_api,
                 messages=messages,
                 max_tokens=300,
                 temperature=0.3
@@ -394,8 +646,29 @@ class AIService:
             logger.error(f"正则提取记忆失败: {e}")
             return []
     
-    def generate_daily_summary(self, entries):
-        """生成每日汇总"""
+    @staticmethod
+    def summary_entry_text(entry, max_tokens=None):
+        """汇总提示词中的一条日记：时间、文字和分析成功的 AI 理解，可按 token 数截断"""
+        from src.models.diary import ANALYSIS_DONE
+
+        text = f"{entry.timestamp.strftime('%H:%M')} - "
+        if entry.text_content:
+            text += f"文字：{entry.text_content} "
+        # 只引用分析成功的结果，排除分析中或失败的占位文本
+        if entry.ai_analysis and entry.analysis_status == ANALYSIS_DONE:
+            text += f"AI理解：{entry.ai_analysis}"
+        return clip_to_tokens(text, max_tokens) if max_tokens else text
+
+    def summary_prompt(self):
+        return self.get_config_value('ai_summary_prompt', DEFAULT_SUMMARY_PROMPT)
+
+    @staticmethod
+    def _record_usage(usage, messages):
+        if usage is not None:
+            usage['prompt_tokens'] = sum(estimate_tokens(message['content']) for message in messages)
+
+    def generate_daily_summary(self, entries, usage=None):
+        """生成每日汇总（把当天全部条目放进一次请求）"""
         # 重新加载配置
         self._load_config()
         
@@ -403,36 +676,22 @@ class AIService:
             return "AI服务未配置"
         
         try:
-            from src.models.diary import Config
-            
-            # 获取汇总提示词
-            summary_prompt_config = Config.query.filter_by(key='ai_summary_prompt').first()
-            summary_prompt = summary_prompt_config.value if summary_prompt_config else "请根据用户今天的所有日记条目，生成一份完整的日记总结。"
-            
             # 构建条目内容
             entries_text = ""
             for i, entry in enumerate(entries, 1):
-                entry_time = entry.timestamp.strftime("%H:%M")
-                entries_text += f"\n{i}. {entry_time} - "
-                
-                if entry.text_content:
-                    entries_text += f"文字：{entry.text_content} "
-                
-                if entry.ai_analysis:
-                    entries_text += f"AI理解：{entry.ai_analysis}"
-                
-                entries_text += "\n"
+                entries_text += f"\n{i}. {self.summary_entry_text(entry)}\n"
             
             messages = [
                 {
                     "role": "system",
-                    "content": summary_prompt
+                    "content": self.summary_prompt()
                 },
                 {
                     "role": "user",
                     "content": f"今天的日记条目：{entries_text}"
                 }
             ]
+            self._record_usage(usage, messages)
 
             # 调用AI API
             return self._call_ai_api(
@@ -445,6 +704,48 @@ class AIService:
             logger.error(f"生成日记汇总失败: {e}")
             return f"生成日记汇总失败: {str(e)}"
 
+    def update_daily_digest(self, digest, entries_text, max_chars, usage=None):
+        """把新增条目合并进当天的滚动摘要，返回新的摘要；失败时返回 None"""
+        self._load_config()
+        if not self.client:
+            return None
+
+        try:
+            messages = [
+                {"role": "system", "content": DIGEST_PROMPT.format(max_chars=max_chars)},
+                {"role": "user", "content": f"已有摘要：{digest or '（暂无）'}\n\n新增的日记条目：{entries_text}"}
+            ]
+            self._record_usage(usage, messages)
+            text = self._call_ai_api(messages=messages, max_tokens=max(256, max_chars * 2), temperature=0.3)
+            return text.strip() if text and text.strip() else None
+        except Exception as e:
+            logger.error(f"更新日记滚动摘要失败: {e}")
+            return None
+
+    def finalize_daily_summary(self, digest, entry_count, max_prompt_tokens, usage=None):
+        """基于当天的滚动摘要生成每日汇总，摘要超出提示词预算时截断"""
+        self._load_config()
+
+        if not self.client:
+            return "AI服务未配置"
+
+        try:
+            summary_prompt = self.summary_prompt()
+            budget = max(256, max_prompt_tokens - estimate_tokens(summary_prompt) - 64)
+            messages = [
+                {"role": "system", "content": summary_prompt},
+                {
+                    "role": "user",
+                    "content": f"今天共有 {entry_count} 条日记，以下是按时间顺序整理的摘要：\n{clip_to_tokens(digest, budget)}"
+                }
+            ]
+            self._record_usage(usage, messages)
+            return self._call_ai_api(messages=messages, max_tokens=1000, temperature=0.7)
+
+        except Exception as e:
+            logger.error(f"生成日记汇总失败: {e}")
+            return f"生成日记汇总失败: {str(e)}"
+
 # 全局AI服务实例
 ai_service = AIService()
 
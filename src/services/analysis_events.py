@@ -0,0 +1,78 @@
+import uuid
+import threading
+from collections import deque
+from src.models.diary import ANALYSIS_ACTIVE_STATUSES
+
+
+class AnalysisEventHub:
+    """AI分析状态变更的进程内发布/订阅中心。
+
+    分析队列在条目开始或结束分析时发布事件，客户端带着 cursor 长轮询，
+    只拿到 cursor 之后发生变化的条目；没有变化时只在内存中等待，不查询数据库。
+    cursor 形如 "<进程标识>:<序号>"，进程重启或事件已被淘汰时视为失效。
+    """
+
+    def __init__(self, max_events=1000):
+        self._epoch = uuid.uuid4().hex[:8]
+        self._seq = 0
+        self._events = deque(maxlen=max_events)
+        self._condition = threading.Condition()
+
+    @property
+    def cursor(self):
+        with self._condition:
+            return f"{self._epoch}:{self._seq}"
+
+    def publish(self, entry_id, ai_analysis, analysis_status, timestamp=None):
+        """发布一个条目的最新分析状态并唤醒所有等待者"""
+        with self._condition:
+            self._seq += 1
+            self._events.append((self._seq, {
+                'id': entry_id,
+                'ai_analysis': ai_analysis,
+                'analysis_status': analysis_status,
+                'is_analyzing': analysis_status in ANALYSIS_ACTIVE_STATUSES,
+                'timestamp': timestamp.isoformat() if timestamp else None
+            }))
+            self._condition.notify_all()
+
+    def _parse_cursor(self, cursor):
+        try:
+            epoch, seq = str(cursor).split(':', 1)
+            seq = int(seq)
+        except (TypeError, ValueError):
+            return None
+        if epoch != self._epoch or seq < 0:
+            return None
+        return seq
+
+    def changes_since(self, cursor, timeout=0):
+        """返回 (变化的条目列表, 新cursor)；cursor 失效时条目列表为 None。
+
+        没有新事件时最多阻塞 timeout 秒。同一条目多次变化只返回最新状态。
+        """
+        seq = self._parse_cursor(cursor)
+        if seq is None:
+            return None, self.cursor
+
+        with self._condition:
+            if seq > self._seq:
+                return None, f"{self._epoch}:{self._seq}"
+            if self._seq == seq and timeout > 0:
+                self._condition.wait_for(lambda: self._seq > seq, timeout)
+
+            oldest = self._events[0][0] if self._events else self._seq + 1
+            if seq + 1 < oldest and self._seq > seq:
+                # 期间的事件已被淘汰，客户端需要重新获取完整状态
+                return None, f"{self._epoch}:{self._seq}"
+
+            latest = {}
+            for event_seq, event in self._events:
+                if event_seq > seq:
+                    latest.pop(event['id'], None)
+                    latest[event['id']] = event
+            return list(latest.values()), f"{self._epoch}:{self._seq}"
+
+
+# 全局分析状态事件中心
+analysis_events = AnalysisEventHub()
@@ -0,0 +1,298 @@
+import os
+import time
+import logging
+import threading
+from collections import deque
+from datetime import timedelta
+from src.models.user import db
+from src.models.diary import (
+    DiaryEntry, AnalysisJob, ANALYSIS_PENDING, ANALYSIS_RUNNING, ANALYSIS_DONE, ANALYSIS_FAILED,
+    ANALYSIS_ACTIVE_STATUSES
+)
+from src.services.ai_service import ai_service
+from src.services.daily_digest import daily_digest
+from src.services.analysis_stream import analysis_stream
+from src.services.analysis_events import analysis_events
+from src.services.time_service import time_service
+
+logger = logging.getLogger(__name__)
+
+FAILURE_PREFIX = "AI分析失败"
+
+
+class AnalysisQueue:
+    """持久化的AI分析任务队列。
+
+    任务写入 analysis_jobs 表，由固定数量的工作线程消费；失败的任务按指数退避重试，
+    进程重启后会恢复未完成的任务以及分析状态仍为 pending/running 的条目。
+    """
+
+    def __init__(self):
+        self.workers = int(os.environ.get('ANALYSIS_WORKERS', 2))
+        self.max_attempts = int(os.environ.get('ANALYSIS_MAX_ATTEMPTS', 3))
+        self.retry_base_seconds = float(os.environ.get('ANALYSIS_RETRY_BASE_SECONDS', 5))
+        self.poll_interval = float(os.environ.get('ANALYSIS_POLL_INTERVAL', 2))
+        # 是否以流式方式调用模型，供 SSE 接口实时推送分析内容
+        self.streaming = os.environ.get('ANALYSIS_STREAMING', 'true').lower() == 'true'
+        self.app = None
+        self._threads = []
+        self._condition = threading.Condition()
+        self._claim_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._started = False
+        self._stop_event = threading.Event()
+        self._stats_lock = threading.Lock()
+        self._wait_times = deque(maxlen=200)
+        self._run_times = deque(maxlen=200)
+        self._processed = 0
+        self._failed = 0
+        self._retried = 0
+        self._recovered = 0
+
+    @property
+    def running(self):
+        return any(t.is_alive() for t in self._threads)
+
+    def start(self, app):
+        """启动工作线程并恢复重启前未完成的任务"""
+        # 并发的首次请求可能同时触发启动：检查、恢复和创建线程需在同一把锁内完成，
+        # 否则第二次恢复会把第一组线程正在处理的任务重置为 queued，导致条目被重复分析
+        with self._start_lock:
+            if self.running:
+                return
+
+            self.app = app
+            self._stop_event.clear()
+            with app.app_context():
+                self._recover()
+
+            self._threads = []
+            for i in range(max(1, self.workers)):
+                thread = threading.Thread(target=self._worker_loop, name=f'analysis-worker-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            self._started = True
+        logger.info(f"AI分析队列已启动，工作线程数: {len(self._threads)}")
+
+    def stop(self):
+        """停止工作线程（正在执行的任务会在完成后退出）"""
+        with self._start_lock:
+            self._started = False
+            self._stop_event.set()
+        with self._condition:
+            self._condition.notify_all()
+        logger.info("AI分析队列已停止")
+
+    def enqueue(self, entry, image_path=None, user_id=None):
+        """为日记条目创建分析任务，需在应用上下文中调用"""
+        job = AnalysisJob(entry_id=entry.id, image_path=image_path, user_id=user_id)
+        entry.analysis_status = ANALYSIS_PENDING
+        db.session.add(job)
+        db.session.commit()
+        analysis_events.publish(entry.id, entry.ai_analysis, ANALYSIS_PENDING, entry.timestamp)
+
+        # 先写入任务再惰性启动，避免启动时的恢复流程把该条目重复入队
+        if not (self._started and self.running):
+            from flask import current_app
+            self.start(current_app._get_current_object())
+        with self._condition:
+            self._condition.notify()
+        return job
+
+    def _recover(self):
+        """恢复中断的任务：running 重置为 queued，没有任务的 pending/running 条目重新入队"""
+        try:
+            now = time_service.get_beijing_time()
+            reset = AnalysisJob.query.filter(AnalysisJob.status == 'running').update(
+                {'status': 'queued', 'next_run_at': now}, synchronize_session=False
+            )
+
+            pending_ids = {job.entry_id for job in AnalysisJob.query.filter(
+                AnalysisJob.status == 'queued'
+            ).with_entities(AnalysisJob.entry_id)}
+            orphans = DiaryEntry.query.filter(
+                DiaryEntry.analysis_status.in_(ANALYSIS_ACTIVE_STATUSES)
+            ).all()
+
+            user_id = None
+            if orphans:
+                from src.models.diary import Auth
+                auth_record = Auth.query.first()
+                user_id = auth_record.id if auth_record else None
+
+            requeued = 0
+            for entry in orphans:
+                entry.analysis_status = ANALYSIS_PENDING
+                if entry.id in pending_ids:
+                    continue
+                image_path = None
+                if entry.image_path:
+                    image_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static', entry.image_path)
+                db.session.add(AnalysisJob(entry_id=entry.id, image_path=image_path, user_id=user_id))
+                requeued += 1
+
+            db.session.commit()
+            with self._stats_lock:
+                self._recovered += reset + requeued
+            if reset or requeued:
+                logger.info(f"AI分析队列恢复完成：重置 {reset} 个中断任务，重新入队 {requeued} 个条目")
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"恢复AI分析任务失败: {e}")
+
+    def _worker_loop(self):
+        while not self._stop_event.is_set():
+            try:
+                with self.app.app_context():
+                    job = self._claim_next()
+                    if job is not None:
+                        self._process(job)
+                        continue
+            except Exception as e:
+                logger.error(f"AI分析工作线程异常: {e}")
+
+            with self._condition:
+                if not self._stop_event.is_set():
+                    self._condition.wait(self.poll_interval)
+
+    def _claim_next(self):
+        """领取一个到期的任务，领取时以条件更新保证同一任务只被执行一次"""
+        with self._claim_lock:
+            now = time_service.get_beijing_time()
+            job = AnalysisJob.query.filter(
+                AnalysisJob.status == 'queued',
+                AnalysisJob.next_run_at <= now
+            ).order_by(AnalysisJob.next_run_at.asc(), AnalysisJob.id.asc()).first()
+            if job is None:
+                return None
+
+            claimed = AnalysisJob.query.filter(
+                AnalysisJob.id == job.id,
+                AnalysisJob.status == 'queued'
+            ).update({
+                'status': 'running',
+                'started_at': now,
+                'attempts': AnalysisJob.attempts + 1
+            }, synchronize_session=False)
+            db.session.commit()
+            if not claimed:
+                return None
+            db.session.refresh(job)
+            return job
+
+    def _process(self, job):
+        started = time.monotonic()
+        wait_seconds = (job.started_at - job.created_at).total_seconds() if job.created_at else 0.0
+
+        entry = db.session.get(DiaryEntry, job.entry_id)
+        if entry is None:
+            # 条目已被删除，直接丢弃任务
+            db.session.delete(job)
+            db.session.commit()
+            return
+
+        entry_id, text_content, timestamp = entry.id, entry.text_content, entry.timestamp
+        image_path, user_id = job.image_path, job.user_id
+        entry.analysis_status = ANALYSIS_RUNNING
+        entry.analysis_attempts = (entry.analysis_attempts or 0) + 1
+        entry.analysis_started_at = time_service.get_beijing_time()
+        entry.analysis_finished_at = None
+        db.session.commit()
+        analysis_events.publish(entry_id, entry.ai_analysis, ANALYSIS_RUNNING, timestamp)
+        on_token = None
+        if self.streaming:
+            analysis_stream.begin(entry_id)
+            on_token = lambda delta: analysis_stream.publish(entry_id, delta)
+        try:
+            analysis = ai_service.analyze_entry(text_content, image_path, user_id, extract_memories=False,
+                                                on_token=on_token)
+            if analysis and analysis.startswith(FAILURE_PREFIX):
+                raise RuntimeError(analysis[len(FAILURE_PREFIX):].lstrip(': '))
+        except Exception as e:
+            self._handle_failure(job, entry, e)
+            return
+
+        entry.ai_analysis = analysis
+        entry.analysis_status = ANALYSIS_DONE
+        entry.analysis_finished_at = time_service.get_beijing_time()
+        db.session.delete(job)
+        db.session.commit()
+        analysis_stream.finish(entry_id, analysis)
+        analysis_events.publish(entry_id, analysis, ANALYSIS_DONE, timestamp)
+        logger.info(f"AI分析完成，条目ID: {entry_id}, 分析结果: {analysis[:50]}...")
+        self._record(wait_seconds, time.monotonic() - started)
+
+        # 记忆提取在同一工作线程内完成，不再额外创建线程
+        if user_id:
+            ai_service._extract_and_store_memories_sync(user_id, text_content, analysis, image_path)
+
+        # 合并进当天的滚动摘要，零点生成总结时不必重新读取全天内容
+        daily_digest.on_entry_analyzed(entry)
+
+    def _handle_failure(self, job, entry, error):
+        """失败时按指数退避重新排队，超过最大次数后写入失败信息"""
+        db.session.rollback()
+        job.last_error = str(error)
+        if job.attempts < self.max_attempts:
+            delay = self.retry_base_seconds * (2 ** (job.attempts - 1))
+            job.status = 'queued'
+            job.next_run_at = time_service.get_beijing_time() + timedelta(seconds=delay)
+            entry.analysis_status = ANALYSIS_PENDING
+            with self._stats_lock:
+                self._retried += 1
+            logger.warning(f"AI分析失败，条目ID: {entry.id}，{delay:.0f} 秒后第 {job.attempts + 1} 次重试: {error}")
+        else:
+            job.status = 'failed'
+            entry.ai_analysis = f"{FAILURE_PREFIX}: {error}"
+            entry.analysis_status = ANALYSIS_FAILED
+            entry.analysis_finished_at = time_service.get_beijing_time()
+            analysis_stream.finish(entry.id, entry.ai_analysis, ANALYSIS_FAILED)
+            analysis_events.publish(entry.id, entry.ai_analysis, ANALYSIS_FAILED, entry.timestamp)
+            with self._stats_lock:
+                self._failed += 1
+            logger.error(f"AI分析失败，条目ID: {entry.id}，已重试 {job.attempts} 次: {error}")
+        db.session.commit()
+
+    def _record(self, wait_seconds, run_seconds):
+        with self._stats_lock:
+            self._processed += 1
+            self._wait_times.append(wait_seconds)
+            self._run_times.append(run_seconds)
+
+    @staticmethod
+    def _summarize(samples):
+        if not samples:
+            return {'avg': None, 'p95': None, 'max': None}
+        ordered = sorted(samples)
+        return {
+            'avg': round(sum(ordered) / len(ordered), 3),
+            'p95': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+            'max': round(ordered[-1], 3)
+        }
+
+    def get_stats(self):
+        """返回队列深度与延迟统计，需在应用上下文中调用"""
+        depth = {'queued': 0, 'running': 0, 'failed': 0}
+        try:
+            rows = db.session.query(AnalysisJob.status, db.func.count(AnalysisJob.id)).group_by(AnalysisJob.status).all()
+            for status, count in rows:
+                depth[status] = count
+        except Exception as e:
+            logger.error(f"获取AI分析队列深度失败: {e}")
+
+        with self._stats_lock:
+            return {
+                'running': self.running,
+                'workers': len(self._threads),
+                'depth': depth,
+                'processed': self._processed,
+                'failed': self._failed,
+                'retried': self._retried,
+                'recovered': self._recovered,
+                'wait_seconds': self._summarize(self._wait_times),
+                'run_seconds': self._summarize(self._run_times)
+            }
+
+
+# 全局分析队列实例
+analysis_queue = AnalysisQueue()
@@ -0,0 +1,77 @@
+import queue
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class AnalysisStream:
+    """进程内的AI分析流式输出中转。
+
+    分析队列的工作线程把模型输出的文本片段发布到这里，SSE 连接订阅对应条目，
+    订阅时先收到已生成的内容，之后实时收到新的片段，直到分析结束。
+    """
+
+    def __init__(self, max_pending=1000):
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._buffers = {}      # entry_id -> 已生成的文本片段列表
+        self._subscribers = {}  # entry_id -> set(queue.Queue)
+
+    def begin(self, entry_id):
+        """开始一次新的分析输出，清空旧内容并通知订阅者"""
+        with self._lock:
+            self._buffers[entry_id] = []
+        self._broadcast(entry_id, ('reset', ''))
+
+    def publish(self, entry_id, delta):
+        """发布一段新生成的文本，任何异常都不会影响分析流程"""
+        try:
+            with self._lock:
+                buffer = self._buffers.setdefault(entry_id, [])
+                buffer.append(delta)
+            self._broadcast(entry_id, ('delta', delta))
+        except Exception as e:
+            logger.error(f"发布分析输出失败: {e}")
+
+    def finish(self, entry_id, text, status='done'):
+        """结束分析输出，status 为 done 或 failed"""
+        with self._lock:
+            self._buffers.pop(entry_id, None)
+        self._broadcast(entry_id, (status, text))
+
+    def subscribe(self, entry_id):
+        """订阅条目的分析输出，返回 (已生成的文本, 事件队列)"""
+        subscriber = queue.Queue(maxsize=self.max_pending)
+        with self._lock:
+            self._subscribers.setdefault(entry_id, set()).add(subscriber)
+            partial = "".join(self._buffers.get(entry_id, []))
+        return partial, subscriber
+
+    def unsubscribe(self, entry_id, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(entry_id)
+            if subscribers:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[entry_id]
+
+    def _broadcast(self, entry_id, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(entry_id, ()))
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(event)
+            except queue.Full:
+                # 消费过慢的订阅者丢弃片段，但结束事件必须送达（其中包含完整结果）
+                if event[0] == 'delta':
+                    continue
+                try:
+                    subscriber.get_nowait()
+                    subscriber.put_nowait(event)
+                except (queue.Empty, queue.Full):
+                    pass
+
+
+# 全局分析输出流实例
+analysis_stream = AnalysisStream()
@@ -0,0 +1,150 @@
+import time
+import asyncio
+import logging
+import threading
+import contextvars
+import concurrent.futures
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncRunner:
+    """常驻后台线程的事件循环，供同步代码（Flask 路由、工作线程）执行协程。
+
+    首次提交时启动，之后所有 MCP 调用复用同一个事件循环，不再每次创建和关闭；
+    多个协程可以同时提交并在该循环中并发执行。协程在提交方的上下文副本中运行，可以读取提交方的 Flask 应用上下文；
+    所有协程共用这一个线程，同步的数据库操作需通过 run_db 放到线程中执行，不能直接在协程中查询。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._timeouts = 0
+        self._total_seconds = 0.0
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _ensure_started(self):
+        with self._lock:
+            if self.running:
+                return self._loop
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def run_loop():
+                asyncio.set_event_loop(loop)
+                loop.call_soon(ready.set)
+                loop.run_forever()
+
+            self._thread = threading.Thread(target=run_loop, name='async-runner', daemon=True)
+            self._thread.start()
+            ready.wait()
+            self._loop = loop
+            logger.info("后台事件循环已启动")
+            return loop
+
+    def submit(self, coro):
+        """提交协程，返回 concurrent.futures.Future，可在任意线程调用"""
+        loop = self._ensure_started()
+        if threading.current_thread() is self._thread:
+            coro.close()
+            raise RuntimeError("不能在后台事件循环内同步等待协程，请直接 await")
+
+        context = contextvars.copy_context()
+        future = concurrent.futures.Future()
+        started = time.monotonic()
+        with self._stats_lock:
+            self._submitted += 1
+
+        def schedule():
+            if future.cancelled():
+                coro.close()
+                return
+            task = context.run(loop.create_task, coro)
+
+            def on_task_done(done):
+                if future.cancelled():
+                    return
+                if done.cancelled():
+                    future.cancel()
+                elif done.exception() is not None:
+                    future.set_exception(done.exception())
+                else:
+                    future.set_result(done.result())
+
+            task.add_done_callback(on_task_done)
+            # 调用方取消（例如等待超时）时同时取消事件循环中的任务
+            future.add_done_callback(lambda f: f.cancelled() and loop.call_soon_threadsafe(task.cancel))
+
+        future.add_done_callback(lambda f: self._record(f, time.monotonic() - started))
+        loop.call_soon_threadsafe(schedule)
+        return future
+
+    def run(self, coro, timeout=None):
+        """同步执行协程并返回结果，超时则取消协程并抛出 TimeoutError"""
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            with self._stats_lock:
+                self._timeouts += 1
+            raise
+
+    @staticmethod
+    async def run_db(func, *args, **kwargs):
+        """在线程池中执行同步的数据库操作并返回结果，需在带有应用上下文的协程中调用。
+
+        线程推入新的应用上下文，使用独立的数据库会话（Flask-SQLAlchemy 按应用上下文区分会话），
+        慢查询或 busy_timeout 等待不会阻塞事件循环，也不会与提交方线程同时使用同一个会话；
+        调用超时被取消时线程会执行完毕并在退出上下文时关闭自己的会话。func 应返回普通数据而不是 ORM 对象。
+        """
+        app = current_app._get_current_object()
+
+        def call():
+            with app.app_context():
+                return func(*args, **kwargs)
+
+        return await asyncio.get_running_loop().run_in_executor(None, call)
+
+    def _record(self, future, seconds):
+        with self._stats_lock:
+            self._total_seconds += seconds
+            if not future.cancelled() and future.exception() is None:
+                self._completed += 1
+            else:
+                self._failed += 1
+
+    def stop(self):
+        """停止事件循环"""
+        with self._lock:
+            if self.running:
+                self._loop.call_soon_threadsafe(self._loop.stop)
+                self._thread.join(timeout=5)
+            self._thread = None
+            self._loop = None
+
+    def get_stats(self):
+        with self._stats_lock:
+            finished = self._completed + self._failed
+            return {
+                'running': self.running,
+                'submitted': self._submitted,
+                'completed': self._completed,
+                'failed': self._failed,
+                'timeouts': self._timeouts,
+                'in_flight': self._submitted - finished,
+                'avg_ms': round(self._total_seconds / finished * 1000, 2) if finished else None
+            }
+
+
+# 全局后台事件循环实例
+async_runner = AsyncRunner()
@@ -0,0 +1,192 @@
+import os
+import hashlib
+import logging
+import threading
+from collections import deque
+from datetime import timedelta
+from src.models.user import db
+from src.models.diary import DailyDigest
+from src.services.ai_service import ai_service, estimate_tokens, clip_to_tokens, DIGEST_PROMPT
+
+logger = logging.getLogger(__name__)
+
+# 提示词中为标题、编号等格式预留的 token
+_PROMPT_MARGIN = 64
+
+
+def entry_version(entry) -> str:
+    """条目在汇总中的内容指纹，文字或分析结果变化后指纹随之变化"""
+    return hashlib.sha1(ai_service.summary_entry_text(entry).encode('utf-8')).hexdigest()[:16]
+
+
+class DailyDigestService:
+    """每日汇总的增量生成。
+
+    DAILY_SUMMARY_MODE=incremental（默认）时，每条日记分析完成后由分析队列调用 on_entry_analyzed，
+    把该条目合并进当天的滚动摘要（daily_digests 表）；零点生成汇总时只需补上尚未合并的条目，
+    再基于不超过 DAILY_DIGEST_MAX_CHARS 字的摘要生成最终汇总。已合并的条目被修改或删除后摘要会从头重建。
+    =full 时仍把全部条目放进一次请求，超出预算时改用滚动摘要。
+    每次请求的提示词按估算不超过 DAILY_SUMMARY_MAX_PROMPT_TOKENS，条目过多时分批合并，过长的条目截断。
+    """
+
+    def __init__(self):
+        self.mode = os.environ.get('DAILY_SUMMARY_MODE', 'incremental').lower()
+        self.max_prompt_tokens = int(os.environ.get('DAILY_SUMMARY_MAX_PROMPT_TOKENS', 6000))
+        self.max_chars = int(os.environ.get('DAILY_DIGEST_MAX_CHARS', 1500))
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {'folds': 0, 'fold_failures': 0, 'rebuilt': 0, 'finalized': 0, 'full': 0}
+        self._summary_tokens = deque(maxlen=200)
+        self._fold_tokens = deque(maxlen=200)
+
+    @property
+    def incremental(self):
+        return self.mode != 'full'
+
+    def _lock_for(self, day):
+        """同一天的摘要串行更新，避免多个分析线程同时合并时互相覆盖"""
+        with self._locks_guard:
+            if len(self._locks) > 8:
+                for stale_day in [d for d in self._locks if d < day - timedelta(days=2)]:
+                    del self._locks[stale_day]
+            return self._locks.setdefault(day, threading.Lock())
+
+    @property
+    def _digest_budget(self):
+        # 摘要按字数限制，中文约 1 字 1 token，留出模型超出字数的余量
+        return self.max_chars + self.max_chars // 2
+
+    @property
+    def _entries_budget(self):
+        return max(256, self.max_prompt_tokens - estimate_tokens(DIGEST_PROMPT) - self._digest_budget - _PROMPT_MARGIN)
+
+    def on_entry_analyzed(self, entry):
+        """条目分析完成后合并进当天的摘要，需在应用上下文中调用，失败不影响分析结果"""
+        if not self.incremental or entry.is_daily_summary:
+            return
+        day = entry.timestamp.date()
+        try:
+            with self._lock_for(day):
+                self._fold(day, [entry])
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"更新 {day} 的滚动摘要失败: {e}")
+
+    def _get_digest(self, day):
+        digest = DailyDigest.query.filter(DailyDigest.date == day).first()
+        if digest is None:
+            digest = DailyDigest(date=day, content='', entry_versions={}, stale=False, folds=0, prompt_tokens=0)
+            db.session.add(digest)
+        return digest
+
+    def _batches(self, entries):
+        """按提示词预算把条目分批，单条超出预算时截断"""
+        budget = self._entries_budget
+        batch, used = [], 0
+        for entry in entries:
+            text = ai_service.summary_entry_text(entry, max_tokens=budget)
+            tokens = estimate_tokens(text) + 4
+            if batch and used + tokens > budget:
+                yield batch
+                batch, used = [], 0
+            batch.append((entry, text))
+            used += tokens
+        if batch:
+            yield batch
+
+    def _fold(self, day, entries):
+        """把指纹有变化的条目合并进摘要，调用方需持有当天的锁；模型调用失败时返回 False"""
+        digest = self._get_digest(day)
+        versions = dict(digest.entry_versions or {})
+        pending = []
+        for entry in entries:
+            previous = versions.get(str(entry.id))
+            if previous == entry_version(entry):
+                continue
+            if previous is not None:
+                # 旧内容已经写进摘要，无法单独撤回，零点时重建
+                digest.stale = True
+            pending.append(entry)
+
+        for batch in self._batches(pending):
+            usage = {}
+            entries_text = ''.join(f"\n{i}. {text}\n" for i, (_, text) in enumerate(batch, 1))
+            content = ai_service.update_daily_digest(clip_to_tokens(digest.content, self._digest_budget),
+                                                     entries_text, self.max_chars, usage)
+            tokens = usage.get('prompt_tokens', 0)
+            with self._stats_lock:
+                self._fold_tokens.append(tokens)
+                self._stats['folds' if content else 'fold_failures'] += 1
+            if content is None:
+                db.session.commit()
+                return False
+            for entry, _ in batch:
+                versions[str(entry.id)] = entry_version(entry)
+            digest.content = content
+            digest.entry_versions = dict(versions)
+            digest.folds = (digest.folds or 0) + 1
+            digest.prompt_tokens = (digest.prompt_tokens or 0) + tokens
+            db.session.commit()
+        db.session.commit()
+        return True
+
+    def summarize(self, day, entries):
+        """生成指定日期的每日汇总，返回汇总内容；失败时返回与 generate_daily_summary 相同前缀的提示文本"""
+        ai_service._load_config()
+        if not ai_service.client:
+            return "AI服务未配置"
+
+        if not self.incremental:
+            usage = {}
+            estimated = estimate_tokens(ai_service.summary_prompt()) + _PROMPT_MARGIN + sum(
+                estimate_tokens(ai_service.summary_entry_text(entry)) + 4 for entry in entries)
+            if estimated <= self.max_prompt_tokens:
+                result = ai_service.generate_daily_summary(entries, usage)
+                self._record_summary(usage, 'full')
+                return result
+            logger.info(f"{day} 的条目约 {estimated} tokens，超出预算 {self.max_prompt_tokens}，改用滚动摘要")
+
+        with self._lock_for(day):
+            digest = self._get_digest(day)
+            current = {str(entry.id): entry_version(entry) for entry in entries}
+            if digest.stale or any(current.get(entry_id) != version
+                                   for entry_id, version in (digest.entry_versions or {}).items()):
+                # 已合并的条目被修改或删除，从头重建摘要
+                digest.content = ''
+                digest.entry_versions = {}
+                digest.stale = False
+                with self._stats_lock:
+                    self._stats['rebuilt'] += 1
+            if not self._fold(day, entries):
+                return "生成日记汇总失败: 更新滚动摘要失败"
+
+            usage = {}
+            result = ai_service.finalize_daily_summary(digest.content, len(entries), self.max_prompt_tokens, usage)
+            self._record_summary(usage, 'finalized')
+            return result
+
+    def _record_summary(self, usage, kind):
+        with self._stats_lock:
+            self._stats[kind] += 1
+            self._summary_tokens.append(usage.get('prompt_tokens', 0))
+
+    @staticmethod
+    def _summarize(samples):
+        if not samples:
+            return {'last': None, 'avg': None, 'max': None}
+        return {'last': samples[-1], 'avg': round(sum(samples) / len(samples)), 'max': max(samples)}
+
+    def get_stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+            stats['summary_prompt_tokens'] = self._summarize(list(self._summary_tokens))
+            stats['fold_prompt_tokens'] = self._summarize(list(self._fold_tokens))
+        stats['mode'] = 'incremental' if self.incremental else 'full'
+        stats['max_prompt_tokens'] = self.max_prompt_tokens
+        stats['max_digest_chars'] = self.max_chars
+        return stats
+
+
+# 全局每日摘要实例
+daily_digest = DailyDigestService()
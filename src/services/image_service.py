@@ -0,0 +1,154 @@
+import io
+import os
+import base64
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+try:
+    from PIL import Image, ImageOps  # Pillow 不可用时直接发送原图
+    _HAS_PIL = True
+except Exception:
+    _HAS_PIL = False
+
+logger = logging.getLogger(__name__)
+
+# 根据文件头识别图片格式
+_MAGIC = (
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+)
+
+
+def sniff_mime(header: bytes):
+    """根据文件头返回图片 MIME 类型，无法识别时返回 None"""
+    for magic, mime in _MAGIC:
+        if header.startswith(magic):
+            return mime
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'image/webp'
+    return None
+
+
+class ImageService:
+    """视觉模型调用前的图片预处理。
+
+    按 EXIF 方向旋转后缩放到 VISION_MAX_DIMENSION 以内，以 VISION_JPEG_QUALITY 重新编码
+    （带透明通道的图片编码为 PNG，PNG/GIF 来源取 PNG 与 JPEG 中较小的一个），重新编码时不写入 EXIF 等元数据。
+    结果按文件内容的 SHA-256 缓存，总大小不超过 VISION_CACHE_MB。
+    """
+
+    def __init__(self):
+        self.max_dimension = int(os.environ.get('VISION_MAX_DIMENSION', 1536))
+        self.quality = int(os.environ.get('VISION_JPEG_QUALITY', 85))
+        self.cache_limit = int(float(os.environ.get('VISION_CACHE_MB', 64)) * 1024 * 1024)
+        self._cache = OrderedDict()  # (文件哈希, 尺寸, 质量) -> (MIME, base64)
+        self._cache_bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {'encoded': 0, 'cache_hits': 0, 'original_bytes': 0, 'sent_bytes': 0, 'failures': 0}
+
+    @staticmethod
+    def file_hash(path: str) -> str:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def encode_for_vision(self, path: str):
+        """返回 (MIME 类型, base64 字符串)，读取或处理失败时返回 None"""
+        try:
+            key = (self.file_hash(path), self.max_dimension, self.quality)
+            with self._lock:
+                cached = self._cache.get(key)
+                if cached is not None:
+                    self._cache.move_to_end(key)
+                    self._stats['cache_hits'] += 1
+                    return cached
+
+            original_size = os.path.getsize(path)
+            mime, data = self._prepare(path)
+            payload = (mime, base64.b64encode(data).decode('ascii'))
+            with self._lock:
+                self._stats['encoded'] += 1
+                self._stats['original_bytes'] += original_size
+                self._stats['sent_bytes'] += len(payload[1])
+                if len(payload[1]) <= self.cache_limit:
+                    self._cache[key] = payload
+                    self._cache_bytes += len(payload[1])
+                    while self._cache_bytes > self.cache_limit:
+                        _, (_, evicted) = self._cache.popitem(last=False)
+                        self._cache_bytes -= len(evicted)
+            return payload
+        except Exception as e:
+            with self._lock:
+                self._stats['failures'] += 1
+            logger.error(f"图片编码失败: {e}")
+            return None
+
+    def _prepare(self, path: str):
+        with open(path, 'rb') as f:
+            mime = sniff_mime(f.read(16))
+        if not _HAS_PIL:
+            return mime or 'image/jpeg', self._read(path)
+
+        try:
+            with Image.open(path) as image:
+                # 动图只取第一帧
+                image.seek(0)
+                has_exif = bool(image.info.get('exif')) or bool(image.getexif())
+                oversized = max(image.size) > self.max_dimension
+                source_format = image.format
+                if oversized and source_format == 'JPEG':
+                    # JPEG 解码时直接按 1/2、1/4、1/8 缩小，减少大照片的解码时间和内存
+                    image.draft('RGB', (self.max_dimension, self.max_dimension))
+                image = ImageOps.exif_transpose(image)
+                if oversized:
+                    image.thumbnail((self.max_dimension, self.max_dimension), Image.LANCZOS)
+                if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+                    encoded_mime, encoded = 'image/png', self._save(image.convert('RGBA'), 'PNG')
+                else:
+                    encoded_mime, encoded = 'image/jpeg', self._save(image.convert('RGB'), 'JPEG')
+                    if source_format in ('PNG', 'GIF'):
+                        # 截图等无损图片常常是 PNG 更小
+                        png = self._save(image, 'PNG')
+                        if len(png) < len(encoded):
+                            encoded_mime, encoded = 'image/png', png
+        except Exception as e:
+            logger.warning(f"图片预处理失败，发送原图: {e}")
+            return mime or 'image/jpeg', self._read(path)
+
+        # 尺寸合适且不含元数据的原图比重新编码更小时直接发送，避免重复压缩
+        if mime and not oversized and not has_exif and os.path.getsize(path) < len(encoded):
+            return mime, self._read(path)
+        return encoded_mime, encoded
+
+    def _save(self, image, image_format: str) -> bytes:
+        output = io.BytesIO()
+        if image_format == 'JPEG':
+            image.save(output, format='JPEG', quality=self.quality, optimize=True, progressive=True)
+        else:
+            image.save(output, format=image_format)
+        return output.getvalue()
+
+    @staticmethod
+    def _read(path: str) -> bytes:
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['cached'] = len(self._cache)
+            stats['cache_bytes'] = self._cache_bytes
+        stats['pillow'] = _HAS_PIL
+        stats['max_dimension'] = self.max_dimension
+        stats['quality'] = self.quality
+        return stats
+
+
+# 全局图片预处理实例
+image_service = ImageService()
@@ -0,0 +1,53 @@
+import logging
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson  # 未安装时使用标准库 json
+    _HAS_ORJSON = True
+except Exception:
+    _HAS_ORJSON = False
+
+logger = logging.getLogger(__name__)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """jsonify 使用的 JSON 序列化。
+
+    中文直接以 UTF-8 输出而不是 \\uXXXX 转义（体积约为转义后的一半）；安装了 orjson 时用它序列化，
+    日期仍交给 Flask 默认的 default 处理，输出格式与标准库一致。orjson 无法处理的数据回退到标准库。
+    """
+
+    ensure_ascii = False
+
+    def _orjson_option(self, indent=False):
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps(self, obj, **kwargs):
+        if _HAS_ORJSON and not kwargs:
+            try:
+                return orjson.dumps(obj, default=self.default, option=self._orjson_option()).decode('utf-8')
+            except TypeError:
+                pass
+        return super().dumps(obj, **kwargs)
+
+    def response(self, *args, **kwargs):
+        if not _HAS_ORJSON:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        try:
+            body = orjson.dumps(obj, default=self.default, option=self._orjson_option(indent))
+        except TypeError as e:
+            # 例如超出 64 位的整数，交给标准库处理
+            logger.debug(f"orjson 序列化失败，使用标准库: {e}")
+            return super().response(*args, **kwargs)
+        return self._app.response_class(body + b'\n', mimetype=self.mimetype)
+
+
+def json_backend() -> str:
+    return 'orjson' if _HAS_ORJSON else 'json'
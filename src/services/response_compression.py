@@ -0,0 +1,99 @@
+import os
+import re
+import gzip
+import time
+import logging
+import threading
+from flask import request
+from src.services.json_provider import json_backend
+
+try:
+    import brotli  # 未安装时只使用 gzip
+    _HAS_BROTLI = True
+except Exception:
+    _HAS_BROTLI = False
+
+logger = logging.getLogger(__name__)
+
+# 只压缩文本类响应，图片等已经压缩过
+_COMPRESSIBLE = re.compile(r'^(text/|application/(json|javascript|xml))')
+
+
+class ResponseCompressor:
+    """接口响应压缩。
+
+    响应体不小于 RESPONSE_COMPRESS_MIN_BYTES（默认 1024）且客户端支持时，按 br、gzip 的顺序选择编码压缩。
+    流式响应（SSE、send_file）、已经带 Content-Encoding 的响应（预压缩的静态文件）和 304 等无内容响应不处理。
+    动态内容每次都要压缩，因此使用较低的压缩级别（gzip 6、brotli 4）。
+    """
+
+    def __init__(self):
+        self.enabled = os.environ.get('RESPONSE_COMPRESSION', '1') != '0'
+        self.min_size = int(os.environ.get('RESPONSE_COMPRESS_MIN_BYTES', 1024))
+        self.gzip_level = int(os.environ.get('RESPONSE_GZIP_LEVEL', 6))
+        self.brotli_quality = int(os.environ.get('RESPONSE_BROTLI_QUALITY', 4))
+        self._lock = threading.Lock()
+        self._stats = {'compressed': 0, 'skipped_small': 0, 'bytes_in': 0, 'bytes_out': 0, 'seconds': 0.0}
+
+    def init_app(self, app):
+        app.after_request(self.compress)
+
+    def _choose_encoding(self):
+        accepted = request.accept_encodings
+        if _HAS_BROTLI and accepted['br'] > 0:
+            return 'br'
+        if accepted['gzip'] > 0:
+            return 'gzip'
+        return None
+
+    def _encode(self, data: bytes, encoding: str) -> bytes:
+        if encoding == 'br':
+            return brotli.compress(data, quality=self.brotli_quality)
+        return gzip.compress(data, compresslevel=self.gzip_level, mtime=0)
+
+    def compress(self, response):
+        if (not self.enabled or response.direct_passthrough or response.is_streamed
+                or response.status_code < 200 or response.status_code in (204, 206, 304)
+                or 'Content-Encoding' in response.headers or not _COMPRESSIBLE.match(response.mimetype or '')):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        data = response.get_data()
+        if len(data) < self.min_size:
+            with self._lock:
+                self._stats['skipped_small'] += 1
+            return response
+        encoding = self._choose_encoding()
+        if encoding is None:
+            return response
+
+        started = time.perf_counter()
+        compressed = self._encode(data, encoding)
+        elapsed = time.perf_counter() - started
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        # 内容编码变了，强 ETag 不再逐字节对应，改为弱 ETag
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        with self._lock:
+            self._stats['compressed'] += 1
+            self._stats['bytes_in'] += len(data)
+            self._stats['bytes_out'] += len(compressed)
+            self._stats['seconds'] += elapsed
+        return response
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        seconds = stats.pop('seconds')
+        stats['ratio'] = round(stats['bytes_out'] / stats['bytes_in'], 3) if stats['bytes_in'] else None
+        stats['avg_ms'] = round(seconds / stats['compressed'] * 1000, 2) if stats['compressed'] else 0.0
+        stats['min_size'] = self.min_size
+        stats['brotli'] = _HAS_BROTLI
+        stats['json'] = json_backend()
+        return stats
+
+
+# 全局响应压缩实例
+response_compressor = ResponseCompressor()
@@ -1,9 +1,10 @@
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 from datetime import date, timedelta
 from src.models.diary import DailySummary, DiaryEntry
 from src.models.user import db
-from src.services.ai_service import ai_service
+from src.services.daily_digest import daily_digest
 from src.services.telegram_service import telegram_service
 from src.services.notion_service import notion_service
 from src.services.time_service import time_service
@@ -38,8 +39,22 @@ class SchedulerService:
             id='daily_summary_job',
             replace_existing=True
         )
+        self.scheduler.add_job(
+            self._prune_mcp_logs_job,
+            trigger=CronTrigger(hour=3, minute=30, timezone=self.tz),
+            id='mcp_log_retention_job',
+            replace_existing=True
+        )
+        from src.mcp.memory_consolidation import memory_consolidator
+        if memory_consolidator.interval_hours > 0:
+            self.scheduler.add_job(
+                self._consolidate_memories_job,
+                trigger=IntervalTrigger(hours=memory_consolidator.interval_hours, timezone=self.tz),
+                id='memory_consolidation_job',
+                replace_existing=True
+            )
         self.scheduler.start()
-        logger.info("定时任务服务已启动，每日总结任务已设定在 00:00 (北京时间)")
+        logger.info("定时任务服务已启动，每日总结任务已设定在 00:00 (北京时间)，MCP日志清理任务在 03:30")
 
     def stop(self):
         """停止定时任务"""
@@ -54,6 +69,19 @@ class SchedulerService:
             yesterday = today_beijing - timedelta(days=1)
             self._generate_daily_summary(yesterday)
 
+    def _prune_mcp_logs_job(self):
+        """清理过期的MCP执行日志明细（按天统计保留）"""
+        from src.mcp.execution_log import execution_log_writer
+        with self.app.app_context():
+            execution_log_writer.flush()
+            execution_log_writer.prune()
+
+    def _consolidate_memories_job(self):
+        """合并各用户的重复记忆"""
+        from src.mcp.memory_consolidation import memory_consolidator
+        with self.app.app_context():
+            memory_consolidator.consolidate_all()
+
     def _generate_daily_summary(self, target_date, force_update=False):
         """生成指定日期的日记汇总"""
         lock_file = None
@@ -83,8 +111,8 @@ class SchedulerService:
 
             # 检查当天是否有有效的日记条目（不包括旧的总结）
             entries = DiaryEntry.query.filter(
-                db.func.date(DiaryEntry.timestamp) == target_date,
-                DiaryEntry.is_daily_summary != True  # 排除已有的总结条目
+                DiaryEntry.on_date(target_date),
+                DiaryEntry.is_daily_summary == False  # 排除已有的总结条目
             ).order_by(DiaryEntry.timestamp.asc()).all()
 
             if not entries:
@@ -93,19 +121,21 @@ class SchedulerService:
 
             logger.info(f"开始生成日期 {target_date} 的汇总，共 {len(entries)} 条记录")
 
-            summary_content = ai_service.generate_daily_summary(entries)
+            # 增量模式下基于分析过程中维护的滚动摘要生成，提示词长度有上限
+            summary_content = daily_digest.summarize(target_date, entries)
 
             # 基础校验：AI未配置或生成失败时不应继续写库/推送
             if not summary_content or not str(summary_content).strip():
                 logger.warning(f"日期 {target_date} 的汇总内容为空，终止后续流程")
                 return None
 
-            failure_markers = [
+            # 失败时 generate_daily_summary 返回固定的提示文本；条目的分析状态已单独记录，
+            # 汇总提示词中不再包含"AI分析失败"等占位文本，因此只需按前缀判断
+            failure_markers = (
                 "AI服务未配置",
-                "生成日记汇总失败",
-                "AI分析失败"
-            ]
-            if any(marker in str(summary_content) for marker in failure_markers):
+                "生成日记汇总失败"
+            )
+            if str(summary_content).strip().startswith(failure_markers):
                 logger.error(f"日期 {target_date} 的汇总生成失败，检测到失败标记，终止后续流程")
                 return None
 
@@ -137,7 +167,7 @@ class SchedulerService:
             # 删除同一天的历史总结条目（清理所有，避免重复显示）
             prev_summaries = DiaryEntry.query.filter(
                 DiaryEntry.is_daily_summary == True,
-                db.func.date(DiaryEntry.timestamp) == target_date
+                DiaryEntry.on_date(target_date)
             ).all()
             for prev in prev_summaries:
                 db.session.delete(prev)
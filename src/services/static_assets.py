@@ -0,0 +1,169 @@
+import os
+import re
+import gzip
+import hashlib
+import logging
+import mimetypes
+import threading
+from flask import Response
+
+try:
+    import brotli  # 未安装时只生成 gzip 版本
+    _HAS_BROTLI = True
+except Exception:
+    _HAS_BROTLI = False
+
+logger = logging.getLogger(__name__)
+
+# 构建产物（assets/<名称>-<哈希>.<扩展名>）和按内容哈希命名的上传图片内容不会变化，可以永久缓存
+_FINGERPRINTED = re.compile(r'^(assets/.+-[A-Za-z0-9_-]{8,}\.\w+|uploads/.*[0-9a-f]{64}[^/]*)$')
+# 值得压缩的类型，图片（ico 除外）和字体本身已经压缩过
+_COMPRESSIBLE = re.compile(r'^(text/|application/(javascript|json|xml|manifest\+json)|image/(svg\+xml|x-icon|vnd\.microsoft\.icon))')
+# 上传目录由 upload_storage 管理，内容随时变化，不进入清单
+_EXCLUDED_DIRS = {'uploads'}
+
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE = 'no-cache'
+
+
+def is_fingerprinted(path: str) -> bool:
+    return bool(_FINGERPRINTED.match(path))
+
+
+class _Asset:
+    __slots__ = ('mimetype', 'etag', 'immutable', 'variants')
+
+    def __init__(self, mimetype, etag, immutable, variants):
+        self.mimetype = mimetype
+        self.etag = etag
+        self.immutable = immutable
+        self.variants = variants  # {编码: 内容}，identity 为原始内容
+
+
+class StaticAssets:
+    """前端静态文件的内存清单。
+
+    启动时读取 static 目录下的文件，计算内容哈希作为强 ETag，对文本类文件预先生成 gzip
+    （安装了 brotli 时在后台再生成 br）版本，请求时按 Accept-Encoding 直接从内存返回，不再逐次访问磁盘。
+    带内容哈希的构建产物返回 Cache-Control: immutable，其余文件要求浏览器每次用 If-None-Match 验证，
+    ETag 匹配时返回 304。文件在运行期间更新后需要调用 load 重新加载（/admin/reload-services 会调用），
+    开发时可设置 STATIC_ASSET_CACHE=0 关闭清单，直接读取磁盘。
+    """
+
+    def __init__(self):
+        self.enabled = os.environ.get('STATIC_ASSET_CACHE', '1') != '0'
+        self.min_size = int(os.environ.get('STATIC_COMPRESS_MIN_BYTES', 1024))
+        self.brotli_quality = int(os.environ.get('STATIC_BROTLI_QUALITY', 11))
+        self.root = None
+        self._manifest = {}
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'not_modified': 0, 'compressed': 0, 'misses': 0}
+
+    def load(self, root: str = None):
+        """扫描静态目录并重建清单，返回文件数量"""
+        root = root or self.root
+        if not self.enabled or not root or not os.path.isdir(root):
+            return 0
+        manifest = {}
+        for directory, dirnames, filenames in os.walk(root):
+            relative_dir = os.path.relpath(directory, root).replace(os.sep, '/')
+            if relative_dir == '.':
+                dirnames[:] = [name for name in dirnames if name not in _EXCLUDED_DIRS and not name.startswith('.')]
+                relative_dir = ''
+            for filename in filenames:
+                if filename.startswith('.'):
+                    continue
+                path = f"{relative_dir}/{filename}" if relative_dir else filename
+                try:
+                    manifest[path] = self._build(os.path.join(directory, filename), path)
+                except OSError as e:
+                    logger.warning(f"读取静态文件失败 {path}: {e}")
+        with self._lock:
+            self.root = root
+            self._manifest = manifest
+        logger.info(f"静态文件清单已加载: {len(manifest)} 个文件")
+        if _HAS_BROTLI:
+            # brotli 最高压缩级别较慢，在后台生成，完成前先返回 gzip 版本
+            threading.Thread(target=self._compress_brotli, args=(manifest,), daemon=True,
+                             name='static-brotli').start()
+        return len(manifest)
+
+    def _compress_brotli(self, manifest):
+        for path, asset in list(manifest.items()):
+            if 'gzip' not in asset.variants:
+                continue
+            try:
+                data = brotli.compress(asset.variants['identity'], quality=self.brotli_quality)
+            except Exception as e:
+                logger.warning(f"brotli 压缩失败 {path}: {e}")
+                continue
+            if len(data) < len(asset.variants['gzip']):
+                asset.variants = {**asset.variants, 'br': data}
+
+    def _build(self, full_path: str, path: str) -> _Asset:
+        with open(full_path, 'rb') as f:
+            content = f.read()
+        mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        variants = {'identity': content}
+        if len(content) >= self.min_size and _COMPRESSIBLE.match(mimetype):
+            compressed = gzip.compress(content, compresslevel=9, mtime=0)
+            # 压缩后节省不到 10% 时不保留，也不再尝试 brotli
+            if len(compressed) < len(content) * 0.9:
+                variants['gzip'] = compressed
+        etag = hashlib.sha256(content).hexdigest()[:32]
+        return _Asset(mimetype, etag, is_fingerprinted(path), variants)
+
+    @staticmethod
+    def _choose_encoding(asset: _Asset, request) -> str:
+        accepted = request.accept_encodings
+        for encoding in ('br', 'gzip'):
+            if encoding in asset.variants and accepted[encoding] > 0:
+                return encoding
+        return 'identity'
+
+    def response(self, path: str, request):
+        """返回清单中文件的响应，不在清单中时返回 None"""
+        asset = self._manifest.get(path)
+        if asset is None:
+            with self._lock:
+                self._stats['misses'] += 1
+            return None
+
+        encoding = self._choose_encoding(asset, request)
+        # 不同编码的内容不同，ETag 也要区分，避免缓存把 gzip 内容当作原文
+        etag = asset.etag if encoding == 'identity' else f"{asset.etag}-{encoding}"
+        headers = {'Cache-Control': IMMUTABLE_CACHE if asset.immutable else REVALIDATE_CACHE}
+        if len(asset.variants) > 1:
+            headers['Vary'] = 'Accept-Encoding'
+
+        if request.if_none_match.contains_weak(etag):
+            with self._lock:
+                self._stats['not_modified'] += 1
+            response = Response(status=304, headers=headers)
+            response.set_etag(etag)
+            return response
+
+        response = Response(asset.variants[encoding], mimetype=asset.mimetype, headers=headers)
+        response.set_etag(etag)
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+        with self._lock:
+            self._stats['hits'] += 1
+            if encoding != 'identity':
+                self._stats['compressed'] += 1
+        return response
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            manifest = self._manifest
+        stats['files'] = len(manifest)
+        stats['bytes'] = sum(len(asset.variants['identity']) for asset in manifest.values())
+        stats['precompressed'] = sum(1 for asset in manifest.values() if len(asset.variants) > 1)
+        stats['brotli_ready'] = sum(1 for asset in manifest.values() if 'br' in asset.variants)
+        stats['brotli'] = _HAS_BROTLI
+        return stats
+
+
+# 全局静态文件清单实例
+static_assets = StaticAssets()
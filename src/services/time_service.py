@@ -1,24 +1,111 @@
+import os
+import time
+import logging
+import threading
 import requests
 from datetime import datetime
 from zoneinfo import ZoneInfo
 
+logger = logging.getLogger(__name__)
+
+BEIJING_TZ = ZoneInfo("Asia/Shanghai")
+
+
 class TimeService:
+    """北京时间服务。
+
+    网络时间只用于校准：首次调用时在后台线程同步一次偏移量，之后按
+    `TIME_SYNC_INTERVAL`（秒，默认3600，<=0 关闭网络同步）周期性重新校准。
+    每次取时间都基于单调时钟推算，不发起任何网络请求。
+    """
+
     # 使用 HTTPS 协议访问时间服务，避免中间人攻击
     API_URL = "https://worldtimeapi.org/api/timezone/Asia/Shanghai"
+    TIMEOUT = 5
+
+    def __init__(self, sync_interval=None):
+        if sync_interval is None:
+            sync_interval = float(os.environ.get('TIME_SYNC_INTERVAL', 3600))
+        self.sync_interval = sync_interval
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        # 锚点：某一时刻的 epoch 秒数与对应的单调时钟读数
+        self._anchor_epoch = time.time()
+        self._anchor_mono = time.monotonic()
+        self._synced = False
+        self._last_sync_mono = None
+        self._last_drift = None
+        self._sync_count = 0
+        self._sync_failures = 0
+
+    def _now_epoch(self):
+        return self._anchor_epoch + (time.monotonic() - self._anchor_mono)
 
     def get_beijing_time(self):
-        """Fetch current Beijing time from the network.
-        If network request fails, fall back to local time in Asia/Shanghai zone.
-        """
+        """返回当前北京时间（naive datetime），直接从内存锚点推算。"""
+        self._ensure_started()
+        return datetime.fromtimestamp(self._now_epoch(), BEIJING_TZ).replace(tzinfo=None)
+
+    def _ensure_started(self):
+        """惰性启动后台校准线程，避免导入模块时就访问网络"""
+        if self._thread is not None or self.sync_interval <= 0:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._sync_loop, name='time-sync', daemon=True)
+            self._thread.start()
+
+    def _sync_loop(self):
+        while not self._stop_event.is_set():
+            self.sync()
+            self._stop_event.wait(self.sync_interval)
+
+    def sync(self):
+        """从网络校准一次时间偏移，失败时继续沿用当前锚点。"""
         try:
-            response = requests.get(self.API_URL, timeout=5)
+            sent = time.monotonic()
+            response = requests.get(self.API_URL, timeout=self.TIMEOUT)
             response.raise_for_status()
-            data = response.json()
-            dt_str = data.get("datetime")
-            if dt_str:
-                return datetime.fromisoformat(dt_str).astimezone(ZoneInfo("Asia/Shanghai")).replace(tzinfo=None)
-        except Exception:
-            pass
-        return datetime.now(ZoneInfo("Asia/Shanghai")).replace(tzinfo=None)
+            received = time.monotonic()
+            dt_str = response.json().get("datetime")
+            if not dt_str:
+                raise ValueError("时间服务返回数据缺少 datetime 字段")
+            # 以往返时间的一半补偿网络延迟
+            network_epoch = datetime.fromisoformat(dt_str).timestamp() + (received - sent) / 2
+            with self._lock:
+                self._last_drift = network_epoch - self._now_epoch()
+                self._anchor_epoch = network_epoch
+                self._anchor_mono = received
+                self._last_sync_mono = received
+                self._synced = True
+                self._sync_count += 1
+            return True
+        except Exception as e:
+            with self._lock:
+                self._sync_failures += 1
+            logger.debug(f"网络时间同步失败，继续使用本地时钟: {e}")
+            return False
+
+    def stop(self):
+        """停止后台校准线程"""
+        self._stop_event.set()
+
+    def get_stats(self):
+        """返回时间同步统计信息"""
+        with self._lock:
+            sync_age = None
+            if self._last_sync_mono is not None:
+                sync_age = round(time.monotonic() - self._last_sync_mono, 3)
+            return {
+                'source': 'network' if self._synced else 'local',
+                'sync_interval': self.sync_interval,
+                'last_sync_age_seconds': sync_age,
+                'last_drift_seconds': round(self._last_drift, 6) if self._last_drift is not None else None,
+                'sync_count': self._sync_count,
+                'sync_failures': self._sync_failures
+            }
+
 
 time_service = TimeService()
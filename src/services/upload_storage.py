@@ -0,0 +1,394 @@
+import os
+import re
+import time
+import uuid
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+from src.services.image_service import sniff_mime
+
+try:
+    from PIL import Image, ImageOps  # 没有 Pillow 时不生成缩略图，前端使用原图
+    _HAS_PIL = True
+except Exception:
+    _HAS_PIL = False
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_FOLDER = 'uploads'
+THUMBNAIL_FOLDER = 'thumbs'
+STATIC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'static')
+
+CHUNK_SIZE = 64 * 1024
+MAX_FORM_BYTES = 1024 * 1024  # 文字字段的内存上限
+MAX_FORM_PARTS = 16
+SNIFF_BYTES = 16
+# 上传（含复用已有文件）后的这段时间内不删除该文件：新条目可能尚未提交，数据库中还查不到引用；
+# 期间的删除请求推迟到时间过后重新检查
+RELEASE_GRACE_SECONDS = 300
+
+_EXTENSIONS = {'image/jpeg': 'jpg', 'image/png': 'png', 'image/gif': 'gif', 'image/webp': 'webp'}
+_THUMBNAIL_NAME = re.compile(r'^([0-9A-Za-z-]+)_(\d+)\.webp$')
+
+
+def _thumbnail_sizes():
+    sizes = [int(size) for size in os.environ.get('THUMBNAIL_SIZES', '320,640,1280').split(',') if size.strip()]
+    return sorted(set(size for size in sizes if size > 0))
+
+
+def _fsync_directory(path):
+    """改名后同步目录项，Windows 不支持打开目录时跳过"""
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class UploadRejected(Exception):
+    """上传在读取过程中被拒绝，status 为返回给客户端的 HTTP 状态码，reason 用于统计"""
+
+    def __init__(self, message, status=400, reason='malformed'):
+        super().__init__(message)
+        self.status = status
+        self.reason = reason
+
+
+class _IncomingFile:
+    """正在接收的上传文件：写入临时文件的同时计算哈希，读到文件头后立即校验图片类型"""
+
+    def __init__(self, path, filename, max_bytes):
+        self.path = path
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.mime = None
+        self.header = b''
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+        self.file = open(path, 'wb')
+
+    def write(self, chunk: bytes):
+        if not chunk:
+            return
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            raise UploadRejected('上传文件过大', 413, 'too_large')
+        if self.mime is None:
+            self.header = (self.header + chunk)[:SNIFF_BYTES]
+            if len(self.header) >= SNIFF_BYTES:
+                self._sniff()
+        self.digest.update(chunk)
+        self.file.write(chunk)
+
+    def _sniff(self):
+        self.mime = sniff_mime(self.header)
+        if self.mime is None:
+            raise UploadRejected('文件内容不是支持的图片格式', 415, 'type')
+
+    def finish(self) -> str:
+        if self.mime is None:
+            self._sniff()
+        self.elapsed = time.perf_counter() - self.started
+        return self.digest.hexdigest()
+
+    def sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+
+    def discard(self):
+        if not self.file.closed:
+            self.file.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class UploadStorage:
+    """按内容寻址的上传图片存储。
+
+    原图按 SHA-256 保存为 uploads/<哈希前两位>/<哈希>.<扩展名>，相同内容的上传共用一个文件；
+    删除条目时只有在没有其他条目引用时才删除文件，最近 RELEASE_GRACE_SECONDS 秒内有相同内容的上传时推迟到期后再检查。上传通过 receive 流式接收，边读边写入临时文件，
+    fsync 后原子改名，单个文件不超过 UPLOAD_MAX_MB。保存后在后台线程中生成多种宽度的 WebP 缩略图
+    （uploads/thumbs/<文件名>_<宽度>.webp），缺失的缩略图在首次请求时补生成。
+    """
+
+    def __init__(self):
+        self.sizes = _thumbnail_sizes()
+        self.quality = int(os.environ.get('THUMBNAIL_QUALITY', 80))
+        self.max_bytes = int(float(os.environ.get('UPLOAD_MAX_MB', 16)) * 1024 * 1024)
+        self.max_request_bytes = self.max_bytes + MAX_FORM_BYTES
+        self.upload_dir = os.path.join(STATIC_DIR, UPLOAD_FOLDER)
+        self.thumbnail_dir = os.path.join(self.upload_dir, THUMBNAIL_FOLDER)
+        self._executor = ThreadPoolExecutor(max_workers=int(os.environ.get('THUMBNAIL_WORKERS', 1)),
+                                            thread_name_prefix='thumbnail')
+        self._lock = threading.Lock()
+        self._claims = {}  # 图片路径 -> 最近一次上传该内容的时间
+        self._deferred = {}  # 推迟删除的图片路径 -> 重新检查的定时器
+        self._stats = {'stored': 0, 'deduplicated': 0, 'bytes_saved': 0, 'thumbnails': 0,
+                       'thumbnail_failures': 0, 'released': 0, 'release_deferred': 0, 'received_bytes': 0, 'receive_seconds': 0.0,
+                       'last_mb_per_s': 0.0, 'rejected': {}}
+
+    def full_path(self, image_path: str) -> str:
+        return os.path.join(STATIC_DIR, image_path)
+
+    def store(self, file_storage, filename: str = None):
+        """保存上传的文件，返回 (相对 static 的路径, 完整路径)；相同内容已存在时直接复用"""
+        incoming = self._open_incoming(filename)
+        try:
+            for chunk in iter(lambda: file_storage.stream.read(CHUNK_SIZE), b''):
+                incoming.write(chunk)
+            return self._commit(incoming)
+        finally:
+            incoming.discard()
+
+    def receive(self, request, file_field: str = 'image', allowed_extensions=None):
+        """边读取边解析 multipart/form-data 请求体，返回 (表单字段, (路径, 完整路径) 或 None)。
+
+        文件内容直接写入临时文件并同时计算哈希，不经过 Werkzeug 的整体缓冲；
+        Content-Length 超限时不读取请求体，文件头不是支持的图片或大小超过 UPLOAD_MAX_MB 时立即停止读取，
+        均抛出 UploadRejected。
+        """
+        started = time.perf_counter()
+        try:
+            # 先检查 Content-Length，访问 request.stream 前拒绝，不读取请求体
+            if request.content_length is not None and request.content_length > self.max_request_bytes:
+                raise UploadRejected('上传文件过大', 413, 'too_large')
+            mimetype, options = parse_options_header(request.content_type or '')
+            boundary = options.get('boundary')
+            if mimetype != 'multipart/form-data' or not boundary:
+                raise UploadRejected('请求格式错误', 400, 'malformed')
+            stream = request.stream
+
+            decoder = MultipartDecoder(boundary.encode('latin-1'), max_form_memory_size=MAX_FORM_BYTES,
+                                       max_parts=MAX_FORM_PARTS)
+            fields, stored = {}, None
+            part, buffer, incoming = None, None, None
+            try:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    decoder.receive_data(chunk or None)
+                    event = decoder.next_event()
+                    while not isinstance(event, (NeedData, Epilogue)):
+                        if isinstance(event, File):
+                            part, buffer = event, None
+                            if event.name == file_field and event.filename and stored is None and incoming is None:
+                                extension = event.filename.rsplit('.', 1)[-1].lower() if '.' in event.filename else ''
+                                if allowed_extensions is not None and extension not in allowed_extensions:
+                                    raise UploadRejected('不支持的文件类型', 415, 'type')
+                                incoming = self._open_incoming(event.filename)
+                        elif isinstance(event, Field):
+                            part, buffer = event, []
+                        elif isinstance(event, Data):
+                            if buffer is not None:
+                                buffer.append(event.data)
+                                if sum(map(len, buffer)) > MAX_FORM_BYTES:
+                                    raise UploadRejected('表单字段过大', 413, 'too_large')
+                            elif incoming is not None:
+                                incoming.write(event.data)
+                            if not event.more_data:
+                                if buffer is not None:
+                                    fields[part.name] = b''.join(buffer).decode('utf-8', 'replace')
+                                elif incoming is not None:
+                                    stored = self._commit(incoming)
+                                    incoming = None
+                                part, buffer = None, None
+                        event = decoder.next_event()
+                    if not chunk:
+                        break
+            except RequestEntityTooLarge:
+                raise UploadRejected('表单字段过大', 413, 'too_large')
+            except ValueError as e:
+                raise UploadRejected(f'请求格式错误: {e}', 400, 'malformed')
+            finally:
+                if incoming is not None:
+                    incoming.discard()
+            if not isinstance(event, Epilogue):
+                raise UploadRejected('请求体不完整', 400, 'malformed')
+        except UploadRejected as e:
+            with self._lock:
+                self._stats['rejected'][e.reason] = self._stats['rejected'].get(e.reason, 0) + 1
+            logger.info(f"拒绝上传 ({e.reason}): {e}，耗时 {(time.perf_counter() - started) * 1000:.1f}ms")
+            raise
+        return fields, stored
+
+    def _open_incoming(self, filename=None):
+        os.makedirs(self.upload_dir, exist_ok=True)
+        return _IncomingFile(os.path.join(self.upload_dir, f".{uuid.uuid4().hex}.tmp"), filename, self.max_bytes)
+
+    def _commit(self, incoming):
+        content_hash = incoming.finish()
+        extension = _EXTENSIONS.get(incoming.mime)
+        image_path = f"{UPLOAD_FOLDER}/{content_hash[:2]}/{content_hash}.{extension}"
+        full_path = self.full_path(image_path)
+        # 先落盘再改名，崩溃后不会留下只写了一半的图片；fsync 较慢，在锁外执行，
+        # 锁内只做存在检查、改名和统计，连续上传时不会互相等待磁盘同步
+        synced = not os.path.exists(full_path)
+        if synced:
+            incoming.sync()
+        with self._lock:
+            self._claim(image_path)
+            created = not os.path.exists(full_path)
+            if created:
+                if not synced:
+                    # 预检时文件还在，之后被删除
+                    incoming.sync()
+                os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                os.replace(incoming.path, full_path)
+                self._stats['stored'] += 1
+            else:
+                self._stats['deduplicated'] += 1
+                self._stats['bytes_saved'] += incoming.size
+            elapsed = max(incoming.elapsed, 1e-6)
+            self._stats['received_bytes'] += incoming.size
+            self._stats['receive_seconds'] += elapsed
+            self._stats['last_mb_per_s'] = round(incoming.size / elapsed / 1048576, 2)
+        if created:
+            _fsync_directory(os.path.dirname(full_path))
+        else:
+            incoming.discard()
+        self.schedule_thumbnails(image_path)
+        return image_path, full_path
+
+    def _claim(self, image_path: str):
+        """记录上传时间，调用方需持有 self._lock"""
+        now = time.monotonic()
+        self._claims[image_path] = now
+        if len(self._claims) > 256:
+            for path in [p for p, claimed in self._claims.items() if now - claimed >= RELEASE_GRACE_SECONDS]:
+                del self._claims[path]
+
+    def release(self, image_path: str, exclude_entry_id: int = None):
+        """条目删除后调用，没有其他条目引用时删除原图和缩略图"""
+        if not image_path:
+            return False
+        from src.models.diary import DiaryEntry
+        query = DiaryEntry.query.filter(DiaryEntry.image_path == image_path)
+        if exclude_entry_id is not None:
+            query = query.filter(DiaryEntry.id != exclude_entry_id)
+        if query.first() is not None:
+            return False
+        # 与 _commit 共用锁：查询之后才复用该文件的上传一定已经登记，这里会看到并保留文件；
+        # 删除之后的上传在 _commit 中发现文件不存在，会重新写入
+        with self._lock:
+            claimed = self._claims.get(image_path)
+            if claimed is not None and time.monotonic() - claimed < RELEASE_GRACE_SECONDS:
+                self._stats['release_deferred'] += 1
+                self._defer_release(image_path, RELEASE_GRACE_SECONDS - (time.monotonic() - claimed))
+                return False
+            for path in [self.full_path(image_path)] + [self._thumbnail_file(image_path, size) for size in self.sizes]:
+                if os.path.exists(path):
+                    os.remove(path)
+            self._stats['released'] += 1
+        return True
+
+    def _defer_release(self, image_path: str, delay: float):
+        """到期后在新的应用上下文中重新调用 release，调用方需持有 self._lock"""
+        if image_path in self._deferred:
+            return
+        timer = threading.Timer(delay + 1, self._retry_release, args=(current_app._get_current_object(), image_path))
+        timer.daemon = True
+        self._deferred[image_path] = timer
+        timer.start()
+
+    def _retry_release(self, app, image_path: str):
+        with self._lock:
+            self._deferred.pop(image_path, None)
+        try:
+            with app.app_context():
+                self.release(image_path)
+        except Exception as e:
+            logger.warning(f"重新检查图片引用失败 {image_path}: {e}")
+
+    @staticmethod
+    def _stem(image_path: str) -> str:
+        return os.path.splitext(os.path.basename(image_path))[0]
+
+    def _thumbnail_file(self, image_path: str, size: int) -> str:
+        return os.path.join(self.thumbnail_dir, f"{self._stem(image_path)}_{size}.webp")
+
+    def thumbnail_urls(self, image_path: str):
+        """返回 {宽度: 缩略图路径}，路径与 image_path 一样相对于站点根目录"""
+        if not image_path or not _HAS_PIL or not image_path.startswith(f"{UPLOAD_FOLDER}/"):
+            return None
+        stem = self._stem(image_path)
+        return {str(size): f"{UPLOAD_FOLDER}/{THUMBNAIL_FOLDER}/{stem}_{size}.webp" for size in self.sizes}
+
+    def schedule_thumbnails(self, image_path: str):
+        if _HAS_PIL and self.sizes:
+            self._executor.submit(self._generate_quietly, image_path)
+
+    def _generate_quietly(self, image_path):
+        try:
+            self.generate_thumbnails(image_path)
+        except Exception as e:
+            with self._lock:
+                self._stats['thumbnail_failures'] += 1
+            logger.warning(f"生成缩略图失败 {image_path}: {e}")
+
+    def generate_thumbnails(self, image_path: str, sizes=None):
+        """生成缺失的缩略图，原图小于目标宽度时不放大"""
+        sizes = [size for size in (sizes or self.sizes) if not os.path.exists(self._thumbnail_file(image_path, size))]
+        if not sizes:
+            return 0
+        os.makedirs(self.thumbnail_dir, exist_ok=True)
+        with Image.open(self.full_path(image_path)) as image:
+            image.seek(0)
+            if image.format == 'JPEG':
+                image.draft('RGB', (max(sizes), max(sizes)))
+            image = ImageOps.exif_transpose(image)
+            image = image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+            # 从大到小依次缩放，后一个尺寸在前一个结果上继续缩小
+            for size in sorted(sizes, reverse=True):
+                if image.width > size:
+                    image = image.resize((size, max(1, round(image.height * size / image.width))), Image.LANCZOS)
+                target = self._thumbnail_file(image_path, size)
+                temp_path = f"{target}.{uuid.uuid4().hex}.tmp"
+                image.save(temp_path, format='WEBP', quality=self.quality, method=4)
+                os.replace(temp_path, target)
+        with self._lock:
+            self._stats['thumbnails'] += len(sizes)
+        return len(sizes)
+
+    def ensure_thumbnail(self, filename: str):
+        """按缩略图文件名补生成缺失的缩略图，返回是否可用"""
+        match = _THUMBNAIL_NAME.match(filename)
+        if not match or not _HAS_PIL or int(match.group(2)) not in self.sizes:
+            return False
+        if os.path.exists(os.path.join(self.thumbnail_dir, filename)):
+            return True
+        from src.models.diary import DiaryEntry
+        stem = match.group(1)
+        entry = DiaryEntry.query.filter(DiaryEntry.image_path.like(f"{UPLOAD_FOLDER}/%{stem}.%")).first()
+        if entry is None or not os.path.exists(self.full_path(entry.image_path)):
+            return False
+        try:
+            self.generate_thumbnails(entry.image_path)
+        except Exception as e:
+            logger.warning(f"生成缩略图失败 {entry.image_path}: {e}")
+            return False
+        return os.path.exists(os.path.join(self.thumbnail_dir, filename))
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['rejected'] = dict(self._stats['rejected'])
+            stats['release_pending'] = len(self._deferred)
+        receive_seconds = stats.pop('receive_seconds')
+        stats['avg_mb_per_s'] = round(stats['received_bytes'] / receive_seconds / 1048576, 2) if receive_seconds else 0.0
+        stats['max_mb'] = self.max_bytes / 1048576
+        stats['sizes'] = self.sizes
+        stats['pillow'] = _HAS_PIL
+        return stats
+
+
+# 全局上传存储实例
+upload_storage = UploadStorage()
@@ -1,6 +1,19 @@
 // AI日记 - 现代React应用
 const { useState, useEffect, useRef } = React;
 
+// 时间线显示缩略图，浏览器按屏幕宽度选择合适的尺寸；点击查看原图
+const entryImageProps = (entry) => {
+  const thumbnails = entry.thumbnails || {};
+  const widths = Object.keys(thumbnails).sort((a, b) => a - b);
+  if (!widths.length) return { src: entry.image_path };
+  return {
+    src: thumbnails['640'] || thumbnails[widths[widths.length - 1]],
+    srcSet: widths.map(width => `${thumbnails[width]} ${width}w`).join(', '),
+    sizes: '(max-width: 768px) 100vw, 768px',
+    loading: 'lazy'
+  };
+};
+
 // 添加新图标组件
 const Edit = ({ className = '', ...props }) => (
   React.createElement('svg', { className, ...iconProps, ...props },
@@ -1398,7 +1411,7 @@ function App() {
                       key: 'image',
                       className: 'mb-4'
                     }, React.createElement('img', {
-                      src: entry.image_path,
+                      ...entryImageProps(entry),
                       alt: '日记图片',
                       className: 'max-w-full h-auto rounded-lg border border-gray-200 cursor-pointer',
                       onClick: () => window.open(entry.image_path, '_blank')
@@ -1639,7 +1652,7 @@ function App() {
                             key: 'image',
                             className: 'mb-4'
                           }, React.createElement('img', {
-                            src: entry.image_path,
+                            ...entryImageProps(entry),
                             alt: '日记图片',
                             className: 'max-w-full h-auto rounded-lg border border-gray-200 cursor-pointer',
                             onClick: () => window.open(entry.image_path, '_blank')
@@ -0,0 +1,21 @@
+from src.mcp.keywords import extract_keywords
+
+
+def test_single_character_function_words_do_not_split_compounds():
+    assert extract_keywords("今天坐地铁去开会，会议很长") == ['坐地铁', '开会', '会议']
+    assert extract_keywords("我对花粉过敏，说话很累") == ['花粉过敏', '说话']
+    keywords = extract_keywords("和好友在家吃火锅，能量满满")
+    assert '好友' in keywords and '能量满满' in keywords
+    assert any('火锅' in keyword for keyword in keywords)
+
+
+def test_function_words_are_removed_at_edges():
+    assert extract_keywords("我们去年去了日本") == ['去年', '日本']
+    assert extract_keywords("今天早上和朋友一起去了公园，天气很好") == ['朋友', '公园', '天气']
+    assert '睡不着' in extract_keywords("工作压力很大，有点焦虑，晚上睡不着")
+
+
+def test_stop_words_and_limit():
+    assert extract_keywords("今天，然后，我们，的") == []
+    assert extract_keywords("the weather is nice, went hiking with alice", limit=2) == ['weather', 'nice']
+    assert extract_keywords("") == []
@@ -0,0 +1,58 @@
+from types import SimpleNamespace
+from datetime import datetime
+from src.mcp.memory_consolidation import MemoryConsolidator
+
+
+def memory(memory_id, key, value, memory_type='preference', confidence=1.0):
+    return SimpleNamespace(id=memory_id, key=key, value=value, memory_type=memory_type, confidence=confidence,
+                           tags=[], updated_at=datetime(2026, 1, 1))
+
+
+def keys(clusters):
+    return sorted(sorted(m.key for m in cluster) for cluster in clusters)
+
+
+def test_template_joins_only_one_unrelated_memory():
+    memories = [
+        memory(1, '咖啡', '用户提到了关于咖啡的偏好', confidence=0.5),
+        memory(2, '拿铁', '喜欢喝燕麦拿铁咖啡'),
+        memory(3, '咖啡店', '常去公司楼下的独立咖啡店'),
+        memory(4, '睡眠', '喝咖啡后晚上睡不着'),
+    ]
+    clusters = MemoryConsolidator().find_clusters(memories)
+    # 关键词包含主题的记忆优先，模板只与它合并，其余记忆保持独立
+    assert keys(clusters) == [['咖啡', '咖啡店']]
+    assert MemoryConsolidator._survivor(clusters[0]).id == 3
+
+
+def test_template_prefers_exact_key_then_confidence():
+    memories = [
+        memory(1, '咖啡', '用户提到了关于咖啡的偏好', confidence=0.5),
+        memory(2, '饮品', '每天一杯咖啡', confidence=0.9),
+        memory(3, '早餐', '早上喝咖啡配面包', confidence=0.7),
+        memory(4, '咖啡', '不加糖的美式', confidence=0.6),
+    ]
+    assert keys(MemoryConsolidator().find_clusters(memories)) == [['咖啡', '咖啡']]
+
+    memories = [memory(1, '咖啡', '用户提到了关于咖啡的偏好', confidence=0.5),
+                memory(2, '饮品', '每天一杯咖啡', confidence=0.6),
+                memory(3, '早餐', '早上喝咖啡配面包', confidence=0.9)]
+    assert keys(MemoryConsolidator().find_clusters(memories)) == [['咖啡', '早餐']]
+
+
+def test_templates_with_same_topic_merge_together():
+    memories = [
+        memory(1, '火锅', '用户提到了关于火锅的偏好', confidence=0.5),
+        memory(2, '吃火锅', '用户提到了关于火锅的偏好', confidence=0.5),
+        memory(3, '运动', '周末去爬山'),
+    ]
+    assert keys(MemoryConsolidator().find_clusters(memories)) == [['吃火锅', '火锅']]
+
+
+def test_similar_memories_still_merge():
+    memories = [
+        memory(1, '咖啡', '喜欢喝咖啡'),
+        memory(2, '喝咖啡', '喜欢喝咖啡'),
+        memory(3, '运动', '周末去爬山'),
+    ]
+    assert keys(MemoryConsolidator().find_clusters(memories)) == [['咖啡', '喝咖啡']]
@@ -0,0 +1,64 @@
+import pytest
+from flask import Flask
+from src.models.user import db
+from src.models.diary import Auth  # noqa: F401  注册外键引用的表
+from src.models.mcp import UserMemory
+from src.mcp import memory_vectors as vectors_module
+from src.mcp.memory_vectors import MemoryVectorIndex
+
+pytestmark = pytest.mark.skipif(not vectors_module._HAS_NUMPY, reason="未安装 numpy")
+
+
+@pytest.fixture
+def index(tmp_path, monkeypatch):
+    monkeypatch.setenv('MEMORY_EMBEDDING_BACKEND', 'local')
+    monkeypatch.setenv('MEMORY_RECALL_MODE', 'hybrid')
+    monkeypatch.setenv('MEMORY_VECTOR_DIR', str(tmp_path / 'vectors'))
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'test.db'}"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        for i in range(5):
+            db.session.add(UserMemory(user_id=1, memory_type='fact', key=f'k{i}', value=f'喝咖啡{i}'))
+        db.session.commit()
+        yield MemoryVectorIndex()
+
+
+def write(index, action):
+    before = index.read_state(1)
+    result = action()
+    db.session.commit()
+    return result, (before, index.read_state(1))
+
+
+def add_running():
+    memory = UserMemory(user_id=1, memory_type='fact', key='跑步', value='每天跑步')
+    db.session.add(memory)
+    return memory
+
+
+def test_incremental_updates_keep_index_in_sync(index):
+    index.rank(1, '咖啡', 3)
+    assert index.syncs == 1
+
+    memory, states = write(index, add_running)
+    index.update_memories(1, [(memory.id, memory.key, memory.value)], states)
+    assert index.snapshot(1)[1] is None
+
+    _, states = write(index, lambda: UserMemory.query.filter_by(key='k0').delete())
+    index.remove_memories(1, [1], states)
+    assert index.snapshot(1)[1] is None
+
+    assert index.rank(1, '跑步', 1)[0][0] == memory.id
+    assert index.syncs == 1
+
+
+def test_changes_from_other_paths_still_resync(index):
+    index.rank(1, '咖啡', 3)
+    db.session.add(UserMemory(user_id=1, memory_type='fact', key='游泳', value='周末游泳'))
+    db.session.commit()
+    memory, states = write(index, add_running)
+    index.update_memories(1, [(memory.id, memory.key, memory.value)], states)
+    # 写入前索引已落后于数据库，不能直接记为一致
+    assert index.snapshot(1)[1] is not None
@@ -0,0 +1,194 @@
+import os
+import sys
+import time
+import signal
+import asyncio
+from functools import partialmethod
+import pytest
+from src.mcp.stdio_client import StdioMCPClient, MCPServerPool, MCPError
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FAKE_SERVER = os.path.join(ROOT, 'benchmarks', 'fake_mcp_server.py')
+
+
+def run(coroutine):
+    return asyncio.run(asyncio.wait_for(coroutine, 30))
+
+
+def text(result):
+    return result['content'][0]['text']
+
+
+def test_handshake_and_tools():
+    async def scenario():
+        client = StdioMCPClient('fake', sys.executable, [FAKE_SERVER])
+        await client.start()
+        try:
+            assert client.alive
+            assert client.server_info['name'] == 'fake-mcp-server'
+            assert [tool['name'] for tool in client.tools] == ['echo', 'sleep', 'fail', 'get_context']
+            assert await client.ping()
+        finally:
+            await client.close()
+        assert not client.alive
+
+    run(scenario())
+
+
+def test_concurrent_requests_share_one_process():
+    async def scenario():
+        client = StdioMCPClient('fake', sys.executable, [FAKE_SERVER])
+        await client.start()
+        try:
+            started = time.monotonic()
+            slow = asyncio.ensure_future(client.call_tool('sleep', {'seconds': 0.5}))
+            echoes = await asyncio.gather(*(client.call_tool('echo', {'text': str(i)}) for i in range(20)))
+            # 慢请求先发出，后发出的请求先返回，且按请求 ID 回到各自的调用方
+            assert not slow.done()
+            assert [text(result) for result in echoes] == [str(i) for i in range(20)]
+            sleeps = await asyncio.gather(slow, *(client.call_tool('sleep', {'seconds': 0.5}) for _ in range(5)))
+            assert all(text(result) == 'slept 0.5' for result in sleeps)
+            assert time.monotonic() - started < 2
+            assert client.in_flight == 0
+        finally:
+            await client.close()
+
+    run(scenario())
+
+
+def test_error_response_and_timeout_keep_client_usable():
+    async def scenario():
+        client = StdioMCPClient('fake', sys.executable, [FAKE_SERVER])
+        await client.start()
+        try:
+            with pytest.raises(MCPError) as error:
+                await client.call_tool('fail')
+            assert error.value.code == -32000
+
+            with pytest.raises(asyncio.TimeoutError):
+                await client.call_tool('sleep', {'seconds': 0.5}, timeout=0.1)
+            assert client.in_flight == 0
+            # 超时请求的响应稍后到达时被丢弃，不影响之后的请求
+            await asyncio.sleep(0.6)
+            assert client.alive
+            assert text(await client.call_tool('echo', {'text': 'ok'})) == 'ok'
+        finally:
+            await client.close()
+
+    run(scenario())
+
+
+def test_pending_requests_fail_when_process_exits():
+    async def scenario():
+        client = StdioMCPClient('fake', sys.executable, [FAKE_SERVER, '--crash-after', '1'])
+        await client.start()
+        try:
+            with pytest.raises(ConnectionError):
+                await client.call_tool('sleep', {'seconds': 5})
+            await client.process.wait()
+            assert not client.alive
+            with pytest.raises(ConnectionError):
+                await client.call_tool('echo', {'text': 'x'})
+        finally:
+            await client.close()
+
+    run(scenario())
+
+
+def test_pool_restarts_killed_process():
+    async def scenario():
+        pool = MCPServerPool('fake', sys.executable, [FAKE_SERVER])
+        await pool.start()
+        try:
+            old_pid = pool.clients[0].process.pid
+            pool.clients[0].process.kill()
+            await pool.clients[0].process.wait()
+            assert pool.status == 'failed'
+
+            # 没有存活的进程时，调用会先重启进程
+            assert text(await pool.call_tool('echo', {'text': 'again'})) == 'again'
+            assert pool.restarts == 1
+            assert pool.status == 'running'
+            assert pool.get_status()['pids'] != [old_pid]
+        finally:
+            await pool.close()
+
+    run(scenario())
+
+
+def test_pool_routes_around_dead_process_and_health_check_restarts_it():
+    async def scenario():
+        pool = MCPServerPool('fake', sys.executable, [FAKE_SERVER], size=2)
+        await pool.start()
+        try:
+            pool.clients[0].process.kill()
+            await pool.clients[0].process.wait()
+            assert pool.status == 'degraded'
+            assert text(await pool.call_tool('echo', {'text': 'x'})) == 'x'
+            assert pool.restarts == 0
+
+            await pool.ensure_healthy()
+            assert pool.status == 'running'
+            assert pool.restarts == 1
+            await pool.ensure_healthy()
+            assert pool.restarts == 1
+        finally:
+            await pool.close()
+
+    run(scenario())
+
+
+def test_pool_balances_by_in_flight_requests():
+    async def scenario():
+        pool = MCPServerPool('fake', sys.executable, [FAKE_SERVER], size=2)
+        await pool.start()
+        try:
+            calls = [asyncio.ensure_future(pool.call_tool('sleep', {'seconds': 0.3})) for _ in range(4)]
+            await asyncio.sleep(0.1)
+            assert [client.in_flight for client in pool.clients] == [2, 2]
+            await asyncio.gather(*calls)
+            assert pool.get_status()['calls'] == 4
+        finally:
+            await pool.close()
+
+    run(scenario())
+
+
+@pytest.mark.skipif(not hasattr(signal, 'SIGSTOP'), reason="需要 SIGSTOP")
+def test_health_check_restarts_unresponsive_process(monkeypatch):
+    monkeypatch.setattr(StdioMCPClient, 'ping', partialmethod(StdioMCPClient.ping, timeout=0.2))
+
+    async def scenario():
+        pool = MCPServerPool('fake', sys.executable, [FAKE_SERVER])
+        await pool.start()
+        try:
+            hung = pool.clients[0]
+            os.kill(hung.process.pid, signal.SIGSTOP)
+            assert hung.alive
+            await pool.ensure_healthy()
+            assert pool.restarts == 1
+            assert hung.process.returncode is not None
+            assert await pool.clients[0].ping()
+        finally:
+            await pool.close()
+
+    run(scenario())
+
+
+def test_failed_restart_backs_off():
+    async def scenario():
+        pool = MCPServerPool('broken', sys.executable, ['-c', 'import sys; sys.exit(1)'])
+        with pytest.raises(ConnectionError):
+            await pool.start()
+        await pool.ensure_healthy()
+        assert pool.restarts == 1
+        assert pool.status == 'failed'
+        # 退避时间内不再重启
+        await pool.ensure_healthy()
+        with pytest.raises(ConnectionError):
+            await pool.call_tool('echo')
+        assert pool.restarts == 1
+        assert pool.get_status()['last_error']
+        await pool.close()
+
+    run(scenario())